@@ -0,0 +1,171 @@
+"""
+Benchmark for report_utils.get_sensor_data against the database in BENCH_DB_URL.
+
+BENCH_DB_URL must point to a scratch Postgres database, never to the one in DB_URL:
+the app tables are created there if missing, and rows are inserted, analyzed and
+deleted. DB_URL still has to be set for the app modules to import, but the
+benchmark never connects to it.
+
+For each size, synthetic readings for a throw-away patient are inserted with
+generate_series, already interned into sm_sensor_channels and with timestamp_ms
+set, as the ingest path writes them. The query is timed (best of REPEAT runs) and
+checked to return every reading, then the rows are deleted again. The scaling
+exponent between consecutive sizes should stay close to 1 (linear); the former
+self-join grew with rows² per sensor type.
+
+Usage (from the repository root):
+    BENCH_DB_URL=postgresql://... python -m benchmarks.bench_get_sensor_data [sizes...]
+"""
+
+import asyncio
+import math
+import os
+import sys
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel, create_engine
+
+from database import DB_URL
+from report.report_utils import get_sensor_data
+
+BENCH_DB_URL = os.getenv("BENCH_DB_URL")
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+REPEAT = 3
+ENCOUNTERS = 4
+DEVICE = "Monitor Respiratorio"
+SENSOR_TYPES = ["Frecuencia Cardíaca", "Temperatura", "CO2", "Inercial"]
+START_MS = 1_700_000_000_000
+
+INSERT_CHANNELS = [
+    text("INSERT INTO sm_devices (name) VALUES (:device) ON CONFLICT (name) DO NOTHING"),
+    text(
+        """
+        INSERT INTO sm_sensor_types (name) SELECT unnest(CAST(:sensor_types AS text[]))
+        ON CONFLICT (name) DO NOTHING
+        """
+    ),
+    text(
+        """
+        INSERT INTO sm_sensor_channels (device_id, sensor_type_id, patient_id, encounter_id)
+        SELECT d.id, t.id, :patient_id, :patient_id || '_' || e
+        FROM sm_devices d, sm_sensor_types t, generate_series(0, :encounters - 1) AS e
+        WHERE d.name = :device AND t.name = ANY(CAST(:sensor_types AS text[]))
+        ON CONFLICT ON CONSTRAINT uq_sm_sensor_channels_key DO NOTHING
+        """
+    ),
+]
+
+INSERT_ROWS = text(
+    """
+    INSERT INTO sm_sensor_data (
+        device, sensor_type, value, timestamp_epoch, timestamp_millis, timestamp_ms,
+        patient_id, encounter_id, channel_id
+    )
+    SELECT
+        :device, r.sensor_type, random() * 100, r.ms / 1000, r.ms % 1000, r.ms,
+        :patient_id, r.encounter_id, c.id
+    FROM (
+        SELECT
+            (CAST(:sensor_types AS text[]))[1 + i % :n_sensor_types] AS sensor_type,
+            :patient_id || '_' || (CAST(i AS bigint) * :encounters / :rows) AS encounter_id,
+            :start_ms + CAST(i AS bigint) * 100 AS ms
+        FROM generate_series(0, :rows - 1) AS i
+    ) r
+    JOIN sm_devices d ON d.name = :device
+    JOIN sm_sensor_types t ON t.name = r.sensor_type
+    JOIN sm_sensor_channels c ON c.device_id = d.id
+        AND c.sensor_type_id = t.id
+        AND c.patient_id = :patient_id
+        AND c.encounter_id = r.encounter_id
+    """
+)
+
+DELETE_ROWS = [
+    text("DELETE FROM sm_sensor_data WHERE patient_id = :patient_id"),
+    text("DELETE FROM sm_sensor_channels WHERE patient_id = :patient_id"),
+]
+
+
+def insert_rows(engine, patient_id, rows):
+    params = {
+        "device": DEVICE,
+        "sensor_types": SENSOR_TYPES,
+        "n_sensor_types": len(SENSOR_TYPES),
+        "patient_id": patient_id,
+        "encounters": ENCOUNTERS,
+        "rows": rows,
+        "start_ms": START_MS,
+    }
+    with engine.begin() as connection:
+        for statement in INSERT_CHANNELS:
+            connection.execute(statement, params)
+        inserted = connection.execute(INSERT_ROWS, params).rowcount
+        if inserted != rows:
+            raise RuntimeError(f"Inserted {inserted} readings, expected {rows}")
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE sm_sensor_data"))
+        connection.execute(text("ANALYZE sm_sensor_channels"))
+
+
+def delete_rows(engine, patient_id):
+    with engine.begin() as connection:
+        for statement in DELETE_ROWS:
+            connection.execute(statement, {"patient_id": patient_id})
+
+
+def check_result(result, rows):
+    """Checks that the query returned every reading, in every group's lists too."""
+    groups = [data for sensors in result.values() for data in sensors.values()]
+    counted = sum(data["count"] for data in groups)
+    listed = sum(len(data["values"]) for data in groups)
+    if len(groups) != ENCOUNTERS * len(SENSOR_TYPES) or counted != rows or listed != rows:
+        raise RuntimeError(
+            f"get_sensor_data returned {len(groups)} groups, {counted} counted and "
+            f"{listed} listed readings, expected {rows}"
+        )
+
+
+def time_query(SessionLocal, patient_id, rows):
+    best = math.inf
+    for _ in range(REPEAT):
+        with SessionLocal() as db:
+            start = time.perf_counter()
+            result = asyncio.run(get_sensor_data(patient_id, db))
+            best = min(best, time.perf_counter() - start)
+        check_result(result, rows)
+    return best
+
+
+def main(sizes):
+    if not BENCH_DB_URL:
+        sys.exit("Set BENCH_DB_URL to a scratch Postgres database")
+    if BENCH_DB_URL == DB_URL:
+        sys.exit("BENCH_DB_URL must not be the application database (DB_URL)")
+
+    engine = create_engine(BENCH_DB_URL)
+    SQLModel.metadata.create_all(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    print(f"{'rows':>10} {'seconds':>10} {'us/row':>10} {'exponent':>10}")
+    previous = None
+    for rows in sizes:
+        patient_id = f"bench_get_sensor_data_{rows}"
+        delete_rows(engine, patient_id)
+        insert_rows(engine, patient_id, rows)
+        try:
+            seconds = time_query(SessionLocal, patient_id, rows)
+        finally:
+            delete_rows(engine, patient_id)
+
+        exponent = ""
+        if previous:
+            exponent = f"{math.log(seconds / previous[1]) / math.log(rows / previous[0]):.2f}"
+        print(f"{rows:>10} {seconds:>10.3f} {seconds / rows * 1e6:>10.2f} {exponent:>10}")
+        previous = (rows, seconds)
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or SIZES)
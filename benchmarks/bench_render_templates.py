@@ -0,0 +1,86 @@
+"""
+Benchmark for the HTML rendering of an observation report.
+
+Renders observation_report for synthetic observations (best of REPEAT runs) with
+the shared template environment of report_utils and with the former approach of
+building a new Environment on every render_template call, which re-read and
+recompiled the template each time. No database or FHIR server is needed.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_render_templates [observations]
+"""
+
+import sys
+import time
+
+from jinja2 import Environment, FileSystemLoader
+
+import report.report_generators.observation_report as observation_module
+from report.report_utils import TEMPLATES_DIR, load_templates, render_template
+
+OBSERVATIONS = 200
+REPEAT = 5
+
+
+def render_template_uncached(template_file, context):
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR))
+    template = env.get_template(template_file)
+    return template.render(context)
+
+
+def make_observations(count):
+    return [
+        {
+            "id": f"obs-{i}",
+            "meta": {"lastUpdated": "2024-05-01T10:00:00Z"},
+            "issued": "2024-05-01T09:30:00Z",
+            "code": {
+                "coding": [
+                    {
+                        "system": "http://loinc.org",
+                        "code": "8867-4",
+                        "display": f"Observación {i}",
+                    }
+                ]
+            },
+            "performer": [{"display": "Dr. Ejemplo"}],
+            "valueString": f"Valor {i}",
+            "note": [{"text": "Sin novedades"}],
+        }
+        for i in range(count)
+    ]
+
+
+def time_report(observations, render_function):
+    observation_module.render_template = render_function
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        html = observation_module.observation_report(observations)
+        best = min(best, time.perf_counter() - start)
+    return best, html
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else OBSERVATIONS
+    observations = make_observations(count)
+
+    start = time.perf_counter()
+    load_templates()
+    print(f"load_templates: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    try:
+        uncached, uncached_html = time_report(observations, render_template_uncached)
+        cached, cached_html = time_report(observations, render_template)
+    finally:
+        observation_module.render_template = render_template
+
+    assert cached_html == uncached_html
+    print(f"{count} observations, best of {REPEAT}:")
+    print(f"  new Environment per call: {uncached * 1000:9.1f} ms")
+    print(f"  shared environment:       {cached * 1000:9.1f} ms")
+    print(f"  speedup:                  {uncached / cached:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
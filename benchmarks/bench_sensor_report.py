@@ -0,0 +1,77 @@
+"""
+Benchmark for the sensor report against the size of the raw series.
+
+Builds synthetic readings of one sensor type over ENCOUNTERS encounters, groups
+them with group_sensor_columns like get_sensor_data does, and times sensor_report
+(HTML and charts, best of REPEAT runs) with the series reduced to
+SENSOR_PLOT_MAX_POINTS points and with every reading plotted. Charts are rendered
+inline so the chart pool startup is not measured. No database is needed.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_sensor_report [sizes...]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+import report.charts as charts
+import report.report_generators.sensor_report as sensor_module
+from report.report_utils import load_templates
+from report.sensor_columns import group_sensor_columns
+
+SIZES = [10_000, 100_000, 1_000_000, 3_000_000]
+REPEAT = 3
+ENCOUNTERS = 4
+START_MS = 1_700_000_000_000
+
+
+def make_sensor_data(rows):
+    rng = np.random.default_rng(0)
+    columns = {
+        "encounter": (np.arange(rows) * ENCOUNTERS // rows).astype(np.int32),
+        "sensor_type": np.zeros(rows, dtype=np.int32),
+        "value": 70 + 10 * np.sin(np.arange(rows) / 500) + rng.normal(size=rows),
+        # 10 readings per second
+        "timestamp": START_MS + np.arange(rows, dtype=np.int64) * 100,
+        "encounters": [f"encounter-{i}" for i in range(ENCOUNTERS)],
+        "sensor_types": ["Frecuencia Cardíaca"],
+        "extra": {},
+    }
+    return group_sensor_columns(columns)
+
+
+def time_report(data, max_points):
+    sensor_module.SENSOR_PLOT_MAX_POINTS = max_points
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        sensor_module.sensor_report(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+    max_points = sensor_module.SENSOR_PLOT_MAX_POINTS
+    charts.CHART_RENDER_WORKERS = 1
+    load_templates()
+
+    print(f"best of {REPEAT}, reduced to {max_points} points per series")
+    print(f"{'readings':>10} {'every reading':>15} {'reduced':>10} {'speedup':>9}")
+    try:
+        for size in sizes:
+            data = make_sensor_data(size)
+            raw = time_report(data, 0)
+            reduced = time_report(data, max_points)
+            print(
+                f"{size:>10} {raw * 1000:>12.1f} ms {reduced * 1000:>7.1f} ms"
+                f" {raw / reduced:>8.1f}x"
+            )
+    finally:
+        sensor_module.SENSOR_PLOT_MAX_POINTS = max_points
+
+
+if __name__ == "__main__":
+    main()
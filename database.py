@@ -1,6 +1,9 @@
 from datetime import datetime
 import random
+import time
 from sqlmodel import SQLModel, create_engine
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
@@ -12,6 +15,31 @@ DB_URL = os.getenv("DB_URL")
 # DB_FILE = "sqlite:///database.db"
 engine = create_engine(DB_URL, echo=True)
 
+# Read replica used by report/analytics endpoints. If it is not configured, or if
+# it lags behind the primary more than DB_REPLICA_MAX_LAG_SECONDS, reads go to the
+# primary engine instead.
+DB_REPLICA_URL = os.getenv("DB_REPLICA_URL")
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "30"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+replica_engine = (
+    create_engine(DB_REPLICA_URL, echo=True, pool_pre_ping=True)
+    if DB_REPLICA_URL
+    else None
+)
+
+# 0 when the replica has replayed everything it received, NULL when the server is
+# not in recovery (e.g. a second standalone instance used for local testing).
+REPLICA_LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+    """
+)
+
+_replica_status = {"checked_at": 0.0, "healthy": False}
+
 
 def create_database():
     SQLModel.metadata.create_all(engine)
@@ -26,6 +54,56 @@ def get_session():
         session.close()
 
 
+def replica_is_usable():
+    """
+    Checks whether the read replica can serve queries within the staleness bound.
+
+    The result is cached for DB_REPLICA_CHECK_INTERVAL seconds so the lag query is
+    not executed on every request.
+
+    Returns:
+        bool: True if reads can be routed to the replica.
+    """
+    if replica_engine is None:
+        return False
+
+    now = time.monotonic()
+    if now - _replica_status["checked_at"] < DB_REPLICA_CHECK_INTERVAL:
+        return _replica_status["healthy"]
+
+    try:
+        with replica_engine.connect() as connection:
+            lag = connection.execute(REPLICA_LAG_QUERY).scalar()
+        healthy = lag is None or float(lag) <= DB_REPLICA_MAX_LAG_SECONDS
+        if not healthy:
+            print(f"Read replica lag {lag}s exceeds bound, using primary")
+    except SQLAlchemyError as e:
+        print(f"Read replica unavailable, using primary: {e}")
+        healthy = False
+
+    _replica_status["checked_at"] = now
+    _replica_status["healthy"] = healthy
+    return healthy
+
+
+def open_read_session():
+    """
+    Opens a session for read-only report queries, bound to the read replica when
+    it is usable and to the primary otherwise. The caller must close it.
+    """
+    bind = replica_engine if replica_is_usable() else engine
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=bind)
+    return SessionLocal()
+
+
+def get_read_session():
+    session = open_read_session()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
 def create_admin_user(
     rut, name, password, email, phone_number, fhir_id=None, secondary_roles=None
 ):
@@ -2,18 +2,19 @@ from datetime import datetime
 from typing import Annotated, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
 from sqlmodel import Session, select
-from database import get_session
+from database import get_read_session, get_session
 from models import GameData, GameDataResponse
 
 router = APIRouter(prefix="/GameData", tags=["GameData"])
 
 db_dependency = Annotated[Session, Depends(get_session)]
+read_db_dependency = Annotated[Session, Depends(get_read_session)]
 
 
 @router.get(
     "/all", response_model=List[GameDataResponse], description="Get all game data"
 )
-async def get_all_game_data(db: db_dependency):
+async def get_all_game_data(db: read_db_dependency):
     """
     Obtiene todos los registros de GameData.
     """
@@ -26,7 +27,7 @@ async def get_all_game_data(db: db_dependency):
     "/filter", response_model=List[GameDataResponse], description="Filter game data"
 )
 async def filter_game_data(
-    db: db_dependency,
+    db: read_db_dependency,
     userID: Optional[str] = Query(None, description="Filter by userID"),
     encounter_id: Optional[str] = Query(None, description="Filter by encounter_id"),
     start_timestamp: Optional[int] = Query(
@@ -63,7 +64,7 @@ async def filter_game_data(
 
 
 @router.get("/{id}", response_model=GameDataResponse, description="Get game data by ID")
-async def get_game_data_by_id(id: int, db: db_dependency):
+async def get_game_data_by_id(id: int, db: read_db_dependency):
     """
     Obtiene un registro específico de GameData por su ID.
     """
@@ -0,0 +1,44 @@
+import hashlib
+
+from fastapi import Request, Response
+
+
+def make_etag(request: Request, watermark, *extra) -> str:
+    """
+    Builds a strong ETag for a GET response from the request URL and a watermark
+    that changes whenever the underlying data changes.
+
+    Args:
+        request (Request): The request; its path and query parameters are part of
+            the tag, so different queries never share one.
+        watermark: Value that changes with the data (e.g. `get_sensor_watermark`).
+        *extra: Other inputs the response depends on, such as a time window.
+
+    Returns:
+        str: The quoted ETag.
+    """
+    material = repr(
+        (
+            request.url.path,
+            sorted(request.query_params.multi_items()),
+            watermark,
+            extra,
+        )
+    )
+    return '"' + hashlib.sha256(material.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Checks the If-None-Match header of the request against `etag`."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
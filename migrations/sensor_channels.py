@@ -0,0 +1,250 @@
+"""
+Online migration that dictionary-encodes sm_sensor_data into sm_sensor_channels.
+
+Steps, each safe to re-run and to run while the server keeps ingesting:
+    1. Create the sm_devices, sm_sensor_types and sm_sensor_channels lookup tables
+       and add the nullable sm_sensor_data.channel_id and
+       sm_sensor_channels.updated_ms columns (no table rewrite).
+    2. Seed the lookup tables from the distinct values already stored.
+    3. Install a trigger that interns the channel of rows inserted without one, so
+       servers that still only write the text columns keep it populated. Those
+       servers do not call mark_channels_updated either, so the trigger also bumps
+       the channel's updated_ms, once per transaction, and the bump commits with
+       the readings; conditional GETs stay correct while they are upgraded. The
+       channel row then stays locked until that transaction commits.
+    4. Backfill channel_id of existing rows in id batches, one short transaction
+       per batch.
+    5. Build the (channel_id, timestamp_ms) index with CREATE INDEX CONCURRENTLY and
+       add the foreign key as NOT VALID, validating it afterwards.
+
+The text columns are still written and left in place; they can be dropped once
+every server reads through the channel tables.
+
+Run it after migrations.sensor_timestamp_ms and before deploying the version whose
+report queries join sm_sensor_channels:
+    python -m migrations.sensor_channels [--batch-size N] [--pause SECONDS]
+"""
+
+import argparse
+import time
+
+from sqlalchemy import text
+from sqlmodel import SQLModel
+
+from database import engine
+from models import Device, SensorChannel, SensorTypeEntry
+
+ADD_COLUMN = text(
+    "ALTER TABLE sm_sensor_data ADD COLUMN IF NOT EXISTS channel_id INTEGER"
+)
+
+ADD_UPDATED_COLUMN = text(
+    "ALTER TABLE sm_sensor_channels ADD COLUMN IF NOT EXISTS updated_ms BIGINT"
+)
+
+SEED_DEVICES = text(
+    """
+    INSERT INTO sm_devices (name)
+    SELECT DISTINCT device FROM sm_sensor_data
+    ON CONFLICT (name) DO NOTHING
+    """
+)
+
+SEED_SENSOR_TYPES = text(
+    """
+    INSERT INTO sm_sensor_types (name)
+    SELECT DISTINCT sensor_type FROM sm_sensor_data
+    ON CONFLICT (name) DO NOTHING
+    """
+)
+
+SEED_CHANNELS = text(
+    """
+    INSERT INTO sm_sensor_channels (device_id, sensor_type_id, patient_id, encounter_id)
+    SELECT DISTINCT d.id, t.id, s.patient_id, s.encounter_id
+    FROM sm_sensor_data s
+    JOIN sm_devices d ON d.name = s.device
+    JOIN sm_sensor_types t ON t.name = s.sensor_type
+    ON CONFLICT ON CONSTRAINT uq_sm_sensor_channels_key DO NOTHING
+    """
+)
+
+CREATE_TRIGGER_FUNCTION = text(
+    """
+    CREATE OR REPLACE FUNCTION sm_sensor_data_fill_channel_id() RETURNS trigger AS $$
+    DECLARE
+        v_device_id smallint;
+        v_sensor_type_id smallint;
+        v_now_ms bigint := (extract(epoch FROM clock_timestamp()) * 1000)::bigint;
+    BEGIN
+        IF NEW.channel_id IS NOT NULL THEN
+            RETURN NEW;
+        END IF;
+
+        INSERT INTO sm_devices (name) VALUES (NEW.device)
+        ON CONFLICT (name) DO NOTHING;
+        SELECT id INTO v_device_id FROM sm_devices WHERE name = NEW.device;
+
+        INSERT INTO sm_sensor_types (name) VALUES (NEW.sensor_type)
+        ON CONFLICT (name) DO NOTHING;
+        SELECT id INTO v_sensor_type_id FROM sm_sensor_types WHERE name = NEW.sensor_type;
+
+        INSERT INTO sm_sensor_channels (
+            device_id, sensor_type_id, patient_id, encounter_id, updated_ms
+        )
+        VALUES (
+            v_device_id, v_sensor_type_id, NEW.patient_id, NEW.encounter_id,
+            v_now_ms
+        )
+        ON CONFLICT ON CONSTRAINT uq_sm_sensor_channels_key DO NOTHING;
+        SELECT id INTO NEW.channel_id FROM sm_sensor_channels
+        WHERE device_id = v_device_id
+            AND sensor_type_id = v_sensor_type_id
+            AND patient_id = NEW.patient_id
+            AND encounter_id = NEW.encounter_id;
+
+        -- Watermark of get_sensor_watermark, like mark_channels_updated. A channel
+        -- row last written by this transaction (xmin) was already bumped.
+        UPDATE sm_sensor_channels
+        SET updated_ms = GREATEST(COALESCE(updated_ms, 0) + 1, v_now_ms)
+        WHERE id = NEW.channel_id AND xmin <> pg_current_xact_id()::xid;
+
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+
+DROP_TRIGGER = text(
+    "DROP TRIGGER IF EXISTS sm_sensor_data_fill_channel_id ON sm_sensor_data"
+)
+
+CREATE_TRIGGER = text(
+    """
+    CREATE TRIGGER sm_sensor_data_fill_channel_id
+    BEFORE INSERT ON sm_sensor_data
+    FOR EACH ROW EXECUTE FUNCTION sm_sensor_data_fill_channel_id()
+    """
+)
+
+ID_RANGE = text("SELECT min(id), max(id) FROM sm_sensor_data")
+
+BACKFILL_BATCH = text(
+    """
+    UPDATE sm_sensor_data s
+    SET channel_id = c.id
+    FROM sm_sensor_channels c
+    JOIN sm_devices d ON d.id = c.device_id
+    JOIN sm_sensor_types t ON t.id = c.sensor_type_id
+    WHERE s.id >= :start_id AND s.id < :end_id AND s.channel_id IS NULL
+        AND d.name = s.device
+        AND t.name = s.sensor_type
+        AND c.patient_id = s.patient_id
+        AND c.encounter_id = s.encounter_id
+    """
+)
+
+CREATE_INDEX = text(
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sm_sensor_data_channel_id_timestamp_ms
+    ON sm_sensor_data (channel_id, timestamp_ms)
+    """
+)
+
+CONSTRAINT_EXISTS = text(
+    "SELECT 1 FROM pg_constraint WHERE conname = 'sm_sensor_data_channel_id_fkey'"
+)
+
+ADD_FOREIGN_KEY = text(
+    """
+    ALTER TABLE sm_sensor_data ADD CONSTRAINT sm_sensor_data_channel_id_fkey
+    FOREIGN KEY (channel_id) REFERENCES sm_sensor_channels (id) NOT VALID
+    """
+)
+
+VALIDATE_FOREIGN_KEY = text(
+    "ALTER TABLE sm_sensor_data VALIDATE CONSTRAINT sm_sensor_data_channel_id_fkey"
+)
+
+COUNT_MISSING = text("SELECT count(*) FROM sm_sensor_data WHERE channel_id IS NULL")
+
+
+def create_tables_and_column():
+    SQLModel.metadata.create_all(
+        engine,
+        tables=[Device.__table__, SensorTypeEntry.__table__, SensorChannel.__table__],
+    )
+    with engine.begin() as connection:
+        connection.execute(ADD_COLUMN)
+        connection.execute(ADD_UPDATED_COLUMN)
+
+
+def seed_and_install_trigger():
+    with engine.begin() as connection:
+        connection.execute(SEED_DEVICES)
+        connection.execute(SEED_SENSOR_TYPES)
+        connection.execute(SEED_CHANNELS)
+        connection.execute(CREATE_TRIGGER_FUNCTION)
+        connection.execute(DROP_TRIGGER)
+        connection.execute(CREATE_TRIGGER)
+
+
+def backfill(batch_size, pause):
+    """
+    Fills channel_id for existing rows in id ranges of `batch_size`, committing
+    after each range so no lock is held for long.
+    """
+    with engine.connect() as connection:
+        min_id, max_id = connection.execute(ID_RANGE).one()
+
+    if min_id is None:
+        return
+
+    updated = 0
+    for start_id in range(min_id, max_id + 1, batch_size):
+        with engine.begin() as connection:
+            result = connection.execute(
+                BACKFILL_BATCH,
+                {"start_id": start_id, "end_id": start_id + batch_size},
+            )
+        updated += result.rowcount
+        print(f"Backfilled ids < {start_id + batch_size} ({updated} rows updated)")
+        if pause:
+            time.sleep(pause)
+
+
+def create_index_and_foreign_key():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as connection:
+        connection.execute(CREATE_INDEX)
+        if connection.execute(CONSTRAINT_EXISTS).scalar() is None:
+            connection.execute(ADD_FOREIGN_KEY)
+        # Validation scans the table but does not block reads or inserts
+        connection.execute(VALIDATE_FOREIGN_KEY)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument(
+        "--pause", type=float, default=0.0, help="Seconds to sleep between batches"
+    )
+    args = parser.parse_args()
+
+    engine.echo = False
+    create_tables_and_column()
+    seed_and_install_trigger()
+    print("Channel tables, column channel_id and dual-write trigger installed")
+    backfill(args.batch_size, args.pause)
+    create_index_and_foreign_key()
+    print("Index ix_sm_sensor_data_channel_id_timestamp_ms and foreign key ready")
+
+    with engine.connect() as connection:
+        missing = connection.execute(COUNT_MISSING).scalar()
+    print(f"Rows without channel_id: {missing}")
+
+
+if __name__ == "__main__":
+    main()
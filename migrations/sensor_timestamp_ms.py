@@ -0,0 +1,132 @@
+"""
+Online migration that adds sm_sensor_data.timestamp_ms (BIGINT epoch milliseconds).
+
+Steps, each safe to re-run and to run while the server keeps ingesting:
+    1. Add the nullable column (no table rewrite).
+    2. Install a trigger that fills it on INSERT/UPDATE, so servers that still only
+       write timestamp_epoch/timestamp_millis keep it populated (dual-write).
+    3. Backfill existing rows in id batches, one short transaction per batch.
+    4. Build the (patient_id, timestamp_ms) index with CREATE INDEX CONCURRENTLY.
+
+Run it before deploying the version whose report queries read timestamp_ms:
+    python -m migrations.sensor_timestamp_ms [--batch-size N] [--pause SECONDS]
+"""
+
+import argparse
+import time
+
+from sqlalchemy import text
+
+from database import engine
+
+ADD_COLUMN = text(
+    "ALTER TABLE sm_sensor_data ADD COLUMN IF NOT EXISTS timestamp_ms BIGINT"
+)
+
+CREATE_TRIGGER_FUNCTION = text(
+    """
+    CREATE OR REPLACE FUNCTION sm_sensor_data_fill_timestamp_ms() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.timestamp_ms IS NULL THEN
+            NEW.timestamp_ms := NEW.timestamp_epoch::bigint * 1000 + NEW.timestamp_millis;
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+
+DROP_TRIGGER = text(
+    "DROP TRIGGER IF EXISTS sm_sensor_data_fill_timestamp_ms ON sm_sensor_data"
+)
+
+CREATE_TRIGGER = text(
+    """
+    CREATE TRIGGER sm_sensor_data_fill_timestamp_ms
+    BEFORE INSERT OR UPDATE ON sm_sensor_data
+    FOR EACH ROW EXECUTE FUNCTION sm_sensor_data_fill_timestamp_ms()
+    """
+)
+
+ID_RANGE = text("SELECT min(id), max(id) FROM sm_sensor_data")
+
+BACKFILL_BATCH = text(
+    """
+    UPDATE sm_sensor_data
+    SET timestamp_ms = timestamp_epoch::bigint * 1000 + timestamp_millis
+    WHERE id >= :start_id AND id < :end_id AND timestamp_ms IS NULL
+    """
+)
+
+CREATE_INDEX = text(
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sm_sensor_data_patient_id_timestamp_ms
+    ON sm_sensor_data (patient_id, timestamp_ms)
+    """
+)
+
+COUNT_MISSING = text("SELECT count(*) FROM sm_sensor_data WHERE timestamp_ms IS NULL")
+
+
+def add_column_and_trigger():
+    with engine.begin() as connection:
+        connection.execute(ADD_COLUMN)
+        connection.execute(CREATE_TRIGGER_FUNCTION)
+        connection.execute(DROP_TRIGGER)
+        connection.execute(CREATE_TRIGGER)
+
+
+def backfill(batch_size, pause):
+    """
+    Fills timestamp_ms for existing rows in id ranges of `batch_size`, committing
+    after each range so no lock is held for long.
+    """
+    with engine.connect() as connection:
+        min_id, max_id = connection.execute(ID_RANGE).one()
+
+    if min_id is None:
+        return
+
+    updated = 0
+    for start_id in range(min_id, max_id + 1, batch_size):
+        with engine.begin() as connection:
+            result = connection.execute(
+                BACKFILL_BATCH,
+                {"start_id": start_id, "end_id": start_id + batch_size},
+            )
+        updated += result.rowcount
+        print(f"Backfilled ids < {start_id + batch_size} ({updated} rows updated)")
+        if pause:
+            time.sleep(pause)
+
+
+def create_index():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as connection:
+        connection.execute(CREATE_INDEX)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument(
+        "--pause", type=float, default=0.0, help="Seconds to sleep between batches"
+    )
+    args = parser.parse_args()
+
+    engine.echo = False
+    add_column_and_trigger()
+    print("Column timestamp_ms and dual-write trigger installed")
+    backfill(args.batch_size, args.pause)
+    create_index()
+    print("Index ix_sm_sensor_data_patient_id_timestamp_ms ready")
+
+    with engine.connect() as connection:
+        missing = connection.execute(COUNT_MISSING).scalar()
+    print(f"Rows without timestamp_ms: {missing}")
+
+
+if __name__ == "__main__":
+    main()
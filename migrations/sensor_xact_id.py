@@ -0,0 +1,64 @@
+"""
+Online migration that adds sm_sensor_data.xact_id, the id of the transaction that
+inserted each reading, used by the polling cursors (see sensor_cursor.py).
+
+Steps, each safe to re-run and to run while the server keeps ingesting:
+    1. Add the nullable column and then its default, pg_current_xact_id(). A
+       volatile default given in ADD COLUMN would rewrite the table; set afterwards
+       it only applies to new rows.
+    2. Build the (xact_id, id) index with CREATE INDEX CONCURRENTLY.
+
+Existing rows keep a NULL xact_id and are never returned by a cursor: every cursor
+of this version is issued after they were committed. Cursors of the previous
+version are rejected with 400, so clients start again from a full response.
+
+Requires PostgreSQL 13 or later. Run it before deploying the version whose cursors
+read xact_id:
+    python -m migrations.sensor_xact_id
+"""
+
+from sqlalchemy import text
+
+from database import engine
+
+ADD_COLUMN = text("ALTER TABLE sm_sensor_data ADD COLUMN IF NOT EXISTS xact_id BIGINT")
+
+SET_DEFAULT = text(
+    """
+    ALTER TABLE sm_sensor_data
+    ALTER COLUMN xact_id SET DEFAULT (pg_current_xact_id()::text::bigint)
+    """
+)
+
+CREATE_INDEX = text(
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sm_sensor_data_xact_id_id
+    ON sm_sensor_data (xact_id, id)
+    """
+)
+
+
+def add_column():
+    with engine.begin() as connection:
+        connection.execute(ADD_COLUMN)
+        connection.execute(SET_DEFAULT)
+
+
+def create_index():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as connection:
+        connection.execute(CREATE_INDEX)
+
+
+def main():
+    engine.echo = False
+    add_column()
+    print("Column xact_id and its default installed")
+    create_index()
+    print("Index ix_sm_sensor_data_xact_id_id ready")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,18 @@
 from enum import Enum
 from pydantic import BaseModel
 from sqlmodel import SQLModel, Field
-from sqlalchemy import BigInteger, Text
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    SmallInteger,
+    Text,
+    UniqueConstraint,
+    event,
+    text,
+)
 from typing import Optional, List
 from datetime import datetime
 from hashlib import sha256
@@ -39,22 +50,87 @@ class SensorType(str, Enum):
     Dummy = "Dummy"
 
 
+class Device(SQLModel, table=True):
+    __tablename__ = "sm_devices"
+    id: Optional[int] = Field(
+        default=None, sa_column=Column(SmallInteger, primary_key=True)
+    )
+    name: str = Field(unique=True)
+
+
+class SensorTypeEntry(SQLModel, table=True):
+    __tablename__ = "sm_sensor_types"
+    id: Optional[int] = Field(
+        default=None, sa_column=Column(SmallInteger, primary_key=True)
+    )
+    name: str = Field(unique=True)
+
+
+class SensorChannel(SQLModel, table=True):
+    """A stream of readings: one device and sensor type for a patient's encounter."""
+
+    __tablename__ = "sm_sensor_channels"
+    __table_args__ = (
+        UniqueConstraint(
+            "device_id",
+            "sensor_type_id",
+            "patient_id",
+            "encounter_id",
+            name="uq_sm_sensor_channels_key",
+        ),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    device_id: int = Field(
+        sa_column=Column(SmallInteger, ForeignKey("sm_devices.id"), nullable=False)
+    )
+    sensor_type_id: int = Field(
+        sa_column=Column(SmallInteger, ForeignKey("sm_sensor_types.id"), nullable=False)
+    )
+    patient_id: str = Field(index=True)
+    encounter_id: str = Field(index=True)
+    # Epoch milliseconds of the last ingest or downsampling of the channel's
+    # readings, used as a cheap watermark for conditional GETs
+    updated_ms: Optional[int] = Field(default=None, sa_column=Column(BigInteger))
+
+
 class SensorData(SQLModel, table=True):
     __tablename__ = "sm_sensor_data"
+    __table_args__ = (
+        Index("ix_sm_sensor_data_patient_id_timestamp_ms", "patient_id", "timestamp_ms"),
+        Index("ix_sm_sensor_data_channel_id_timestamp_ms", "channel_id", "timestamp_ms"),
+        Index("ix_sm_sensor_data_xact_id_id", "xact_id", "id"),
+    )
     id: int = Field(default=None, primary_key=True)
     device: str
     sensor_type: str
     value: float
     timestamp_epoch: int = Field(sa_column=BigInteger)
     timestamp_millis: int
+    # Epoch milliseconds, the column used by report queries. timestamp_epoch and
+    # timestamp_millis are still written (dual-write) while clients migrate.
+    timestamp_ms: Optional[int] = Field(default=None, sa_column=Column(BigInteger))
     patient_id: str = Field(index=True)
     encounter_id: str = Field(index=True)
+    # Dictionary-encoded device, sensor_type, patient_id and encounter_id, the
+    # columns used by report queries. Filled by sensor_channels.intern_channel.
+    channel_id: Optional[int] = Field(default=None, foreign_key="sm_sensor_channels.id")
+    # Id of the transaction that inserted the reading, set by the database. Unlike
+    # the id, it orders readings by commit visibility (see sensor_cursor.py).
+    xact_id: Optional[int] = Field(
+        default=None,
+        sa_column=Column(
+            BigInteger, server_default=text("(pg_current_xact_id()::text::bigint)")
+        ),
+    )
+
+    def get_timestamp_ms(self) -> int:
+        if self.timestamp_ms is not None:
+            return self.timestamp_ms
+        return self.timestamp_epoch * 1000 + self.timestamp_millis
 
     @property
     def datetime(self):
-        return datetime.fromtimestamp(
-            self.timestamp_epoch + self.timestamp_millis / 1000.0
-        )
+        return datetime.fromtimestamp(self.get_timestamp_ms() / 1000.0)
 
     def __repr__(self):
         return f"SensorData(Id={self.id}, Device={self.device}, SensorType={self.sensor_type}, Value={self.value}, TimeEpoch={self.timestamp_epoch}, TimeMiliSec={self.timestamp_millis}, DateTime={self.datetime.isoformat()}, PatientId={self.patient_id}, EncounterId={self.encounter_id})"
@@ -70,12 +146,41 @@ class SensorData(SQLModel, table=True):
             "value": self.value,
             "timestamp_epoch": self.timestamp_epoch,
             "timestamp_millis": self.timestamp_millis,
+            "timestamp_ms": self.get_timestamp_ms(),
             "datetime": self.datetime.isoformat(),
             "patient_id": self.patient_id,
             "encounter_id": self.encounter_id,
         }
 
 
+@event.listens_for(SensorData, "before_insert")
+def fill_sensor_timestamp_ms(mapper, connection, target):
+    if target.timestamp_ms is None:
+        target.timestamp_ms = target.get_timestamp_ms()
+
+
+class SensorAggregate(SQLModel, table=True):
+    """
+    Readings of a channel rolled up into a time bucket by the retention job
+    (see retention.py). Count, sum, min and max are kept instead of the average so
+    buckets can be merged into coarser ones without losing precision.
+    """
+
+    __tablename__ = "sm_sensor_aggregates"
+    channel_id: int = Field(
+        sa_column=Column(
+            Integer, ForeignKey("sm_sensor_channels.id"), primary_key=True
+        )
+    )
+    resolution_ms: int = Field(sa_column=Column(Integer, primary_key=True))
+    # Start of the bucket in epoch milliseconds
+    bucket_ms: int = Field(sa_column=Column(BigInteger, primary_key=True))
+    count: int
+    value_sum: float
+    min_value: float
+    max_value: float
+
+
 class FileUploadModel(SQLModel, table=True):
     __tablename__ = "sm_files"
     id: int = Field(default=None, primary_key=True)
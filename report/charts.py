@@ -0,0 +1,95 @@
+"""
+Chart rendering for the reports, on the object-oriented matplotlib API.
+
+Each chart is drawn on its own `Figure` with an Agg canvas instead of the global
+pyplot state, so nothing is shared between charts and a figure that fails halfway
+is simply garbage collected. Chart functions are module-level functions that take
+plain data and return the encoded image, so `render_charts` can draw the charts of
+a report in parallel in CHART_RENDER_WORKERS processes.
+
+The report generators call `render_charts` from the render pool workers (see
+report/render_pool.py), so each of those owns a chart pool of its own. By default the
+cores are split between the render workers, so together they never start more chart
+processes than there are cores.
+"""
+
+import base64
+import io
+import multiprocessing
+import multiprocessing.util
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from report.render_pool import REPORT_RENDER_WORKERS
+
+load_dotenv()
+
+# Chart processes per render worker. With a single one (the default unless there
+# are at least two cores per render worker) charts render inline
+CHART_RENDER_WORKERS = int(
+    os.getenv(
+        "CHART_RENDER_WORKERS",
+        str(max(1, (os.cpu_count() or 1) // max(1, REPORT_RENDER_WORKERS))),
+    )
+)
+
+_executor = None
+
+
+def new_figure(figsize=None) -> Figure:
+    """Creates a figure with its own Agg canvas, outside of pyplot."""
+    figure = Figure(figsize=figsize)
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def figure_to_base64(figure: Figure) -> str:
+    """Encodes a figure as a Base64 PNG."""
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def get_chart_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=CHART_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        # A render pool worker joins its child processes when it exits, before any
+        # atexit hook runs, so the chart workers are stopped first. The priority runs
+        # it before the finalizers that close the pool queues (10 and below)
+        multiprocessing.util.Finalize(None, shutdown_chart_pool, exitpriority=100)
+    return _executor
+
+
+def shutdown_chart_pool():
+    global _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        # Waits for workers that are still starting, or they would never exit
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def render_charts(charts: list) -> list:
+    """
+    Renders independent charts, in parallel when there is more than one.
+
+    Args:
+        charts (list): (function, args) pairs; each function returns one image, or
+            a list of images.
+
+    Returns:
+        list: The result of each chart, in the same order.
+    """
+    if len(charts) <= 1 or CHART_RENDER_WORKERS <= 1:
+        return [function(*args) for function, args in charts]
+
+    executor = get_chart_executor()
+    futures = [executor.submit(function, *args) for function, args in charts]
+    return [future.result() for future in futures]
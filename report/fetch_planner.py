@@ -0,0 +1,69 @@
+"""
+Concurrent fetching of the sections of a composite report.
+
+A plan maps each section of the report to a coroutine function that fetches its
+data (from the FHIR server or the database). The fetches of a plan run at the same
+time, at most REPORT_FETCH_CONCURRENCY at once per plan, so the latency of a report
+is that of its slowest fetch instead of the sum of all of them. A failing fetch
+does not cancel the others; its error is returned for that section.
+"""
+
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()
+
+REPORT_FETCH_CONCURRENCY = int(os.getenv("REPORT_FETCH_CONCURRENCY", "4"))
+
+
+def describe_fetch_error(error: Exception) -> str:
+    if isinstance(error, HTTPException):
+        return str(error.detail)
+    return str(error) or type(error).__name__
+
+
+async def run_fetch_plan(
+    plan: dict, max_concurrency: int = REPORT_FETCH_CONCURRENCY, on_complete=None
+):
+    """
+    Runs the fetches of a plan concurrently.
+
+    Args:
+        plan (dict): {section: coroutine function taking no arguments}.
+        max_concurrency (int): Maximum number of fetches in flight at once.
+        on_complete: Optional callback `on_complete(section)` called as each fetch
+            finishes, successfully or not.
+
+    Returns:
+        tuple: ({section: result} of the fetches that succeeded,
+            {section: exception} of the fetches that failed).
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(section, fetch):
+        try:
+            async with semaphore:
+                return await fetch()
+        finally:
+            if on_complete:
+                on_complete(section)
+
+    outcomes = await asyncio.gather(
+        *(run(section, fetch) for section, fetch in plan.items()),
+        return_exceptions=True,
+    )
+
+    results = {}
+    errors = {}
+    for section, outcome in zip(plan, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Error fetching report section {section}: {outcome}")
+            errors[section] = outcome
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            results[section] = outcome
+    return results, errors
@@ -0,0 +1,100 @@
+"""
+Process pool for the CPU-bound part of report generation: matplotlib charts, Jinja
+rendering, wkhtmltopdf and the watermark merge. Running them here keeps the event
+loop (and every WebSocket it serves) responsive while a report renders.
+
+REPORT_RENDER_WORKERS processes render at a time and up to REPORT_RENDER_MAX_PENDING
+more jobs may wait for one; beyond that new jobs are rejected with 503. A job that
+does not finish within REPORT_RENDER_TIMEOUT seconds is answered with 504. A job that
+already started cannot be interrupted, so it keeps its slot until it finishes.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from report.report_utils import load_templates
+
+load_dotenv()
+
+REPORT_RENDER_WORKERS = int(os.getenv("REPORT_RENDER_WORKERS", "2"))
+REPORT_RENDER_MAX_PENDING = int(os.getenv("REPORT_RENDER_MAX_PENDING", "8"))
+REPORT_RENDER_TIMEOUT = float(os.getenv("REPORT_RENDER_TIMEOUT", "120"))
+
+_executor = None
+_jobs = 0
+_lock = threading.Lock()
+
+
+def get_render_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            # spawn: forking a process that runs threads (db pools, event loop) is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=REPORT_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=load_templates,
+            )
+        return _executor
+
+
+def shutdown_render_pool():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _release_slot(future):
+    global _jobs
+    with _lock:
+        _jobs -= 1
+
+
+async def run_render_job(function, *args, timeout=REPORT_RENDER_TIMEOUT, **kwargs):
+    """
+    Runs `function(*args, **kwargs)` in the render pool and waits for its result.
+
+    The function and its arguments are pickled, so it must be a module-level
+    function and the arguments plain data.
+
+    Raises:
+        HTTPException: 503 if the pool is full, 504 if the job times out.
+    """
+    global _jobs, _executor
+    with _lock:
+        if _jobs >= REPORT_RENDER_WORKERS + REPORT_RENDER_MAX_PENDING:
+            raise HTTPException(
+                status_code=503,
+                detail="Report renderer busy, try again later",
+                headers={"Retry-After": "10"},
+            )
+        _jobs += 1
+
+    executor = get_render_executor()
+    try:
+        future = executor.submit(function, *args, **kwargs)
+    except BaseException:
+        _release_slot(None)
+        raise
+    future.add_done_callback(_release_slot)
+
+    try:
+        # Cancelling on timeout drops the job if it is still waiting for a worker
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Report rendering timed out")
+    except BrokenProcessPool:
+        # A worker died (e.g. killed by the OOM killer); start a new pool next time
+        with _lock:
+            if _executor is executor:
+                _executor = None
+        raise
@@ -0,0 +1,222 @@
+"""
+Result cache for the report_utils sensor query functions.
+
+Entries are keyed by the function, the patient and the remaining arguments (encounter,
+time range, grouping, ...). Each patient has a generation counter that is part of the
+key: ingest bumps it after committing new rows for the patient, so every cached result
+of that patient becomes unreachable at once and the rest stay valid. Entries also
+expire after REPORT_CACHE_TTL seconds.
+
+Results read from the replica may miss rows committed just before the generation was
+bumped, so those entries expire after DB_REPLICA_MAX_LAG_SECONDS instead: a cached
+result is never staler than reading the replica directly.
+
+By default the cache lives in the memory of each worker (LRU bounded by
+REPORT_CACHE_MAX_ENTRIES), so ingest only invalidates the entries of its own worker and
+other workers rely on the TTL. Set REPORT_CACHE_REDIS_URL to share the entries and the
+generations between workers (requires the optional `redis` package). Redis calls run
+in a worker thread so they never block the event loop, and time out after
+REPORT_CACHE_REDIS_TIMEOUT seconds, falling back to an uncached call.
+
+Cached results are shared between callers and must not be mutated.
+"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from database import DB_REPLICA_MAX_LAG_SECONDS, replica_engine
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+load_dotenv()
+
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "300"))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "512"))
+REPORT_CACHE_REDIS_URL = os.getenv("REPORT_CACHE_REDIS_URL")
+REPORT_CACHE_REDIS_TIMEOUT = float(os.getenv("REPORT_CACHE_REDIS_TIMEOUT", "0.5"))
+
+# Generation shared by every patient, bumped when all entries must be dropped
+ALL_PATIENTS = "*"
+
+
+class LocalCacheBackend:
+    """In-process LRU cache with a TTL per entry."""
+
+    # Calls only take a lock, so they can run on the event loop
+    blocking = False
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_generations(self, patient_ids):
+        return [self.generations.get(patient_id, 0) for patient_id in patient_ids]
+
+    def invalidate(self, patient_id):
+        with self.lock:
+            self.generations[patient_id] = self.generations.get(patient_id, 0) + 1
+
+
+class RedisCacheBackend:
+    """Cache shared between workers through Redis; values are pickled."""
+
+    prefix = "report-cache:"
+    # Every call is a network round trip
+    blocking = True
+
+    def __init__(self, url, ttl, timeout):
+        if redis is None:
+            raise RuntimeError(
+                "REPORT_CACHE_REDIS_URL is set but the 'redis' package is not installed"
+            )
+        self.client = redis.Redis.from_url(
+            url, socket_timeout=timeout, socket_connect_timeout=timeout
+        )
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return (None, pickle.loads(value))
+
+    def set(self, key, value, ttl=None):
+        self.client.set(
+            self.prefix + key, pickle.dumps(value), ex=max(1, int(ttl or self.ttl))
+        )
+
+    def get_generations(self, patient_ids):
+        keys = [f"{self.prefix}generation:{patient_id}" for patient_id in patient_ids]
+        return [int(value or 0) for value in self.client.mget(keys)]
+
+    def invalidate(self, patient_id):
+        self.client.incr(f"{self.prefix}generation:{patient_id}")
+
+
+if REPORT_CACHE_REDIS_URL:
+    report_cache = RedisCacheBackend(
+        REPORT_CACHE_REDIS_URL, REPORT_CACHE_TTL, REPORT_CACHE_REDIS_TIMEOUT
+    )
+else:
+    report_cache = LocalCacheBackend(REPORT_CACHE_MAX_ENTRIES, REPORT_CACHE_TTL)
+
+
+async def call_backend(method, *args):
+    """Calls a method of `report_cache`, in a worker thread if it does network I/O."""
+    if report_cache.blocking:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+
+def invalidate_patient(patient_id):
+    """
+    Drops the cached results of a patient; called after ingest commits new rows.
+    It may block on the Redis backend, so async callers run it in a worker thread.
+    """
+    try:
+        report_cache.invalidate(patient_id)
+    except Exception as e:
+        print(f"Error invalidating report cache for patient {patient_id}: {e}")
+
+
+def invalidate_all():
+    """Drops the cached results of every patient."""
+    invalidate_patient(ALL_PATIENTS)
+
+
+def make_cache_key(name, patient_id, params):
+    """
+    Builds the cache key of a call. The generations are read before the result is
+    computed, so a result racing with an invalidation is stored under a key that is
+    already stale.
+    """
+    all_generation, patient_generation = report_cache.get_generations(
+        [ALL_PATIENTS, patient_id]
+    )
+    generation = f"{all_generation}.{patient_generation}"
+    digest = hashlib.sha256(repr(sorted(params.items())).encode()).hexdigest()
+    return f"{name}:{patient_id}:{generation}:{digest}"
+
+
+def entry_ttl(db):
+    """Time to live of a result read through `db`, shorter for the read replica."""
+    if replica_engine is not None and db is not None and db.get_bind() is replica_engine:
+        return min(REPORT_CACHE_TTL, DB_REPLICA_MAX_LAG_SECONDS)
+    return REPORT_CACHE_TTL
+
+
+def lookup(name, patient_id, params):
+    """Returns the cache key of a call and its cached entry, if any."""
+    key = make_cache_key(name, patient_id, params)
+    return key, report_cache.get(key)
+
+
+def cached_report(function):
+    """
+    Caches the results of an async report query function whose arguments include
+    `patient_id` and `db`. The database session is left out of the key.
+    """
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+        db = params.pop("db", None)
+
+        try:
+            key, entry = await call_backend(
+                lookup, function.__name__, params["patient_id"], params
+            )
+        except Exception as e:
+            print(f"Error reading report cache: {e}")
+            return await function(*args, **kwargs)
+
+        if entry is not None:
+            return entry[1]
+
+        result = await function(*args, **kwargs)
+        try:
+            ttl = entry_ttl(db)
+            if ttl > 0:
+                await call_backend(report_cache.set, key, result, ttl)
+        except Exception as e:
+            print(f"Error writing report cache: {e}")
+        return result
+
+    return wrapper
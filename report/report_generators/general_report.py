@@ -1,6 +1,8 @@
 from report.report_generators.questionnaire_report import (
-    generate_all_questionnaire_progress_html,
+    fetch_questionnaires,
+    questionnaire_progress_html,
 )
+from report.render_pool import run_render_job
 from report.report_utils import render_template
 from dateutil.parser import isoparse
 
@@ -27,7 +29,46 @@ async def general_report(
     include_bar_chart=True,
     include_line_chart=True,
 ):
+    # The questionnaires are fetched here; the rendering runs in the render pool
+    questionnaires = None
+    if questionnaire_data is not None:
+        questionnaires = await fetch_questionnaires(questionnaire_data, token)
+
+    return await run_render_job(
+        render_general_report,
+        patient_data,
+        clinical_impression_data_array,
+        condition_data_array,
+        observation_data_array,
+        medication_data_array,
+        sensor_data,
+        questionnaires,
+        include_bar_chart,
+        include_line_chart,
+    )
 
+
+def render_general_report(
+    patient_data,
+    clinical_impression_data_array=None,
+    condition_data_array=None,
+    observation_data_array=None,
+    medication_data_array=None,
+    sensor_data=None,
+    questionnaires=None,
+    include_bar_chart=True,
+    include_line_chart=True,
+):
+    """
+    Renders the general report to PDF. CPU-bound; runs in the render pool.
+
+    Args:
+        questionnaires (list): (questionnaire, responses) pairs as returned by
+            `fetch_questionnaires`, or None to leave the section out.
+
+    Returns:
+        bytes: The PDF content.
+    """
     html_data = patient_report(patient_data)
 
     # Add the clinical impressions to the story if provided
@@ -59,10 +100,10 @@ async def general_report(
         html_data += sensor_report(sensor_data)
         # story.extend(sensor_story)
 
-    if questionnaire_data is not None:
+    if questionnaires is not None:
         print("generating questionnaire progress report")
-        html_data += await generate_all_questionnaire_progress_html(
-            questionnaire_data, token, include_bar_chart, include_line_chart
+        html_data += questionnaire_progress_html(
+            questionnaires, include_bar_chart, include_line_chart
         )
 
     return generate_pdf_to_byte_array(html_data)
@@ -1,14 +1,17 @@
 from collections import defaultdict
 import os
 
+import matplotlib
 import numpy as np
-from report.report_utils import fetch_and_group_questionnaire_responses, render_template
-import matplotlib.pyplot as plt
-import base64
-import io
+from report.charts import figure_to_base64, new_figure, render_charts
+from report.report_utils import (
+    fetch_and_group_questionnaire_responses,
+    generate_pdf_to_byte_array,
+    render_template,
+)
 from dateutil.parser import isoparse
 
-from utils import fetch_resource
+from utils import batch_resource, fetch_resources_batch
 
 
 def questionnaire_report(
@@ -99,25 +102,18 @@ def questionnaire_report(
             question_data.append({"question": question_text, "answer": answer_text})
 
     # Generate plots for the scores
-    chart_images = []
+    charts = []
     if question_scores:
+        chart_args = (question_texts, question_scores, report_title)
         if include_bar_chart:
-            bar_chart_base64 = generate_bar_chart_base64(
-                question_texts, question_scores, report_title
-            )
-            chart_images.append(bar_chart_base64)
+            charts.append((generate_bar_chart_base64, chart_args))
 
         if include_pie_chart:
-            pie_chart_base64 = generate_pie_chart_base64(
-                question_texts, question_scores, report_title
-            )
-            chart_images.append(pie_chart_base64)
+            charts.append((generate_pie_chart_base64, chart_args))
 
         if include_line_chart:
-            line_chart_base64 = generate_line_chart_base64(
-                question_texts, question_scores, report_title
-            )
-            chart_images.append(line_chart_base64)
+            charts.append((generate_line_chart_base64, chart_args))
+    chart_images = render_charts(charts)
 
     # Render the report using a template
     context = {
@@ -284,18 +280,24 @@ def questionnaire_progress_report(
             )
 
     # Generate charts for progress
-    chart_images = []
+    charts = []
     if include_line_chart:  # Now generates a line chart for total scores
-        line_chart_base64 = generate_total_scores_line_chart(total_scores, report_title)
-        chart_images.append(line_chart_base64)
+        charts.append((generate_total_scores_line_chart, (total_scores, report_title)))
 
     if include_bar_chart:  # Now generates bar charts for question responses
-        bar_chart_base64 = generate_questions_bar_chart(progress_data, report_title)
-        chart_images.extend(bar_chart_base64)
+        charts.extend(
+            question_chunk_charts(
+                generate_questions_bar_chart, progress_data, report_title
+            )
+        )
 
     if include_line_chart:  # Now generates line charts for question responses
-        line_chart_base64 = generate_questions_line_chart(progress_data, report_title)
-        chart_images.extend(line_chart_base64)
+        charts.extend(
+            question_chunk_charts(
+                generate_questions_line_chart, progress_data, report_title
+            )
+        )
+    chart_images = render_charts(charts)
 
     # Render the report using a template
     context = {
@@ -315,22 +317,14 @@ def generate_bar_chart_base64(question_texts, question_scores, report_title):
     Returns:
         str: The Base64-encoded image.
     """
-    plt.figure(figsize=(10, 6))
-    plt.barh(question_texts, question_scores, color="skyblue")
-    plt.xlabel("Scores")
-    plt.ylabel("Questions")
-    plt.title(f"Scores for {report_title}")
-    plt.tight_layout()
-
-    # Save the chart to a BytesIO object
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format="png")
-    plt.close()
-    buffer.seek(0)
-
-    # Encode the image as Base64
-    base64_image = base64.b64encode(buffer.read()).decode("utf-8")
-    return f"data:image/png;base64,{base64_image}"
+    figure = new_figure(figsize=(10, 6))
+    axes = figure.add_subplot()
+    axes.barh(question_texts, question_scores, color="skyblue")
+    axes.set_xlabel("Scores")
+    axes.set_ylabel("Questions")
+    axes.set_title(f"Scores for {report_title}")
+    figure.tight_layout()
+    return f"data:image/png;base64,{figure_to_base64(figure)}"
 
 
 def generate_pie_chart_base64(question_texts, question_scores, report_title):
@@ -340,26 +334,18 @@ def generate_pie_chart_base64(question_texts, question_scores, report_title):
     Returns:
         str: The Base64-encoded image.
     """
-    plt.figure(figsize=(8, 8))
-    plt.pie(
+    figure = new_figure(figsize=(8, 8))
+    axes = figure.add_subplot()
+    axes.pie(
         question_scores,
         labels=question_texts,
         autopct="%1.1f%%",
         startangle=140,
-        colors=plt.cm.Paired.colors,
+        colors=matplotlib.colormaps["Paired"].colors,
     )
-    plt.title(f"Score Distribution for {report_title}")
-    plt.tight_layout()
-
-    # Save the chart to a BytesIO object
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format="png")
-    plt.close()
-    buffer.seek(0)
-
-    # Encode the image as Base64
-    base64_image = base64.b64encode(buffer.read()).decode("utf-8")
-    return f"data:image/png;base64,{base64_image}"
+    axes.set_title(f"Score Distribution for {report_title}")
+    figure.tight_layout()
+    return f"data:image/png;base64,{figure_to_base64(figure)}"
 
 
 def generate_line_chart_base64(question_texts, question_scores, report_title):
@@ -369,23 +355,17 @@ def generate_line_chart_base64(question_texts, question_scores, report_title):
     Returns:
         str: The Base64-encoded image.
     """
-    plt.figure(figsize=(10, 6))
-    plt.plot(question_texts, question_scores, marker="o", linestyle="-", color="green")
-    plt.xticks(rotation=45, ha="right")
-    plt.xlabel("Questions")
-    plt.ylabel("Scores")
-    plt.title(f"Scores Trend for {report_title}")
-    plt.tight_layout()
-
-    # Save the chart to a BytesIO object
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format="png")
-    plt.close()
-    buffer.seek(0)
-
-    # Encode the image as Base64
-    base64_image = base64.b64encode(buffer.read()).decode("utf-8")
-    return f"data:image/png;base64,{base64_image}"
+    figure = new_figure(figsize=(10, 6))
+    axes = figure.add_subplot()
+    axes.plot(question_texts, question_scores, marker="o", linestyle="-", color="green")
+    axes.tick_params(axis="x", labelrotation=45)
+    for label in axes.get_xticklabels():
+        label.set_horizontalalignment("right")
+    axes.set_xlabel("Questions")
+    axes.set_ylabel("Scores")
+    axes.set_title(f"Scores Trend for {report_title}")
+    figure.tight_layout()
+    return f"data:image/png;base64,{figure_to_base64(figure)}"
 
 
 def generate_total_scores_line_chart(total_scores, report_title):
@@ -402,24 +382,18 @@ def generate_total_scores_line_chart(total_scores, report_title):
     dates = [entry["date"] for entry in total_scores]
     scores = [entry["score"] for entry in total_scores]
 
-    plt.figure(figsize=(10, 6))
-    plt.plot(dates, scores, marker="o", linestyle="-", color="green")
-    plt.xlabel("Dates")
-    plt.ylabel("Total Scores")
-    plt.title(f"Total Scores Over Time for {report_title}")
-    plt.xticks(rotation=45, ha="right")
-    plt.grid(True, linestyle="--", alpha=0.7)
-    plt.tight_layout()
-
-    # Save the chart to a BytesIO object
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format="png")
-    plt.close()
-    buffer.seek(0)
-
-    # Encode the image as Base64
-    base64_image = base64.b64encode(buffer.read()).decode("utf-8")
-    return f"data:image/png;base64,{base64_image}"
+    figure = new_figure(figsize=(10, 6))
+    axes = figure.add_subplot()
+    axes.plot(dates, scores, marker="o", linestyle="-", color="green")
+    axes.set_xlabel("Dates")
+    axes.set_ylabel("Total Scores")
+    axes.set_title(f"Total Scores Over Time for {report_title}")
+    axes.tick_params(axis="x", labelrotation=45)
+    for label in axes.get_xticklabels():
+        label.set_horizontalalignment("right")
+    axes.grid(True, linestyle="--", alpha=0.7)
+    figure.tight_layout()
+    return f"data:image/png;base64,{figure_to_base64(figure)}"
 
 
 def chunk_list(lst, n):
@@ -427,129 +401,151 @@ def chunk_list(lst, n):
         yield lst[i : i + n]
 
 
-def generate_questions_bar_chart(progress_data, report_title):
+def question_chunk_charts(function, progress_data, report_title, max_per_chart=5):
     """
-    Generates grouped bar charts for question responses over time.
-    Returns a list of Base64-encoded images (one per chunk of questions).
+    Splits the questions into chunks of `max_per_chart` and returns one
+    (function, args) chart for each, to be drawn with render_charts.
     """
-    charts = []
     questions = list(progress_data.keys())
-    max_per_chart = 5
-
+    charts = []
     for chunk_idx, chunk in enumerate(chunk_list(questions, max_per_chart)):
-        plt.figure(figsize=(12, 8))
-        x = np.arange(len(chunk))
-        width = 0.8 / max(1, len(progress_data[chunk[0]]["dates"]))
+        chunk_data = {question: progress_data[question] for question in chunk}
+        charts.append((function, (chunk_data, chunk_idx, report_title)))
+    return charts
 
-        # Get unique dates across all questions in this chunk
-        all_dates = []
-        for question in chunk:
-            all_dates.extend(progress_data[question]["dates"])
-        unique_dates = sorted(set(all_dates))
-
-        # Create bar groups for each date
-        for i, date in enumerate(unique_dates[:5]):  # Limit to first 5 dates if many
-            scores_for_date = []
-            for question in chunk:
-                try:
-                    date_idx = progress_data[question]["dates"].index(date)
-                    scores_for_date.append(progress_data[question]["scores"][date_idx])
-                except ValueError:
-                    scores_for_date.append(0)
-            plt.bar(x + i * width, scores_for_date, width, label=date)
-
-        plt.xlabel("Questions")
-        plt.ylabel("Scores")
-        plt.title(
-            f"Question Responses Over Time for {report_title} (Part {chunk_idx+1})"
-        )
-        plt.xticks(
-            x + width / 2,
-            [q[:20] + "..." if len(q) > 20 else q for q in chunk],
-            rotation=45,
-            ha="right",
-        )
-        plt.legend()
-        plt.tight_layout()
 
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format="png")
-        plt.close()
-        buffer.seek(0)
-        base64_image = base64.b64encode(buffer.read()).decode("utf-8")
-        charts.append(f"data:image/png;base64,{base64_image}")
+def generate_questions_bar_chart(chunk_data, chunk_idx, report_title):
+    """
+    Generates a grouped bar chart for the responses to a chunk of questions over time.
 
-    return charts
+    Returns:
+        str: The Base64-encoded image.
+    """
+    chunk = list(chunk_data.keys())
+    figure = new_figure(figsize=(12, 8))
+    axes = figure.add_subplot()
+    x = np.arange(len(chunk))
+    width = 0.8 / max(1, len(chunk_data[chunk[0]]["dates"]))
+
+    # Get unique dates across all questions in this chunk
+    all_dates = []
+    for question in chunk:
+        all_dates.extend(chunk_data[question]["dates"])
+    unique_dates = sorted(set(all_dates))
+
+    # Create bar groups for each date
+    for i, date in enumerate(unique_dates[:5]):  # Limit to first 5 dates if many
+        scores_for_date = []
+        for question in chunk:
+            try:
+                date_idx = chunk_data[question]["dates"].index(date)
+                scores_for_date.append(chunk_data[question]["scores"][date_idx])
+            except ValueError:
+                scores_for_date.append(0)
+        axes.bar(x + i * width, scores_for_date, width, label=date)
+
+    axes.set_xlabel("Questions")
+    axes.set_ylabel("Scores")
+    axes.set_title(
+        f"Question Responses Over Time for {report_title} (Part {chunk_idx+1})"
+    )
+    axes.set_xticks(
+        x + width / 2,
+        [q[:20] + "..." if len(q) > 20 else q for q in chunk],
+        rotation=45,
+        ha="right",
+    )
+    axes.legend()
+    figure.tight_layout()
+    return f"data:image/png;base64,{figure_to_base64(figure)}"
 
 
-def generate_questions_line_chart(progress_data, report_title):
+def generate_questions_line_chart(chunk_data, chunk_idx, report_title):
     """
-    Generates line charts for question responses over time with questions on the X-axis.
-    Returns a list of Base64-encoded images (one per chunk of questions).
+    Generates a line chart for the responses to a chunk of questions over time, with
+    the questions on the X-axis.
+
+    Returns:
+        str: The Base64-encoded image.
     """
-    charts = []
-    questions = list(progress_data.keys())
-    max_per_chart = 5
+    chunk = list(chunk_data.keys())
+    figure = new_figure(figsize=(12, 8))
+    axes = figure.add_subplot()
+    question_labels = [q[:20] + "..." if len(q) > 20 else q for q in chunk]
+
+    # Get unique dates across all questions in this chunk
+    all_dates = []
+    for question in chunk:
+        all_dates.extend(chunk_data[question]["dates"])
+    unique_dates = sorted(set(all_dates))
+    if len(unique_dates) > 5:
+        unique_dates = unique_dates[:5]
+
+    for date in unique_dates:
+        scores_for_date = []
+        for question in chunk:
+            try:
+                date_idx = chunk_data[question]["dates"].index(date)
+                scores_for_date.append(chunk_data[question]["scores"][date_idx])
+            except ValueError:
+                scores_for_date.append(None)
+        valid_indices = [
+            i for i, score in enumerate(scores_for_date) if score is not None
+        ]
+        if valid_indices:
+            valid_questions = [question_labels[i] for i in valid_indices]
+            valid_scores = [scores_for_date[i] for i in valid_indices]
+            axes.plot(
+                valid_questions, valid_scores, marker="o", linestyle="-", label=date
+            )
 
-    for chunk_idx, chunk in enumerate(chunk_list(questions, max_per_chart)):
-        plt.figure(figsize=(12, 8))
-        question_labels = [q[:20] + "..." if len(q) > 20 else q for q in chunk]
+    axes.set_xlabel("Questions")
+    axes.set_ylabel("Scores")
+    axes.set_title(
+        f"Question Responses Over Time for {report_title} (Part {chunk_idx+1})"
+    )
+    axes.tick_params(axis="x", labelrotation=45)
+    for label in axes.get_xticklabels():
+        label.set_horizontalalignment("right")
+    axes.grid(True, linestyle="--", alpha=0.7)
+    axes.legend(loc="best", title="Dates")
+    figure.tight_layout()
+    return f"data:image/png;base64,{figure_to_base64(figure)}"
 
-        # Get unique dates across all questions in this chunk
-        all_dates = []
-        for question in chunk:
-            all_dates.extend(progress_data[question]["dates"])
-        unique_dates = sorted(set(all_dates))
-        if len(unique_dates) > 5:
-            unique_dates = unique_dates[:5]
-
-        for date in unique_dates:
-            scores_for_date = []
-            for question in chunk:
-                try:
-                    date_idx = progress_data[question]["dates"].index(date)
-                    scores_for_date.append(progress_data[question]["scores"][date_idx])
-                except ValueError:
-                    scores_for_date.append(None)
-            valid_indices = [
-                i for i, score in enumerate(scores_for_date) if score is not None
-            ]
-            if valid_indices:
-                valid_questions = [question_labels[i] for i in valid_indices]
-                valid_scores = [scores_for_date[i] for i in valid_indices]
-                plt.plot(
-                    valid_questions, valid_scores, marker="o", linestyle="-", label=date
-                )
-
-        plt.xlabel("Questions")
-        plt.ylabel("Scores")
-        plt.title(
-            f"Question Responses Over Time for {report_title} (Part {chunk_idx+1})"
-        )
-        plt.xticks(rotation=45, ha="right")
-        plt.grid(True, linestyle="--", alpha=0.7)
-        plt.legend(loc="best", title="Dates")
-        plt.tight_layout()
-
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format="png")
-        plt.close()
-        buffer.seek(0)
-        base64_image = base64.b64encode(buffer.read()).decode("utf-8")
-        charts.append(f"data:image/png;base64,{base64_image}")
 
-    return charts
+async def fetch_questionnaires(data, token):
+    """
+    Fetches the Questionnaire of each group of responses.
 
+    Args:
+        data (dict): Responses grouped by questionnaire id.
+        token: The FHIR access token.
 
-async def generate_all_questionnaire_progress_html(
-    data,
-    token,
+    Returns:
+        list: (questionnaire, responses) pairs, skipping questionnaires that no
+        longer exist.
+
+    Raises:
+        HTTPException: If a questionnaire cannot be read for another reason (e.g.
+            403).
+    """
+    resources = await fetch_resources_batch(
+        [("Questionnaire", qid) for qid in data], token
+    )
+    questionnaires = []
+    for qid, responses in data.items():
+        status, _ = resources[("Questionnaire", qid)]
+        if status in (404, 410):
+            continue
+        questionnaires.append((batch_resource(resources, "Questionnaire", qid), responses))
+    return questionnaires
+
+
+def questionnaire_progress_html(
+    questionnaires,
     include_bar_chart=True,
     include_line_chart=True,
 ):
-
-    # grouped = await fetch_and_group_questionnaire_responses(patient_id, token, params)
-
     context_title = {
         "title": "Reporte de Evaluaciones Clínicas",
         "img_path": os.path.abspath("report/static/icon_report.png"),
@@ -557,10 +553,7 @@ async def generate_all_questionnaire_progress_html(
 
     all_html = render_template("template_title.html", context_title)
 
-    for qid, responses in data.items():
-        questionnaire = await fetch_resource("Questionnaire", qid, token)
-        if not questionnaire:
-            continue
+    for questionnaire, responses in questionnaires:
         html_data = questionnaire_progress_report(
             questionnaire=questionnaire,
             questionnaire_responses=responses,
@@ -569,3 +562,72 @@ async def generate_all_questionnaire_progress_html(
         )
         all_html += html_data + '<div style="page-break-after:always"></div>'
     return all_html
+
+
+async def generate_all_questionnaire_progress_html(
+    data,
+    token,
+    include_bar_chart=True,
+    include_line_chart=True,
+):
+
+    # grouped = await fetch_and_group_questionnaire_responses(patient_id, token, params)
+
+    questionnaires = await fetch_questionnaires(data, token)
+    return questionnaire_progress_html(
+        questionnaires, include_bar_chart, include_line_chart
+    )
+
+
+def render_questionnaire_progress_pdf(
+    questionnaires,
+    include_bar_chart=True,
+    include_line_chart=True,
+):
+    """
+    Renders the progress reports of the given questionnaires to a single PDF, one
+    after the other. CPU-bound; runs in the render pool.
+
+    Args:
+        questionnaires (list): (questionnaire, responses) pairs.
+
+    Returns:
+        bytes: The PDF content.
+    """
+    html_reports = [
+        questionnaire_progress_report(
+            questionnaire=questionnaire,
+            questionnaire_responses=responses,
+            include_bar_chart=include_bar_chart,
+            include_line_chart=include_line_chart,
+        )
+        for questionnaire, responses in questionnaires
+    ]
+    # Page break between reports
+    return generate_pdf_to_byte_array(
+        '<div style="page-break-after:always"></div>'.join(html_reports)
+    )
+
+
+def render_questionnaire_report_pdf(
+    questionnaire_response,
+    questionnaire,
+    include_bar_chart=False,
+    include_pie_chart=False,
+    include_line_chart=False,
+):
+    """
+    Renders the report of a single questionnaire response to PDF. CPU-bound; runs
+    in the render pool.
+
+    Returns:
+        bytes: The PDF content.
+    """
+    html_data = questionnaire_report(
+        questionnaire_response=questionnaire_response,
+        questionnaire=questionnaire,
+        include_bar_chart=include_bar_chart,
+        include_pie_chart=include_pie_chart,
+        include_line_chart=include_line_chart,
+    )
+    return generate_pdf_to_byte_array(html_data)
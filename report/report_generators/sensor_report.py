@@ -1,12 +1,26 @@
-import io
 from collections import defaultdict
-import matplotlib.pyplot as plt
+import numpy as np
 
 
-from report.report_utils import render_template
+from report.charts import figure_to_base64, new_figure, render_charts
+from report.report_utils import generate_pdf_to_byte_array, render_template
+from report.report_generators.patient_report import patient_report
+from report.sensor_columns import (
+    downsample_min_max,
+    epoch_ms_to_datetime64,
+    format_sensor_summary,
+)
 from dateutil.parser import isoparse
 import os
-import base64
+
+# Points drawn per series; a page-wide chart cannot show more (0 draws every reading)
+SENSOR_PLOT_MAX_POINTS = int(os.getenv("SENSOR_PLOT_MAX_POINTS", "2000"))
+# Buckets per encounter series the PDF routes request from the database (see
+# get_sensor_series_by_patient), so the raw series is never loaded nor sent to the
+# render pool. Each bucket is drawn as its min and max.
+SENSOR_REPORT_BUCKETS = (
+    max(2, SENSOR_PLOT_MAX_POINTS // 2) if SENSOR_PLOT_MAX_POINTS > 0 else None
+)
 
 
 def sensor_report(data):
@@ -34,13 +48,22 @@ def sensor_report(data):
             "Duration",
         ]
 
-        for sensor_type, sensor_data in encounter_data.items():
+        for sensor_type, group in encounter_data.items():
+            sensor_data = format_sensor_summary(group)
             sensorData[sensor_type]["min"].append(sensor_data["min"])
             sensorData[sensor_type]["max"].append(sensor_data["max"])
             sensorData[sensor_type]["avg"].append(sensor_data["avg"])
             sensorData[sensor_type]["timestamp_epoch"].append(sensor_data["start"])
-            sensorData[sensor_type]["timestamps"].extend(sensor_data["timestamps"])
-            sensorData[sensor_type]["values"].extend(sensor_data["values"])
+            if "values" in group:
+                timestamps, values = group["timestamps"], group["values"]
+                if "min_values" in group:
+                    # Buckets aggregated by the database: draw their envelope
+                    timestamps = np.repeat(timestamps, 2)
+                    values = np.column_stack(
+                        (group["min_values"], group["max_values"])
+                    ).ravel()
+                sensorData[sensor_type]["timestamps"].append(timestamps)
+                sensorData[sensor_type]["values"].append(values)
 
             row = [{"value": sensor_type}]
             row.extend(
@@ -70,55 +93,87 @@ def sensor_report(data):
 
     html += render_template("template_title.html", context_title)
 
+    graph_titles = []
+    charts = []
     for sensor_type, stats in sensorData.items():
-        ## Graph de todos los valores
-        plt.figure()
-        plt.plot(stats["timestamps"], stats["values"])
-        plt.xlabel("Hora")
-        plt.ylabel("Valor")
-        plt.legend()
-        plt.tight_layout()
-
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format="png")
-        plt.close()
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.getvalue()).decode("utf-8")
-
-        context_graph = {
-            "title": f"{sensor_type} en el tiempo",
-            "img_path": os.path.abspath("report/static/icon_graph.png"),
-            "img_data": img_data,
-        }
-        html += render_template("template_graph.html", context_graph)
+        ## Graph de todos los valores (only when the raw series was fetched)
+        if stats["values"]:
+            timestamps = np.concatenate(stats["timestamps"])
+            values = np.concatenate(stats["values"])
+            if SENSOR_PLOT_MAX_POINTS > 0:
+                timestamps, values = downsample_min_max(
+                    timestamps, values, SENSOR_PLOT_MAX_POINTS
+                )
+            graph_titles.append(f"{sensor_type} en el tiempo")
+            charts.append((plot_sensor_series, (timestamps, values)))
 
         if len(data) == 1:
             continue
 
         ## Summary Graph
+        graph_titles.append(f"{sensor_type} Estadísticas")
+        charts.append(
+            (
+                plot_sensor_summary,
+                (stats["timestamp_epoch"], stats["min"], stats["max"], stats["avg"]),
+            )
+        )
 
-        plt.figure()
-        plt.plot(stats["timestamp_epoch"], stats["min"], label="Min", marker="o")
-        plt.plot(stats["timestamp_epoch"], stats["max"], label="Max", marker="o")
-        plt.plot(stats["timestamp_epoch"], stats["avg"], label="Avg", marker="o")
-        # plt.title(f"{sensor_type} Sensor Data")
-        plt.xlabel("Día")
-        plt.ylabel("Valor")
-        plt.legend()
-        plt.tight_layout()
-
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format="png")
-        plt.close()
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.getvalue()).decode("utf-8")
-
+    for title, img_data in zip(graph_titles, render_charts(charts)):
         context_graph = {
-            "title": f"{sensor_type} Estadísticas",
+            "title": title,
             "img_path": os.path.abspath("report/static/icon_graph.png"),
             "img_data": img_data,
         }
         html += render_template("template_graph.html", context_graph)
-        # html += f'<img src="data:image/png;base64,{img_data}"/>'
 
     return html
+
+
+def plot_sensor_series(timestamps_ms, values):
+    """
+    Line chart of every reading of a sensor type.
+
+    Returns:
+        str: The Base64-encoded PNG.
+    """
+    figure = new_figure()
+    axes = figure.add_subplot()
+    # Datetimes are only built here, right before plotting
+    axes.plot(epoch_ms_to_datetime64(timestamps_ms), values)
+    axes.set_xlabel("Hora")
+    axes.set_ylabel("Valor")
+    figure.tight_layout()
+    return figure_to_base64(figure)
+
+
+def plot_sensor_summary(days, min_values, max_values, avg_values):
+    """
+    Min, max and average of a sensor type per encounter.
+
+    Returns:
+        str: The Base64-encoded PNG.
+    """
+    figure = new_figure()
+    axes = figure.add_subplot()
+    axes.plot(days, min_values, label="Min", marker="o")
+    axes.plot(days, max_values, label="Max", marker="o")
+    axes.plot(days, avg_values, label="Avg", marker="o")
+    axes.set_xlabel("Día")
+    axes.set_ylabel("Valor")
+    axes.legend()
+    figure.tight_layout()
+    return figure_to_base64(figure)
+
+
+def render_sensor_report_pdf(patient, data):
+    """
+    Renders the patient header and the sensor report to PDF. CPU-bound; runs in
+    the render pool.
+
+    Returns:
+        bytes: The PDF content.
+    """
+    html_data = patient_report(patient)
+    html_data += sensor_report(data)
+    return generate_pdf_to_byte_array(html_data)
@@ -0,0 +1,206 @@
+"""
+Background jobs for patient reports that take too long to generate within one
+request (see POST /report/jobs/{patient_id} in report/routes.py).
+
+A job runs as an asyncio task of the worker that created it; at most
+REPORT_JOB_WORKERS jobs generate at once and up to REPORT_JOB_MAX_QUEUED more wait
+for their turn, beyond that new jobs are rejected with 503. The rendering itself
+still goes through the render pool (report/render_pool.py).
+
+The state of each job and its resulting PDF are stored under REPORT_JOB_DIR as
+<job_id>.json and <job_id>.pdf, so every worker of the same host can answer the
+status and download requests. Both are deleted REPORT_JOB_TTL seconds after the
+job finishes. Jobs still running when the process stops are lost and expire.
+"""
+
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()
+
+REPORT_JOB_DIR = os.getenv(
+    "REPORT_JOB_DIR", os.path.join(tempfile.gettempdir(), "report_jobs")
+)
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "2"))
+REPORT_JOB_MAX_QUEUED = int(os.getenv("REPORT_JOB_MAX_QUEUED", "20"))
+REPORT_JOB_TTL = float(os.getenv("REPORT_JOB_TTL", "3600"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+_semaphore = asyncio.Semaphore(REPORT_JOB_WORKERS)
+# Tasks of the jobs of this process, referenced so they are not garbage collected
+_tasks = {}
+
+
+def job_path(job_id: str, extension: str) -> str:
+    return os.path.join(REPORT_JOB_DIR, f"{job_id}.{extension}")
+
+
+def _write_atomic(path: str, data: bytes):
+    # Readers in other workers never see a partially written file
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(data)
+    os.replace(temporary_path, path)
+
+
+def save_job(job: dict):
+    _write_atomic(job_path(job["id"], "json"), json.dumps(job).encode())
+
+
+def load_job(job_id: str):
+    """
+    Reads the state of a job.
+
+    Returns:
+        dict: The job, or None if the id is malformed, unknown or expired.
+    """
+    if not JOB_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(job_path(job_id, "json"), "rb") as file:
+            job = json.loads(file.read())
+    except (OSError, ValueError):
+        return None
+    if job["expires_at"] < time.time():
+        return None
+    return job
+
+
+def job_status(job: dict) -> dict:
+    """Public view of a job, without the owner."""
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "step": job["step"],
+        "error": job["error"],
+        "section_errors": job["section_errors"],
+        "created_at": job["created_at"],
+        "expires_at": job["expires_at"],
+    }
+
+
+def purge_expired_jobs():
+    """Deletes the state and result files of expired jobs."""
+    now = time.time()
+    try:
+        names = os.listdir(REPORT_JOB_DIR)
+    except FileNotFoundError:
+        return
+
+    for name in names:
+        job_id, extension = os.path.splitext(name)
+        if extension != ".json" or job_id in _tasks:
+            continue
+        try:
+            with open(os.path.join(REPORT_JOB_DIR, name), "rb") as file:
+                expires_at = json.loads(file.read())["expires_at"]
+        except (OSError, ValueError, KeyError):
+            expires_at = 0
+        if expires_at >= now:
+            continue
+        for path in (job_path(job_id, "pdf"), job_path(job_id, "json")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def create_job(owner: str, body) -> dict:
+    """
+    Queues a report job.
+
+    Args:
+        owner: Subject of the token that created the job; only it can read the job.
+        body: Coroutine function called as `body(on_progress)` that returns the PDF
+            bytes, their filename and the errors of the sections left out of the
+            report. `on_progress(fraction, step)` records progress.
+
+    Returns:
+        dict: The new job.
+
+    Raises:
+        HTTPException: 503 if too many jobs are already queued.
+    """
+    if len(_tasks) >= REPORT_JOB_WORKERS + REPORT_JOB_MAX_QUEUED:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many reports in progress, try again later",
+            headers={"Retry-After": "30"},
+        )
+
+    os.makedirs(REPORT_JOB_DIR, exist_ok=True)
+    purge_expired_jobs()
+
+    now = time.time()
+    job = {
+        "id": uuid.uuid4().hex,
+        "owner": owner,
+        "status": JOB_QUEUED,
+        "progress": 0.0,
+        "step": None,
+        "error": None,
+        "section_errors": {},
+        "filename": None,
+        "created_at": now,
+        "expires_at": now + REPORT_JOB_TTL,
+    }
+    save_job(job)
+
+    task = asyncio.create_task(_run_job(job, body))
+    _tasks[job["id"]] = task
+    task.add_done_callback(lambda _: _tasks.pop(job["id"], None))
+    return job
+
+
+async def _run_job(job: dict, body):
+    async with _semaphore:
+        job["status"] = JOB_RUNNING
+        save_job(job)
+
+        def on_progress(fraction, step):
+            job["progress"] = round(fraction, 2)
+            job["step"] = step
+            save_job(job)
+
+        try:
+            pdf_file, filename, errors = await body(on_progress)
+            _write_atomic(job_path(job["id"], "pdf"), pdf_file)
+            job["status"] = JOB_DONE
+            job["progress"] = 1.0
+            job["step"] = None
+            job["filename"] = filename
+            job["section_errors"] = errors
+        except Exception as e:
+            print(f"Error in report job {job['id']}: {e}")
+            job["status"] = JOB_FAILED
+            job["error"] = (
+                e.detail if isinstance(e, HTTPException) else "Error al generar el reporte"
+            )
+        except asyncio.CancelledError:
+            job["status"] = JOB_FAILED
+            job["error"] = "Job cancelled"
+            raise
+        finally:
+            job["expires_at"] = time.time() + REPORT_JOB_TTL
+            save_job(job)
+
+
+def cancel_jobs():
+    """Cancels the jobs of this process; called on shutdown."""
+    for task in list(_tasks.values()):
+        task.cancel()
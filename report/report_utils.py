@@ -1,37 +1,122 @@
+import functools
+import json
 import os
-from typing import Annotated, List, Optional
+from typing import Annotated, Iterator, List, Optional
 import httpx
 from fastapi import Depends, HTTPException
-from sqlalchemy import func
+from sqlalchemy import and_, func, literal, select, union_all
 from sqlmodel import Session
-from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from collections import defaultdict
 from datetime import datetime
-from database import get_session
-from models import SensorData
+from database import get_read_session, open_read_session
+from models import SensorAggregate, SensorChannel, SensorData, SensorTypeEntry
+from report.report_cache import cached_report
+from sensor_cursor import get_commit_horizon, page_after_cursor
+from report.sensor_columns import (
+    epoch_ms_to_datetime64,
+    group_sensor_columns,
+    load_sensor_columns,
+)
 
 import pdfkit
 import tempfile
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 import PyPDF2
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 import io
 
-import statistics
-
-from utils import fetch_resource, fetch_resources
+from utils import fetch_resource, iter_resources
 
 
 HAPI_FHIR_URL = os.getenv("HAPI_FHIR_URL")
 
-db_dependency = Annotated[Session, Depends(get_session)]
+db_dependency = Annotated[Session, Depends(get_read_session)]
+
+TEMPLATES_DIR = "report/templates"
+REPORT_TEMPLATE_CACHE_DIR = os.getenv(
+    "REPORT_TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "report_templates")
+)
+REPORT_TEMPLATE_AUTO_RELOAD = (
+    os.getenv("REPORT_TEMPLATE_AUTO_RELOAD", "false").lower() == "true"
+)
+
+# Size of the chunks a generated PDF is streamed to the client in
+PDF_CHUNK_SIZE = 64 * 1024
+
+# Number of rows fetched per round trip from the server-side cursor when streaming
+STREAM_BATCH_SIZE = 5000
+
+# Readings of every retention tier (see retention.py): recent raw readings and the
+# 1-second and 1-minute aggregates they are rolled up into once expired. A raw
+# reading is a bucket of one, so queries combine count, sum, min and max the same
+# way for every tier, and each time range is read from the tier that holds it.
+sensor_readings = union_all(
+    select(
+        SensorData.channel_id,
+        SensorData.timestamp_ms,
+        SensorData.value,
+        literal(1).label("count"),
+        SensorData.value.label("value_sum"),
+        SensorData.value.label("min_value"),
+        SensorData.value.label("max_value"),
+    ),
+    select(
+        SensorAggregate.channel_id,
+        SensorAggregate.bucket_ms.label("timestamp_ms"),
+        (SensorAggregate.value_sum / SensorAggregate.count).label("value"),
+        SensorAggregate.count,
+        SensorAggregate.value_sum,
+        SensorAggregate.min_value,
+        SensorAggregate.max_value,
+    ),
+).subquery("sensor_readings")
+
+# Reading (or bucket start) time in epoch milliseconds, indexed with channel_id
+sensor_timestamp_ms = sensor_readings.c.timestamp_ms
+# Reading value, or bucket average for aggregated readings
+sensor_value = sensor_readings.c.value
+
+# Statistics over the readings of a group, exact across tiers
+sensor_min = func.min(sensor_readings.c.min_value)
+sensor_max = func.max(sensor_readings.c.max_value)
+sensor_avg = func.sum(sensor_readings.c.value_sum) / func.sum(sensor_readings.c.count)
+sensor_count = func.sum(sensor_readings.c.count)
+
+# Text attributes of a reading, decoded through the channel lookup tables
+sensor_patient_id = SensorChannel.patient_id
+sensor_encounter_id = SensorChannel.encounter_id
+sensor_type_name = SensorTypeEntry.name
+
+
+def create_template_environment():
+    """
+    Creates the Jinja environment shared by every report. Compiled templates stay
+    in its memory cache and their bytecode is stored in REPORT_TEMPLATE_CACHE_DIR,
+    so a new process (e.g. a render pool worker) skips the compilation as well.
+    Changes to the templates are only picked up with REPORT_TEMPLATE_AUTO_RELOAD,
+    meant for development.
+    """
+    os.makedirs(REPORT_TEMPLATE_CACHE_DIR, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        bytecode_cache=FileSystemBytecodeCache(REPORT_TEMPLATE_CACHE_DIR),
+        auto_reload=REPORT_TEMPLATE_AUTO_RELOAD,
+    )
+
+
+template_env = create_template_environment()
+
+
+def load_templates():
+    """Compiles every report template; called at startup."""
+    for template_file in template_env.list_templates(extensions=["html"]):
+        template_env.get_template(template_file)
 
 
 def render_template(template_file, context):
-    env = Environment(loader=FileSystemLoader("report/templates"))
-    # env = Environment(loader=FileSystemLoader("."))
-    template = env.get_template(template_file)
+    template = template_env.get_template(template_file)
     return template.render(context)
 
 
@@ -62,15 +147,11 @@ def generate_pdf_to_byte_array(html_content, add_watermark=True):
         "footer-line": True,  # Add a line above the footer
         "margin-bottom": "20mm",
     }
-    # Create a temporary file
-    with tempfile.NamedTemporaryFile(delete=False) as tmpfile:
-        pdf_file_path = tmpfile.name
-
     try:
-        # Generate PDF and save to the temporary file
-        pdfkit.from_string(
+        # Without an output path wkhtmltopdf writes the PDF to a pipe
+        pdf_content = pdfkit.from_string(
             html_content,
-            pdf_file_path,
+            False,
             configuration=config,
             options=options,
             verbose=True,
@@ -78,68 +159,85 @@ def generate_pdf_to_byte_array(html_content, add_watermark=True):
 
         if add_watermark:
             # Add watermark to the PDF
-            watermarked_pdf_path = add_watermark_to_pdf(
-                pdf_file_path, "report/static/logo.png"
-            )
-
-            # Read the watermarked PDF content into a byte array
-            with open(watermarked_pdf_path, "rb") as pdf_file:
-                pdf_content = pdf_file.read()
-
-            # Clean up the temporary files
-            os.remove(pdf_file_path)
-            os.remove(watermarked_pdf_path)
-        else:
-            # Read the original PDF content into a byte array
-            with open(pdf_file_path, "rb") as pdf_file:
-                pdf_content = pdf_file.read()
-
-            # Clean up the temporary file
-            os.remove(pdf_file_path)
+            pdf_content = add_watermark_to_pdf(pdf_content, "report/static/logo.png")
 
         return pdf_content
     except IOError as e:
         print(e)
-        # Clean up the temporary file in case of error
-        os.remove(pdf_file_path)
         return None
 
 
-def add_watermark_to_pdf(input_pdf_path, watermark_image_path):
+def require_pdf(pdf_content):
+    """
+    Checks the result of a PDF render before it is sent, since
+    `generate_pdf_to_byte_array` returns None when wkhtmltopdf fails.
+
+    Raises:
+        HTTPException: 500 if no PDF was generated.
     """
-    Adds an image watermark to every page of the input PDF.
+    if pdf_content is None:
+        raise HTTPException(status_code=500, detail="PDF generation failed")
+
+
+def iter_pdf_chunks(pdf_content, chunk_size=PDF_CHUNK_SIZE):
+    """
+    Splits a PDF into fixed-size chunks for a StreamingResponse. Iterating over
+    io.BytesIO instead would split the binary content at every newline byte.
+
+    Yields:
+        bytes: The next chunk of the PDF.
+    """
+    for offset in range(0, len(pdf_content), chunk_size):
+        yield pdf_content[offset : offset + chunk_size]
+
+
+def add_watermark_to_pdf(pdf_content, watermark_image_path):
+    """
+    Adds an image watermark to every page of a PDF.
 
     Args:
-        input_pdf_path (str): Path to the input PDF.
+        pdf_content (bytes): The input PDF.
         watermark_image_path (str): Path to the watermark image.
 
     Returns:
-        str: Path to the watermarked PDF.
+        bytes: The watermarked PDF.
     """
-    # Create a temporary file for the watermarked PDF
-    with tempfile.NamedTemporaryFile(delete=False) as tmpfile:
-        watermarked_pdf_path = tmpfile.name
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
+    pdf_writer = PyPDF2.PdfWriter()
+
+    for page in pdf_reader.pages:
+        # Pages of a report share their size, so this is built once
+        watermark_page = get_watermark_page(
+            watermark_image_path,
+            float(page.mediabox.width),
+            float(page.mediabox.height),
+        )
 
-    # Read the input PDF
-    with open(input_pdf_path, "rb") as input_pdf:
-        pdf_reader = PyPDF2.PdfReader(input_pdf)
-        pdf_writer = PyPDF2.PdfWriter()
+        # Merge the watermark with the current page
+        page.merge_page(watermark_page)
+        pdf_writer.add_page(page)
 
-        for page in pdf_reader.pages:
-            # Create a watermark PDF with the image
-            watermark_pdf = create_watermark_pdf(
-                watermark_image_path, page.mediabox.width, page.mediabox.height
-            )
+    output = io.BytesIO()
+    pdf_writer.write(output)
+    return output.getvalue()
 
-            # Merge the watermark with the current page
-            page.merge_page(watermark_pdf.pages[0])
-            pdf_writer.add_page(page)
 
-        # Write the watermarked PDF to the temporary file
-        with open(watermarked_pdf_path, "wb") as output_pdf:
-            pdf_writer.write(output_pdf)
+@functools.lru_cache(maxsize=16)
+def get_watermark_page(image_path, page_width, page_height):
+    """
+    Returns the parsed watermark page for an image and page size, creating it on
+    first use. The page is kept for the life of the process and shared by every
+    report; merging it into another page does not modify it.
 
-    return watermarked_pdf_path
+    Args:
+        image_path (str): Path to the watermark image.
+        page_width (float): Width of the page.
+        page_height (float): Height of the page.
+
+    Returns:
+        PyPDF2.PageObject: The watermark page.
+    """
+    return create_watermark_pdf(image_path, page_width, page_height).pages[0]
 
 
 def create_watermark_pdf(image_path, page_width, page_height):
@@ -228,39 +326,38 @@ async def get_sensor_data(
     db: db_dependency,
     encounter_id: Optional[str] = None,
 ):
+    """
+    Fetch the summary and the time-ordered values of each encounter and sensor type
+    of a patient in a single aggregation pass.
 
-    # Subconsulta para obtener los valores y timestamps de cada tipo de sensor
-    subquery = db.query(
-        SensorData.sensor_type, SensorData.value, SensorData.timestamp_epoch
-    ).filter(SensorData.patient_id == patient_id)
-
-    if encounter_id:
-        subquery = subquery.filter(SensorData.encounter_id == encounter_id)
-
-    # Alias para la subconsulta
-    subquery_alias = aliased(subquery.subquery())
+    Args:
+        patient_id (str): The ID of the patient.
+        db: The database session.
+        encounter_id (Optional[str]): Encounter ID to filter by.
 
+    Returns:
+        dict: {encounter_id: {sensor_type: data}} with the summary fields and the
+        "values" and "timestamps" lists ordered by time.
+    """
     query = db.query(
-        SensorData.encounter_id,
-        SensorData.sensor_type,
-        func.min(SensorData.value).label("min_value"),
-        func.max(SensorData.value).label("max_value"),
-        func.avg(SensorData.value).label("avg_value"),
-        func.min(SensorData.timestamp_epoch).label("start_time"),
-        func.max(SensorData.timestamp_epoch).label("end_time"),
-        func.array_agg(subquery_alias.c.value).label("values_list"),
-        func.array_agg(subquery_alias.c.timestamp_epoch).label("timestamps_list"),
-    ).filter(SensorData.patient_id == patient_id)
-
-    if encounter_id:
-        query = query.filter(SensorData.encounter_id == encounter_id)
-
-    query = query.join(
-        subquery_alias, SensorData.sensor_type == subquery_alias.c.sensor_type
+        sensor_encounter_id,
+        sensor_type_name.label("sensor_type"),
+        sensor_min.label("min_value"),
+        sensor_max.label("max_value"),
+        sensor_avg.label("avg_value"),
+        sensor_count.label("count"),
+        func.min(sensor_timestamp_ms).label("start_time"),
+        func.max(sensor_timestamp_ms).label("end_time"),
+        func.array_agg(
+            aggregate_order_by(sensor_value, sensor_timestamp_ms)
+        ).label("values_list"),
+        func.array_agg(
+            aggregate_order_by(sensor_timestamp_ms, sensor_timestamp_ms)
+        ).label("timestamps_list"),
     )
+    query = filter_sensor_data_query(query, patient_id, encounter_id)
 
-    # test_res = query.all()
-    query_result = query.group_by(SensorData.encounter_id, SensorData.sensor_type).all()
+    query_result = query.group_by(sensor_encounter_id, sensor_type_name).all()
 
     # Preparing the results to return
     results = defaultdict(lambda: defaultdict(dict))
@@ -270,21 +367,22 @@ async def get_sensor_data(
         min_value,
         max_value,
         avg_value,
+        count,
         start_time,
         end_time,
         values,
         timestamps,
     ) in query_result:
-        start_datetime = datetime.fromtimestamp(start_time)
-        end_datetime = datetime.fromtimestamp(end_time)
+        start_datetime = datetime.fromtimestamp(start_time / 1000.0)
+        end_datetime = datetime.fromtimestamp(end_time / 1000.0)
         duration = end_datetime - start_datetime
-        timestamps_datetime = [datetime.fromtimestamp(ts) for ts in timestamps]
+        timestamps_datetime = epoch_ms_to_datetime64(timestamps).tolist()
 
         results[encounter_id][sensor_type] = {
             "min": round(min_value, 2),
             "max": round(max_value, 2),
             "avg": round(avg_value, 2),
-            "count": len(values),
+            "count": count,
             "day": start_datetime.strftime("%d-%m-%Y"),
             "start": start_datetime.strftime("%H:%M:%S"),
             "end": end_datetime.strftime("%H:%M:%S"),
@@ -296,7 +394,58 @@ async def get_sensor_data(
     return results
 
 
-async def get_sensor_data_by_patient(
+def filter_sensor_data_query(
+    query,
+    patient_id: str,
+    encounter_id: Optional[str] = None,
+    min_time: Optional[datetime] = None,
+    max_time: Optional[datetime] = None,
+    excluded_sensor_types: Optional[List[str]] = None,
+):
+    """
+    Applies the patient, encounter, sensor type and time filters to a sensor query.
+
+    The query reads `sensor_readings` joined with the channel lookup tables, so
+    the filters and the
+    selected columns can use `sensor_patient_id`, `sensor_encounter_id` and
+    `sensor_type_name`.
+
+    Args:
+        query: A query over the `sensor_readings` columns.
+        patient_id (str): The ID of the patient.
+        encounter_id (Optional[str]): Encounter ID to filter by.
+        min_time (Optional[datetime]): Minimum time (inclusive).
+        max_time (Optional[datetime]): Maximum time (inclusive).
+        excluded_sensor_types (Optional[List[str]]): Sensor types to leave out.
+
+    Returns:
+        Query: The filtered query.
+    """
+    query = (
+        query.select_from(sensor_readings)
+        .join(SensorChannel, sensor_readings.c.channel_id == SensorChannel.id)
+        .join(SensorTypeEntry, SensorChannel.sensor_type_id == SensorTypeEntry.id)
+        .filter(sensor_patient_id == patient_id)
+    )
+
+    if encounter_id:
+        query = query.filter(sensor_encounter_id == encounter_id)
+
+    if excluded_sensor_types:
+        query = query.filter(sensor_type_name.notin_(excluded_sensor_types))
+
+    if min_time:
+        min_timestamp = int(min_time.timestamp() * 1000)
+        query = query.filter(sensor_timestamp_ms >= min_timestamp)
+
+    if max_time:
+        max_timestamp = int(max_time.timestamp() * 1000)
+        query = query.filter(sensor_timestamp_ms <= max_timestamp)
+
+    return query
+
+
+def build_sensor_data_query(
     patient_id: str,
     db,
     encounter_id: Optional[str] = None,
@@ -304,77 +453,350 @@ async def get_sensor_data_by_patient(
     max_time: Optional[datetime] = None,
     excluded_sensor_types: Optional[List[str]] = None,
 ):
+    """
+    Builds the query for the raw sensor readings of a patient.
+
+    Returns:
+        Query: Rows of (encounter_id, sensor_type, value, timestamp_ms).
+    """
     # Query to get values and timestamps for each sensor type
     query = db.query(
-        SensorData.encounter_id,
-        SensorData.sensor_type,
-        SensorData.value,
-        SensorData.timestamp_epoch,
-        SensorData.timestamp_millis,
-    ).filter(SensorData.patient_id == patient_id)
+        sensor_encounter_id,
+        sensor_type_name.label("sensor_type"),
+        sensor_value,
+        sensor_timestamp_ms.label("timestamp_ms"),
+    )
+    return filter_sensor_data_query(
+        query, patient_id, encounter_id, min_time, max_time, excluded_sensor_types
+    )
+
+
+def stream_sensor_data_by_patient(
+    patient_id: str,
+    encounter_id: Optional[str] = None,
+    min_time: Optional[datetime] = None,
+    max_time: Optional[datetime] = None,
+    excluded_sensor_types: Optional[List[str]] = None,
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> Iterator[str]:
+    """
+    Streams the raw sensor readings of a patient as NDJSON (one reading per line).
+
+    Rows are read through a server-side cursor in batches of `batch_size` and each
+    batch is emitted as soon as it is serialized, so memory stays flat regardless of
+    the size of the range. The generator opens its own read session because it keeps
+    running after the request dependencies have been closed.
+
+    Yields:
+        str: A chunk of newline-terminated JSON objects.
+    """
+    db = open_read_session()
+    try:
+        query = build_sensor_data_query(
+            patient_id, db, encounter_id, min_time, max_time, excluded_sensor_types
+        ).order_by(
+            sensor_encounter_id,
+            sensor_type_name.label("sensor_type"),
+            sensor_timestamp_ms,
+        )
+
+        lines = []
+        for record in query.yield_per(batch_size):
+            lines.append(
+                json.dumps(
+                    {
+                        "encounter_id": record.encounter_id,
+                        "sensor_type": record.sensor_type,
+                        "value": record.value,
+                        "timestamp": record.timestamp_ms,
+                    }
+                )
+            )
+            if len(lines) >= batch_size:
+                yield "\n".join(lines) + "\n"
+                lines = []
+
+        if lines:
+            yield "\n".join(lines) + "\n"
+    finally:
+        db.close()
+
+
+async def get_sensor_data_since(
+    patient_id: str,
+    db,
+    after: tuple,
+    encounter_id: Optional[str] = None,
+    min_time: Optional[datetime] = None,
+    max_time: Optional[datetime] = None,
+    excluded_sensor_types: Optional[List[str]] = None,
+    limit: int = STREAM_BATCH_SIZE,
+):
+    """
+    Fetch the raw readings of a patient committed after a cursor position, in
+    commit order, for clients polling with a cursor (see sensor_cursor.py).
+
+    The query walks the (xact_id, id) index from the cursor, so its cost depends on
+    the number of new rows rather than on the history of the patient. Only raw
+    readings are tracked: readings the retention job (see retention.py) rolled up
+    into aggregates before the client polled them are not returned.
+
+    Args:
+        after (tuple): (xact_id, id) of the last reading the client has seen.
+        min_time (Optional[datetime]): Minimum reading time (inclusive).
+        max_time (Optional[datetime]): Maximum reading time (inclusive).
+        limit (int): Maximum number of readings returned.
+
+    Returns:
+        tuple: (list of {id, encounter_id, sensor_type, value, timestamp} dicts, the
+        cursor to poll from next, whether more readings remain after it).
+    """
+    # Read before the data, so every reading below it is already visible
+    horizon = get_commit_horizon(db)
+
+    query = (
+        db.query(
+            SensorData.id,
+            SensorData.xact_id,
+            sensor_encounter_id,
+            sensor_type_name.label("sensor_type"),
+            SensorData.value,
+            SensorData.timestamp_ms,
+        )
+        .join(SensorChannel, SensorData.channel_id == SensorChannel.id)
+        .join(SensorTypeEntry, SensorChannel.sensor_type_id == SensorTypeEntry.id)
+        .filter(sensor_patient_id == patient_id)
+    )
 
     if encounter_id:
-        query = query.filter(SensorData.encounter_id == encounter_id)
+        query = query.filter(sensor_encounter_id == encounter_id)
 
     if excluded_sensor_types:
-        query = query.filter(SensorData.sensor_type.notin_(excluded_sensor_types))
+        query = query.filter(sensor_type_name.notin_(excluded_sensor_types))
 
     if min_time:
-        min_timestamp = int(min_time.timestamp())
-        query = query.filter(SensorData.timestamp_epoch >= min_timestamp)
+        query = query.filter(SensorData.timestamp_ms >= int(min_time.timestamp() * 1000))
 
     if max_time:
-        max_timestamp = int(max_time.timestamp())
-        query = query.filter(SensorData.timestamp_epoch <= max_timestamp)
+        query = query.filter(SensorData.timestamp_ms <= int(max_time.timestamp() * 1000))
+
+    records, cursor, has_more = page_after_cursor(query, after, horizon, limit)
+
+    readings = [
+        {
+            "id": record.id,
+            "encounter_id": record.encounter_id,
+            "sensor_type": record.sensor_type,
+            "value": record.value,
+            "timestamp": record.timestamp_ms,
+        }
+        for record in records
+    ]
+    return readings, cursor, has_more
 
-    query_result = query.all()
 
-    grouped_results = defaultdict(
-        lambda: defaultdict(lambda: {"values": [], "timestamps": []})
+async def get_sensor_data_by_patient(
+    patient_id: str,
+    db,
+    encounter_id: Optional[str] = None,
+    min_time: Optional[datetime] = None,
+    max_time: Optional[datetime] = None,
+    excluded_sensor_types: Optional[List[str]] = None,
+    include_series: bool = False,
+    resolution_ms: Optional[int] = None,
+    max_points: Optional[int] = None,
+):
+    """
+    Fetch the sensor data of a patient grouped by encounter and sensor type.
+
+    Without `include_series` only the summary (min, max, avg, count, start, end) is
+    returned and it is aggregated by the database. With `include_series` the groups
+    also carry the "values" and "timestamps" arrays: every stored reading (bucket
+    averages where the retention policy has downsampled them), or one point per time
+    bucket when `resolution_ms` or `max_points` is given (see
+    `get_sensor_series_by_patient`).
+
+    Returns:
+        dict: Groups as returned by `group_sensor_columns`; use
+        `format_sensor_groups` to turn them into plain Python values.
+    """
+    grouped_results = await get_sensor_summary_by_patient(
+        patient_id, db, encounter_id, min_time, max_time, excluded_sensor_types
     )
-    for record in query_result:
-        encounter_id = record.encounter_id
-        sensor_type = record.sensor_type
-        value = record.value
-        timestamp = datetime.fromtimestamp(
-            record.timestamp_epoch + record.timestamp_millis / 1000.0
-        )
 
-        grouped_results[encounter_id][sensor_type]["values"].append(value)
-        grouped_results[encounter_id][sensor_type]["timestamps"].append(timestamp)
-
-    # Calculate min, max, and avg for each sensor type within each encounter_id
-    for encounter_id, sensor_data in grouped_results.items():
-        for sensor_type, data in sensor_data.items():
-            values = data["values"]
-            if values:
-                data["min"] = min(values)
-                data["max"] = max(values)
-                data["avg"] = statistics.mean(values)
-                data["count"] = len(values)
-                data["start"] = min(data["timestamps"])
-                data["end"] = max(data["timestamps"])
-                data["duration"] = str(data["end"] - data["start"]).split(".")[0]
-
-                # Convert start and end to datetime objects if they are not already
-                if isinstance(data["start"], str):
-                    data["start"] = datetime.strptime(data["start"], "%H:%M:%S")
-                if isinstance(data["end"], str):
-                    data["end"] = datetime.strptime(data["end"], "%H:%M:%S")
-
-                data["start_str"] = data["start"].strftime("%H:%M:%S")
-                data["end_str"] = data["end"].strftime("%H:%M:%S")
-                data["timestamp_epoch"] = int(data["start"].timestamp())
-                data["day"] = data["start"].strftime("%d-%m-%Y")
-
-    # Format the results to return
-    grouped_results = {
-        encounter_id: dict(sensor_data)
-        for encounter_id, sensor_data in grouped_results.items()
+    if include_series and (resolution_ms or max_points):
+        series = await get_sensor_series_by_patient(
+            patient_id,
+            db,
+            encounter_id,
+            min_time,
+            max_time,
+            excluded_sensor_types,
+            resolution_ms=resolution_ms,
+            max_points=max_points,
+        )
+    elif include_series:
+        # The statistics still come from the summary: downsampled ranges return
+        # one point per bucket here, but count every reading it represents there.
+        query = build_sensor_data_query(
+            patient_id, db, encounter_id, min_time, max_time, excluded_sensor_types
+        )
+        series = group_sensor_columns(load_sensor_columns(query.all()))
+
+    if not include_series:
+        return grouped_results
+
+    # New dicts: the summary and the series may be shared cached results
+    return {
+        encounter: {
+            sensor_type: {
+                **group,
+                **{
+                    name: points
+                    for name, points in series[encounter][sensor_type].items()
+                    if name in ("values", "timestamps", "min_values", "max_values")
+                },
+            }
+            for sensor_type, group in sensor_data.items()
+        }
+        for encounter, sensor_data in grouped_results.items()
     }
+
+
+@cached_report
+async def get_sensor_summary_by_patient(
+    patient_id: str,
+    db,
+    encounter_id: Optional[str] = None,
+    min_time: Optional[datetime] = None,
+    max_time: Optional[datetime] = None,
+    excluded_sensor_types: Optional[List[str]] = None,
+):
+    """
+    Fetch the summary of each encounter and sensor type, aggregated in SQL.
+
+    Returns:
+        dict: {encounter_id: {sensor_type: group}} with "min", "max", "avg",
+        "count", "start" and "end" (epoch milliseconds), like `group_sensor_columns`
+        but without the "values" and "timestamps" arrays.
+    """
+    query = db.query(
+        sensor_encounter_id,
+        sensor_type_name.label("sensor_type"),
+        sensor_min.label("min_value"),
+        sensor_max.label("max_value"),
+        sensor_avg.label("avg_value"),
+        sensor_count.label("count"),
+        func.min(sensor_timestamp_ms).label("start_time"),
+        func.max(sensor_timestamp_ms).label("end_time"),
+    )
+    query = filter_sensor_data_query(
+        query, patient_id, encounter_id, min_time, max_time, excluded_sensor_types
+    )
+    query = query.group_by(sensor_encounter_id, sensor_type_name)
+
+    grouped_results = {}
+    for record in query.all():
+        grouped_results.setdefault(record.encounter_id, {})[record.sensor_type] = {
+            "min": float(record.min_value),
+            "max": float(record.max_value),
+            "avg": float(record.avg_value),
+            "count": int(record.count),
+            "start": int(record.start_time),
+            "end": int(record.end_time),
+        }
     return grouped_results
 
 
+async def get_sensor_series_by_patient(
+    patient_id: str,
+    db,
+    encounter_id: Optional[str] = None,
+    min_time: Optional[datetime] = None,
+    max_time: Optional[datetime] = None,
+    excluded_sensor_types: Optional[List[str]] = None,
+    resolution_ms: Optional[int] = None,
+    max_points: Optional[int] = None,
+):
+    """
+    Fetch the time series of each encounter and sensor type aggregated into time
+    buckets by the database, so at most one row per bucket leaves it.
+
+    The bucket of a reading is the integer division of its epoch milliseconds by
+    `resolution_ms`. With `max_points` instead, the span of each encounter and sensor
+    type is split into `max_points` equal buckets.
+
+    Args:
+        resolution_ms (Optional[int]): Bucket width in milliseconds.
+        max_points (Optional[int]): Maximum number of buckets per series, used when
+            `resolution_ms` is not given.
+
+    Returns:
+        dict: {encounter_id: {sensor_type: series}} where each series holds the
+        "values" (average), "min_values", "max_values" and "timestamps" (first
+        reading of the bucket, epoch milliseconds) arrays.
+    """
+    query = db.query(
+        sensor_encounter_id,
+        sensor_type_name.label("sensor_type"),
+        sensor_avg.label("value"),
+        func.min(sensor_timestamp_ms).label("timestamp_ms"),
+        sensor_min.label("min_value"),
+        sensor_max.label("max_value"),
+    )
+    query = filter_sensor_data_query(
+        query, patient_id, encounter_id, min_time, max_time, excluded_sensor_types
+    )
+
+    if resolution_ms:
+        bucket = sensor_timestamp_ms // resolution_ms
+    elif max_points:
+        bounds = filter_sensor_data_query(
+            db.query(
+                sensor_encounter_id,
+                sensor_type_name.label("sensor_type"),
+                func.min(sensor_timestamp_ms).label("start_time"),
+                func.max(sensor_timestamp_ms).label("end_time"),
+            ),
+            patient_id,
+            encounter_id,
+            min_time,
+            max_time,
+            excluded_sensor_types,
+        )
+        bounds = bounds.group_by(sensor_encounter_id, sensor_type_name).subquery()
+        bucket = ((sensor_timestamp_ms - bounds.c.start_time) * max_points) // (
+            bounds.c.end_time - bounds.c.start_time + 1
+        )
+        query = query.join(
+            bounds,
+            and_(
+                sensor_encounter_id == bounds.c.encounter_id,
+                sensor_type_name == bounds.c.sensor_type,
+            ),
+        )
+    else:
+        raise ValueError("Either 'resolution_ms' or 'max_points' is required.")
+
+    query = query.group_by(sensor_encounter_id, sensor_type_name, bucket)
+
+    columns = load_sensor_columns(
+        query.all(), extra_columns=("min_values", "max_values")
+    )
+    return {
+        encounter: {
+            sensor_type: {
+                "values": group["values"],
+                "min_values": group["min_values"],
+                "max_values": group["max_values"],
+                "timestamps": group["timestamps"],
+            }
+            for sensor_type, group in sensor_data.items()
+        }
+        for encounter, sensor_data in group_sensor_columns(columns).items()
+    }
+
+
 async def get_sensor_data_by_patient_and_sensor(
     patient_id: str,
     db,
@@ -391,74 +813,32 @@ async def get_sensor_data_by_patient_and_sensor(
         encounter_id (Optional[List[str]]): List of encounter IDs to filter by.
 
     Returns:
-        dict: Grouped sensor data by encounter and sensor type.
+        dict: Groups by encounter and sensor type as returned by `group_sensor_columns`.
     """
     if not required_sensor_type:
         raise ValueError("The 'required_sensor_type' parameter is required.")
 
     # Query to get values and timestamps for each sensor type
     query = db.query(
-        SensorData.encounter_id,
-        SensorData.sensor_type,
-        SensorData.value,
-        SensorData.timestamp_epoch,
-        SensorData.timestamp_millis,
-    ).filter(SensorData.patient_id == patient_id)
+        sensor_encounter_id,
+        sensor_type_name.label("sensor_type"),
+        sensor_value,
+        sensor_timestamp_ms.label("timestamp_ms"),
+    )
+    query = filter_sensor_data_query(query, patient_id)
 
     if encounter_id:
-        query = query.filter(SensorData.encounter_id.in_(encounter_id))
+        query = query.filter(sensor_encounter_id.in_(encounter_id))
 
     # Filter by the required sensor type
-    query = query.filter(SensorData.sensor_type == required_sensor_type)
+    query = query.filter(sensor_type_name == required_sensor_type)
 
     query_result = query.all()
 
-    grouped_results = defaultdict(
-        lambda: defaultdict(lambda: {"values": [], "timestamps": []})
-    )
-    for record in query_result:
-        encounter_id = record.encounter_id
-        sensor_type = record.sensor_type
-        value = record.value
-        timestamp = datetime.fromtimestamp(
-            record.timestamp_epoch + record.timestamp_millis / 1000.0
-        )
-
-        grouped_results[encounter_id][sensor_type]["values"].append(value)
-        grouped_results[encounter_id][sensor_type]["timestamps"].append(timestamp)
-
-    # Calculate min, max, and avg for each sensor type within each encounter_id
-    for encounter_id, sensor_data in grouped_results.items():
-        for sensor_type, data in sensor_data.items():
-            values = data["values"]
-            if values:
-                data["min"] = min(values)
-                data["max"] = max(values)
-                data["avg"] = statistics.mean(values)
-                data["count"] = len(values)
-                data["start"] = min(data["timestamps"])
-                data["end"] = max(data["timestamps"])
-                data["duration"] = str(data["end"] - data["start"]).split(".")[0]
-
-                # Convert start and end to datetime objects if they are not already
-                if isinstance(data["start"], str):
-                    data["start"] = datetime.strptime(data["start"], "%H:%M:%S")
-                if isinstance(data["end"], str):
-                    data["end"] = datetime.strptime(data["end"], "%H:%M:%S")
-
-                data["start_str"] = data["start"].strftime("%H:%M:%S")
-                data["end_str"] = data["end"].strftime("%H:%M:%S")
-                data["timestamp_epoch"] = int(data["start"].timestamp())
-                data["day"] = data["start"].strftime("%d-%m-%Y")
-
-    # Format the results to return
-    grouped_results = {
-        encounter_id: dict(sensor_data)
-        for encounter_id, sensor_data in grouped_results.items()
-    }
-    return grouped_results
+    return group_sensor_columns(load_sensor_columns(query_result))
 
 
+@cached_report
 async def get_historical_sensor_summary_by_patient(
     patient_id: str,
     db,
@@ -469,6 +849,9 @@ async def get_historical_sensor_summary_by_patient(
     Obtiene un resumen histórico general de los valores más relevantes de cada sensor para un paciente.
     Opcionalmente filtra por un rango de fechas.
 
+    En los rangos que la política de retención ya agregó, la mediana y la desviación
+    estándar se calculan sobre el promedio de cada intervalo.
+
     Args:
         patient_id (str): El ID del paciente.
         db: La sesión de la base de datos.
@@ -480,26 +863,22 @@ async def get_historical_sensor_summary_by_patient(
     """
     # Query para obtener los datos de los sensores
     query = db.query(
-        SensorData.sensor_type,
-        func.min(SensorData.value).label("min_value"),
-        func.max(SensorData.value).label("max_value"),
-        func.avg(SensorData.value).label("avg_value"),
-        func.stddev(SensorData.value).label("stddev_value"),
-        func.percentile_cont(0.5).within_group(SensorData.value).label("median_value"),
-        func.count(SensorData.value).label("count"),
-    ).filter(SensorData.patient_id == patient_id)
+        sensor_type_name.label("sensor_type"),
+        sensor_min.label("min_value"),
+        sensor_max.label("max_value"),
+        sensor_avg.label("avg_value"),
+        func.stddev(sensor_value).label("stddev_value"),
+        func.percentile_cont(0.5).within_group(sensor_value).label("median_value"),
+        sensor_count.label("count"),
+    )
 
     # Aplicar filtros de tiempo si se proporcionan
-    if min_time:
-        min_timestamp = int(min_time.timestamp())
-        query = query.filter(SensorData.timestamp_epoch >= min_timestamp)
-
-    if max_time:
-        max_timestamp = int(max_time.timestamp())
-        query = query.filter(SensorData.timestamp_epoch <= max_timestamp)
+    query = filter_sensor_data_query(
+        query, patient_id, min_time=min_time, max_time=max_time
+    )
 
     # Agrupar por tipo de sensor
-    query = query.group_by(SensorData.sensor_type)
+    query = query.group_by(sensor_type_name)
 
     # Ejecutar la consulta
     query_result = query.all()
@@ -528,6 +907,7 @@ async def get_historical_sensor_summary_by_patient(
     return summary_results
 
 
+@cached_report
 async def get_sensor_progress_over_time(
     patient_id: str,
     db,
@@ -547,15 +927,15 @@ async def get_sensor_progress_over_time(
     # Definir la agrupación temporal
     if time_grouping == "week":
         time_format = func.date_trunc(
-            "week", func.to_timestamp(SensorData.timestamp_epoch)
+            "week", func.to_timestamp(sensor_timestamp_ms / 1000.0)
         )
     elif time_grouping == "month":
         time_format = func.date_trunc(
-            "month", func.to_timestamp(SensorData.timestamp_epoch)
+            "month", func.to_timestamp(sensor_timestamp_ms / 1000.0)
         )
     elif time_grouping == "day":
         time_format = func.date_trunc(
-            "day", func.to_timestamp(SensorData.timestamp_epoch)
+            "day", func.to_timestamp(sensor_timestamp_ms / 1000.0)
         )
     else:
         raise ValueError(
@@ -565,15 +945,16 @@ async def get_sensor_progress_over_time(
     # Query para obtener los datos de los sensores
     query = db.query(
         time_format.label("time_period"),
-        SensorData.sensor_type,
-        func.min(SensorData.value).label("min_value"),
-        func.max(SensorData.value).label("max_value"),
-        func.avg(SensorData.value).label("avg_value"),
-        func.percentile_cont(0.5).within_group(SensorData.value).label("median_value"),
-    ).filter(SensorData.patient_id == patient_id)
+        sensor_type_name.label("sensor_type"),
+        sensor_min.label("min_value"),
+        sensor_max.label("max_value"),
+        sensor_avg.label("avg_value"),
+        func.percentile_cont(0.5).within_group(sensor_value).label("median_value"),
+    )
+    query = filter_sensor_data_query(query, patient_id)
 
     # Agrupar por período de tiempo y tipo de sensor
-    query = query.group_by(time_format, SensorData.sensor_type)
+    query = query.group_by(time_format, sensor_type_name)
 
     # Ejecutar la consulta
     query_result = query.all()
@@ -589,14 +970,15 @@ async def get_sensor_progress_over_time(
         progress_results[sensor_type]["avg_values"].append(record.avg_value)
         progress_results[sensor_type]["median_values"].append(record.median_value)
 
-    return progress_results
+    return {
+        sensor_type: dict(progress)
+        for sensor_type, progress in progress_results.items()
+    }
 
 
 async def fetch_and_group_questionnaire_responses(params, token):
-    data = await fetch_resources("QuestionnaireResponse", params, token)
-    all_responses = [item["resource"] for item in data.get("entry", [])]
     grouped = defaultdict(list)
-    for resp in all_responses:
+    async for resp in iter_resources("QuestionnaireResponse", params, token):
         qid = resp.get("questionnaire", "")
         if "/" in qid:
             qid = qid.split("/")[-1]
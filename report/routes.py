@@ -1,24 +1,36 @@
+import asyncio
 from calendar import monthrange
 from datetime import datetime, timedelta
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlmodel import Session
 from typing import Annotated, List, Literal, Optional
 import io
 
-from auth import isAuthorized as Authorized, isAuthorizedToken as AuthorizedToken
+from auth import decode_token, isAuthorized as Authorized, isAuthorizedToken as AuthorizedToken
 
 
 from database import get_session
+from http_cache import etag_matches, make_etag, not_modified
+from sensor_channels import get_sensor_watermark
+from sensor_cursor import CURSOR_HEADER, decode_cursor, get_sensor_cursor
 
 
 from report.report_utils import (
     fetch_and_group_questionnaire_responses,
     get_sensor_data_by_patient,
     get_sensor_data_by_patient_and_sensor,
+    get_sensor_data_since,
     get_historical_sensor_summary_by_patient,
     get_sensor_progress_over_time,
+    stream_sensor_data_by_patient,
+)
+from report.sensor_columns import format_sensor_groups
+from report.sensor_export import (
+    EXPORT_FORMATS,
+    export_requires_pyarrow,
+    stream_sensor_export,
 )
 
 
@@ -30,21 +42,43 @@ from typing import Annotated, List, Optional
 import io
 
 from auth import isAuthorized as Authorized, isAuthorizedToken as AuthorizedToken
-from database import get_session
+from database import get_read_session, get_session, open_read_session
 from report.report_utils import (
     generate_pdf_to_byte_array,
     get_sensor_data_by_patient,
+    iter_pdf_chunks,
+    require_pdf,
+)
+from utils import (
+    fetch_resource,
+    fetch_all_resources,
+    batch_resource,
+    fetch_resources_batch,
+    iter_resources,
+    parse_patient_info,
 )
-from utils import fetch_resource, fetch_resources, parse_patient_info
 from report.report_generators.general_report import general_report
 from report.report_generators.patient_report import patient_report
 from report.report_generators.observation_report import observation_report
 from report.report_generators.medication_report import medication_report
 from report.report_generators.condition_report import condition_report
-from report.report_generators.sensor_report import sensor_report
+from report.report_generators.sensor_report import (
+    SENSOR_REPORT_BUCKETS,
+    render_sensor_report_pdf,
+)
 from report.report_generators.questionnaire_report import (
-    generate_all_questionnaire_progress_html,
-    questionnaire_report,
+    fetch_questionnaires,
+    render_questionnaire_progress_pdf,
+    render_questionnaire_report_pdf,
+)
+from report.fetch_planner import describe_fetch_error, run_fetch_plan
+from report.render_pool import run_render_job
+from report.report_jobs import (
+    JOB_DONE,
+    create_job,
+    job_path,
+    job_status,
+    load_job,
 )
 
 
@@ -53,6 +87,7 @@ from report.report_generators.general_report import general_report
 router = APIRouter(prefix="/report", tags=["report"])
 
 db_dependency = Annotated[Session, Depends(get_session)]
+read_db_dependency = Annotated[Session, Depends(get_read_session)]
 isAuthorized = Annotated[Authorized, Depends(Authorized)]
 isAuthorizedToken = Annotated[AuthorizedToken, Depends(AuthorizedToken)]
 
@@ -90,15 +125,7 @@ def build_date_params(
     return date_params
 
 
-@router.get(
-    "/{patient_id}",
-    summary="Generate a patient report",
-    description="Generates a report for a patient based on various parameters.",
-)
-async def generate_patient_report(
-    patient_id: str,
-    token: isAuthorizedToken,  # type: ignore
-    db: db_dependency,
+def patient_report_options(
     clinic: bool = Query(False, description="Include ClinicalImpression (Evolución)"),
     med: bool = Query(False, description="Include medications"),
     cond: bool = Query(False, description="Include conditions"),
@@ -128,137 +155,308 @@ async def generate_patient_report(
         True, description="Include line chart in the report"
     ),
 ):
-    try:
-        print(
-            f"params: {patient_id=}, {clinic=}, {med=}, {cond=}, {questionnaire=}, {sensor=}, {excluded_sensor_types=}, {encounter_id=}, {start=}, {end=}, {date_filter=}"
-        )
-        print(f"Generating report for patient_id: {patient_id}")
+    """Query parameters of the patient report, shared by the direct and job routes."""
+    return {
+        "clinic": clinic,
+        "med": med,
+        "cond": cond,
+        "questionnaire": questionnaire,
+        "sensor": sensor,
+        "excluded_sensor_types": excluded_sensor_types,
+        "encounter_id": encounter_id,
+        "start": start,
+        "end": end,
+        "date_filter": date_filter,
+        "include_bar_chart": include_bar_chart,
+        "include_line_chart": include_line_chart,
+    }
 
-        patient = await fetch_resource("Patient", patient_id, token)
 
-        print(f"Fetched patient data: {patient.get('id')}")
+report_options_dependency = Annotated[dict, Depends(patient_report_options)]
 
-        observations_data = None
-        medication_data = []
-        sensor_data = []
-        condition_data = []
-        clinical_impression_data = []
-        questionnaire_data = None
+# Header listing the sections left out of a report because their fetch failed
+MISSING_SECTIONS_HEADER = "X-Report-Missing-Sections"
 
-        params = {"patient": patient_id}
 
-        now = datetime.now()
-        if date_filter == "week":
-            start = now - timedelta(days=7)
-            end = now
-        elif date_filter == "month":
-            # Primer día del mes actual
-            start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            # Último día del mes actual
-            last_day = monthrange(now.year, now.month)[1]
-            end = now.replace(
-                day=last_day, hour=23, minute=59, second=59, microsecond=999999
-            )
-        elif date_filter == "all" or date_filter == "session":
-            start = None
-            end = None
-        elif date_filter == "range":
-            # Usa los valores de start y end proporcionados por el usuario
-            pass
-
-        date_params = {}
-
-        if encounter_id:
-            params["encounter"] = encounter_id
-
-        if clinic:
-            # data = await fetch_resources("Observation", params, token)
-            # observations_data = [item["resource"] for item in data.get("entry", [])]
-            date_params = build_date_params("ClinicalImpression", start, end)
-            data = await fetch_resources(
-                "ClinicalImpression", {"patient": patient_id, **date_params}, token
-            )
-            clinical_impression_data = [
-                item["resource"] for item in data.get("entry", [])
-            ]
-            print("data: clinical", data)
-            print(f"Fetched clinicalimpresion data")
-
-        if cond:
-            date_params = build_date_params("Condition", start, end)
-            data = await fetch_resources("Condition", {**params, **date_params}, token)
-            condition_data = [item["resource"] for item in data.get("entry", [])]
-            print(f"Fetched condition data")
-
-        if sensor:
-            # TODO: hacer una get sensor_data para sólo un encuentro (que muestre los datos de ese sensor y no sólo el promedio)
-            # sensor_data = await get_sensor_data(patient_id, db, encounter_id)
-            sensor_data = await get_sensor_data_by_patient(
-                patient_id, db, encounter_id, start, end, excluded_sensor_types
-            )
-            print(f"Fetched sensor data, length: {len(sensor_data)}")
+async def build_patient_report(
+    patient_id: str,
+    token: str,
+    clinic: bool = False,
+    med: bool = False,
+    cond: bool = False,
+    questionnaire: bool = False,
+    sensor: bool = False,
+    excluded_sensor_types: Optional[List[str]] = None,
+    encounter_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    date_filter: Optional[str] = "all",
+    include_bar_chart: Optional[bool] = True,
+    include_line_chart: Optional[bool] = True,
+    on_progress=None,
+):
+    """
+    Fetches the requested sections of a patient concurrently and renders the report.
+    A section that fails to load is left out of the report; only a failure to load
+    the patient itself aborts it.
+
+    Args:
+        on_progress: Optional callback `on_progress(fraction, step)` called as the
+            fetches complete and before rendering.
+
+    Returns:
+        tuple: The PDF bytes, the filename of the report and the errors of the
+            sections left out, as {section: message}.
+    """
+    print(
+        f"params: {patient_id=}, {clinic=}, {med=}, {cond=}, {questionnaire=}, {sensor=}, {excluded_sensor_types=}, {encounter_id=}, {start=}, {end=}, {date_filter=}"
+    )
+    print(f"Generating report for patient_id: {patient_id}")
+
+    params = {"patient": patient_id}
+
+    now = datetime.now()
+    if date_filter == "week":
+        start = now - timedelta(days=7)
+        end = now
+    elif date_filter == "month":
+        # Primer día del mes actual
+        start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        # Último día del mes actual
+        last_day = monthrange(now.year, now.month)[1]
+        end = now.replace(
+            day=last_day, hour=23, minute=59, second=59, microsecond=999999
+        )
+    elif date_filter == "all" or date_filter == "session":
+        start = None
+        end = None
+    elif date_filter == "range":
+        # Usa los valores de start y end proporcionados por el usuario
+        pass
+
+    if encounter_id:
+        params["encounter"] = encounter_id
+
+    async def fetch_entries(resource_type, search_params):
+        date_params = build_date_params(resource_type, start, end)
+        return await fetch_all_resources(
+            resource_type, {**search_params, **date_params}, token
+        )
 
-        if med and not encounter_id:
-            date_params = build_date_params("MedicationStatement", start, end)
-            data = await fetch_resources(
-                "MedicationStatement", {**params, **date_params}, token
-            )
-            medication_data = [item["resource"] for item in data.get("entry", [])]
-            print(f"Fetched medication data: {medication_data}")
-
-        if questionnaire:
-            date_params = build_date_params("QuestionnaireResponse", start, end)
-            print(f"date_params for questionnaire={date_params}")
-            questionnaire_data = await fetch_and_group_questionnaire_responses(
-                params={**params, **date_params}, token=token
-            )
+    async def fetch_questionnaire_data():
+        date_params = build_date_params("QuestionnaireResponse", start, end)
+        return await fetch_and_group_questionnaire_responses(
+            params={**params, **date_params}, token=token
+        )
 
-            print(f"Fetched questionnaire progress data")
-
-        pdf_file = await general_report(
-            patient_data=patient,
-            clinical_impression_data_array=clinical_impression_data,
-            observation_data_array=observations_data,
-            sensor_data=sensor_data,
-            medication_data_array=medication_data,
-            condition_data_array=condition_data,
-            questionnaire_data=questionnaire_data,
-            token=token,
-            include_bar_chart=include_bar_chart,
-            include_line_chart=include_line_chart,
+    def read_sensor_data():
+        # TODO: hacer una get sensor_data para sólo un encuentro (que muestre los datos de ese sensor y no sólo el promedio)
+        # Runs in a worker thread with its own event loop and session (a Session
+        # must not be shared between threads)
+        db = open_read_session()
+        try:
+            return asyncio.run(
+                get_sensor_data_by_patient(
+                    patient_id,
+                    db,
+                    encounter_id,
+                    start,
+                    end,
+                    excluded_sensor_types,
+                    include_series=True,
+                    max_points=SENSOR_REPORT_BUCKETS,
+                )
+            )
+        finally:
+            db.close()
+
+    async def fetch_sensor_data():
+        # The sensor queries are synchronous; in a thread they do not block the
+        # event loop while the FHIR requests are in flight
+        return await asyncio.to_thread(read_sensor_data)
+
+    # Plan de consultas según los filtros
+    plan = {"patient": lambda: fetch_resource("Patient", patient_id, token)}
+    if clinic:
+        plan["clinic"] = lambda: fetch_entries(
+            "ClinicalImpression", {"patient": patient_id}
         )
+    if cond:
+        plan["cond"] = lambda: fetch_entries("Condition", params)
+    if med and not encounter_id:
+        plan["med"] = lambda: fetch_entries("MedicationStatement", params)
+    if questionnaire:
+        plan["questionnaire"] = fetch_questionnaire_data
+    if sensor:
+        plan["sensor"] = fetch_sensor_data
+
+    completed = []
+
+    def on_complete(section):
+        completed.append(section)
+        if on_progress:
+            on_progress(len(completed) / (len(plan) + 1), "fetch")
+
+    results, fetch_errors = await run_fetch_plan(plan, on_complete=on_complete)
+    if "patient" in fetch_errors:
+        raise fetch_errors["patient"]
+
+    patient = results["patient"]
+    errors = {
+        section: describe_fetch_error(error) for section, error in fetch_errors.items()
+    }
+    print(f"Fetched report data: {sorted(results)}, errors: {sorted(errors)}")
+
+    observations_data = None
+    clinical_impression_data = results.get("clinic", [])
+    condition_data = results.get("cond", [])
+    medication_data = results.get("med", [])
+    questionnaire_data = results.get("questionnaire")
+    sensor_data = results.get("sensor", [])
+
+    if on_progress:
+        on_progress(len(plan) / (len(plan) + 1), "render")
+    pdf_file = await general_report(
+        patient_data=patient,
+        clinical_impression_data_array=clinical_impression_data,
+        observation_data_array=observations_data,
+        sensor_data=sensor_data,
+        medication_data_array=medication_data,
+        condition_data_array=condition_data,
+        questionnaire_data=questionnaire_data,
+        token=token,
+        include_bar_chart=include_bar_chart,
+        include_line_chart=include_line_chart,
+    )
+    require_pdf(pdf_file)
 
-        print("Generated PDF report")
+    print("Generated PDF report")
 
-        patient_info = parse_patient_info(patient)
-        patient_name = patient_info.get("Name").replace(" ", "_")
-        patient_rut = patient_info.get("RUT")
+    patient_info = parse_patient_info(patient)
+    patient_name = patient_info.get("Name").replace(" ", "_")
+    patient_rut = patient_info.get("RUT")
 
-        # patient_data = await fetch_resource("Patient", patient_id, token)
-        # return parse_patient_info(patient)
-        # print(patient)
-        # pdf_file = generate_pdf_report(
-        #    patient_data=patient,
-        #    observation_data_array=observations_data,
-        #    sensor_data=sensor_data,
-        #    medication_data_array=medication_data,
-        #    condition_data_array=condition_data,
-        # )
-        # report = generate_report_user(patient)
+    # patient_data = await fetch_resource("Patient", patient_id, token)
+    # return parse_patient_info(patient)
+    # print(patient)
+    # pdf_file = generate_pdf_report(
+    #    patient_data=patient,
+    #    observation_data_array=observations_data,
+    #    sensor_data=sensor_data,
+    #    medication_data_array=medication_data,
+    #    condition_data_array=condition_data,
+    # )
+    # report = generate_report_user(patient)
 
+    return pdf_file, f"{patient_rut}_{patient_name}_reporte.pdf", errors
+
+
+@router.get(
+    "/{patient_id}",
+    summary="Generate a patient report",
+    description="Generates a report for a patient based on various parameters.",
+)
+async def generate_patient_report(
+    patient_id: str,
+    token: isAuthorizedToken,  # type: ignore
+    options: report_options_dependency,
+):
+    try:
+        pdf_file, filename, errors = await build_patient_report(
+            patient_id, token, **options
+        )
+        headers = {"Content-Disposition": f"attachment; filename={filename}"}
+        if errors:
+            headers[MISSING_SECTIONS_HEADER] = ",".join(errors)
         return StreamingResponse(
-            io.BytesIO(pdf_file),
+            iter_pdf_chunks(pdf_file),
             media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename={patient_rut}_{patient_name}_reporte.pdf"
-            },
+            headers=headers,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating report for patient_id {patient_id}: {e}")
 
         raise HTTPException(status_code=500, detail="Error al generar el reporte")
 
 
+async def get_job_owner(token: str) -> str:
+    """
+    Returns the subject of a token, which owns the report jobs it creates.
+
+    Raises:
+        HTTPException: 403 if the token has no subject (e.g. tokens built with
+            generate_token_with_payload); they would all share the same jobs.
+    """
+    payload = await decode_token(token)
+    owner = payload.get("sub")
+    if not owner:
+        raise HTTPException(
+            status_code=403, detail="Report jobs require a token with a subject"
+        )
+    return owner
+
+
+def get_owned_job(job_id: str, owner: str) -> dict:
+    job = load_job(job_id)
+    # Other users' jobs are reported as missing, not as forbidden
+    if job is None or job["owner"] != owner:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job
+
+
+@router.post(
+    "/jobs/{patient_id}",
+    status_code=202,
+    summary="Queue a patient report",
+    description="Generates the report of GET /report/{patient_id} in the background. "
+    "Poll GET /report/jobs/{job_id} and download the PDF from "
+    "GET /report/jobs/{job_id}/download once its status is 'done'.",
+)
+async def create_patient_report_job(
+    patient_id: str,
+    token: isAuthorizedToken,  # type: ignore
+    options: report_options_dependency,
+):
+    owner = await get_job_owner(token)
+
+    async def body(on_progress):
+        return await build_patient_report(
+            patient_id, token, **options, on_progress=on_progress
+        )
+
+    job = create_job(owner, body)
+    return job_status(job)
+
+
+@router.get("/jobs/{job_id}", summary="Get the status of a report job")
+async def get_report_job(
+    job_id: str,
+    token: isAuthorizedToken,  # type: ignore
+):
+    job = get_owned_job(job_id, await get_job_owner(token))
+    return job_status(job)
+
+
+@router.get("/jobs/{job_id}/download", summary="Download the result of a report job")
+async def download_report_job(
+    job_id: str,
+    token: isAuthorizedToken,  # type: ignore
+):
+    job = get_owned_job(job_id, await get_job_owner(token))
+    if job["status"] != JOB_DONE:
+        raise HTTPException(
+            status_code=409, detail=f"Report job is {job['status']}, not done"
+        )
+
+    return FileResponse(
+        job_path(job_id, "pdf"),
+        media_type="application/pdf",
+        filename=job["filename"],
+    )
+
+
 @router.get("/{patient_id}/observations", summary="Generate an observation report")
 async def generate_observation_report(
     patient_id: str,
@@ -266,25 +464,29 @@ async def generate_observation_report(
 ):
     try:
         patient = await fetch_resource("Patient", patient_id, token)
-        data = await fetch_resources("Observation", {"patient": patient_id}, token)
-        observations_data = [item["resource"] for item in data.get("entry", [])]
+        observations_data = await fetch_all_resources(
+            "Observation", {"patient": patient_id}, token
+        )
 
         # Generate the observation report
         html_data = patient_report(patient)
         html_data += observation_report(observations_data)
-        pdf_file = generate_pdf_to_byte_array(html_data)
+        pdf_file = await run_render_job(generate_pdf_to_byte_array, html_data)
+        require_pdf(pdf_file)
 
         patient_info = parse_patient_info(patient)
         patient_name = patient_info.get("Name").replace(" ", "_")
         patient_rut = patient_info.get("RUT")
 
         return StreamingResponse(
-            io.BytesIO(pdf_file),
+            iter_pdf_chunks(pdf_file),
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f"attachment; filename={patient_rut}_{patient_name}_observations_report.pdf"
             },
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating observation report for patient_id {patient_id}: {e}")
         raise HTTPException(status_code=500, detail="Error al generar el reporte")
@@ -297,27 +499,29 @@ async def generate_medication_report(
 ):
     try:
         patient = await fetch_resource("Patient", patient_id, token)
-        data = await fetch_resources(
+        medication_data = await fetch_all_resources(
             "MedicationStatement", {"patient": patient_id}, token
         )
-        medication_data = [item["resource"] for item in data.get("entry", [])]
 
         # Generate the medication report
         html_data = patient_report(patient)
         html_data += medication_report(medication_data)
-        pdf_file = generate_pdf_to_byte_array(html_data)
+        pdf_file = await run_render_job(generate_pdf_to_byte_array, html_data)
+        require_pdf(pdf_file)
 
         patient_info = parse_patient_info(patient)
         patient_name = patient_info.get("Name").replace(" ", "_")
         patient_rut = patient_info.get("RUT")
 
         return StreamingResponse(
-            io.BytesIO(pdf_file),
+            iter_pdf_chunks(pdf_file),
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f"attachment; filename={patient_rut}_{patient_name}_medication_report.pdf"
             },
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating medication report for patient_id {patient_id}: {e}")
         raise HTTPException(status_code=500, detail="Error al generar el reporte")
@@ -330,25 +534,29 @@ async def generate_condition_report(
 ):
     try:
         patient = await fetch_resource("Patient", patient_id, token)
-        data = await fetch_resources("Condition", {"patient": patient_id}, token)
-        condition_data = [item["resource"] for item in data.get("entry", [])]
+        condition_data = await fetch_all_resources(
+            "Condition", {"patient": patient_id}, token
+        )
 
         # Generate the condition report
         html_data = patient_report(patient)
         html_data += condition_report(condition_data)
-        pdf_file = generate_pdf_to_byte_array(html_data)
+        pdf_file = await run_render_job(generate_pdf_to_byte_array, html_data)
+        require_pdf(pdf_file)
 
         patient_info = parse_patient_info(patient)
         patient_name = patient_info.get("Name").replace(" ", "_")
         patient_rut = patient_info.get("RUT")
 
         return StreamingResponse(
-            io.BytesIO(pdf_file),
+            iter_pdf_chunks(pdf_file),
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f"attachment; filename={patient_rut}_{patient_name}_conditions_report.pdf"
             },
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating condition report for patient_id {patient_id}: {e}")
         raise HTTPException(status_code=500, detail="Error al generar el reporte")
@@ -358,7 +566,7 @@ async def generate_condition_report(
 async def generate_sensor_report(
     patient_id: str,
     token: isAuthorizedToken,  # type: ignore
-    db: db_dependency,
+    db: read_db_dependency,
     excluded_sensor_types: Optional[List[str]] = Query(
         None, description="Excluded sensor types"
     ),
@@ -373,25 +581,33 @@ async def generate_sensor_report(
     try:
         patient = await fetch_resource("Patient", patient_id, token)
         sensor_data = await get_sensor_data_by_patient(
-            patient_id, db, encounter_id, start, end, excluded_sensor_types
+            patient_id,
+            db,
+            encounter_id,
+            start,
+            end,
+            excluded_sensor_types,
+            include_series=True,
+            max_points=SENSOR_REPORT_BUCKETS,
         )
 
         # Generate the sensor report
-        html_data = patient_report(patient)
-        html_data += sensor_report(sensor_data)
-        pdf_file = generate_pdf_to_byte_array(html_data)
+        pdf_file = await run_render_job(render_sensor_report_pdf, patient, sensor_data)
+        require_pdf(pdf_file)
 
         patient_info = parse_patient_info(patient)
         patient_name = patient_info.get("Name").replace(" ", "_")
         patient_rut = patient_info.get("RUT")
 
         return StreamingResponse(
-            io.BytesIO(pdf_file),
+            iter_pdf_chunks(pdf_file),
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f"attachment; filename={patient_rut}_{patient_name}_sensors_report.pdf"
             },
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating sensor report for patient_id {patient_id}: {e}")
         raise HTTPException(status_code=500, detail="Error al generar el reporte")
@@ -437,27 +653,29 @@ async def generate_questionnaire_report(
         if not questionnaire:
             raise HTTPException(status_code=404, detail="Questionnaire not found")
 
-        html_data = questionnaire_report(
+        pdf_file = await run_render_job(
+            render_questionnaire_report_pdf,
             questionnaire_response=questionnaire_response,
             questionnaire=questionnaire,
             include_bar_chart=include_bar_chart,
             include_pie_chart=include_pie_chart,
             include_line_chart=include_line_chart,
         )
-
-        pdf_file = generate_pdf_to_byte_array(html_data)
+        require_pdf(pdf_file)
 
         questionnaire_name = questionnaire.get("title", "questionnaire").replace(
             " ", "_"
         )
 
         return StreamingResponse(
-            io.BytesIO(pdf_file),
+            iter_pdf_chunks(pdf_file),
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f"attachment; filename={questionnaire_name}_report.pdf"
             },
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(
             f"Error generating questionnaire report for id {questionnaireResponse_id}: {e}"
@@ -474,7 +692,7 @@ async def generate_questionnaire_progress_report(
     patient_id: str,
     questionnaire_id: str,
     token: isAuthorizedToken,  # type: ignore
-    db: db_dependency,
+    db: read_db_dependency,
     include_bar_chart: bool = Query(
         True, description="Include bar chart in the report"
     ),
@@ -483,10 +701,12 @@ async def generate_questionnaire_progress_report(
     ),
 ):
     try:
-        # Fetch the questionnaire
-        questionnaire = await fetch_resource("Questionnaire", questionnaire_id, token)
-        if not questionnaire:
-            raise HTTPException(status_code=404, detail="Questionnaire not found")
+        # Fetch the questionnaire and the patient in a single batch
+        resources = await fetch_resources_batch(
+            [("Questionnaire", questionnaire_id), ("Patient", patient_id)], token
+        )
+        questionnaire = batch_resource(resources, "Questionnaire", questionnaire_id)
+        patient = batch_resource(resources, "Patient", patient_id)
 
         # Fetch all QuestionnaireResponses for the given patient
         # (solo usamos el filtro de patient porque el filtro combinado no funciona)
@@ -494,20 +714,13 @@ async def generate_questionnaire_progress_report(
             "patient": patient_id,
         }
 
-        data = await fetch_resources("QuestionnaireResponse", params, token)
-        all_responses = [item["resource"] for item in data.get("entry", [])]
-
-        if not all_responses:
-            raise HTTPException(
-                status_code=404,
-                detail="No QuestionnaireResponses found for this patient",
-            )
-
-        # Filtrar manualmente por questionnaire_id
+        # Filtrar manualmente por questionnaire_id, página por página
         questionnaire_responses = []
         questionnaire_reference = f"Questionnaire/{questionnaire_id}"
+        total_responses = 0
 
-        for response in all_responses:
+        async for response in iter_resources("QuestionnaireResponse", params, token):
+            total_responses += 1
             response_questionnaire = response.get("questionnaire", "")
             # Algunos sistemas usan URLs completas, otros solo usan referencias relativas
             if (questionnaire_reference in response_questionnaire) or (
@@ -515,6 +728,12 @@ async def generate_questionnaire_progress_report(
             ):
                 questionnaire_responses.append(response)
 
+        if not total_responses:
+            raise HTTPException(
+                status_code=404,
+                detail="No QuestionnaireResponses found for this patient",
+            )
+
         if not questionnaire_responses:
             raise HTTPException(
                 status_code=404,
@@ -522,21 +741,15 @@ async def generate_questionnaire_progress_report(
             )
 
         # Generate the progress report
-        from report.report_generators.questionnaire_report import (
-            questionnaire_progress_report,
+        pdf_file = await run_render_job(
+            render_questionnaire_progress_pdf,
+            [(questionnaire, questionnaire_responses)],
+            include_bar_chart,
+            include_line_chart,
         )
-
-        html_data = questionnaire_progress_report(
-            questionnaire=questionnaire,
-            questionnaire_responses=questionnaire_responses,
-            include_bar_chart=include_bar_chart,
-            include_line_chart=include_line_chart,
-        )
-
-        pdf_file = generate_pdf_to_byte_array(html_data)
+        require_pdf(pdf_file)
 
         # Get patient info for filename
-        patient = await fetch_resource("Patient", patient_id, token)
         patient_info = parse_patient_info(patient)
         patient_name = patient_info.get("Name", "patient").replace(" ", "_")
         patient_rut = patient_info.get("RUT", "")
@@ -546,12 +759,14 @@ async def generate_questionnaire_progress_report(
         )
 
         return StreamingResponse(
-            io.BytesIO(pdf_file),
+            iter_pdf_chunks(pdf_file),
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f"attachment; filename={patient_rut}_{patient_name}_{questionnaire_name}_progress_report.pdf"
             },
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(
             f"Error generating questionnaire progress report for patient {patient_id} and questionnaire {questionnaire_id}: {e}"
@@ -574,7 +789,7 @@ import tempfile
 async def generate_all_questionnaire_progress_reports(
     patient_id: str,
     token: isAuthorizedToken,  # type: ignore
-    db: db_dependency,
+    db: read_db_dependency,
     include_bar_chart: bool = Query(
         True, description="Include bar chart in the report"
     ),
@@ -585,61 +800,39 @@ async def generate_all_questionnaire_progress_reports(
     try:
         # Fetch all QuestionnaireResponses for the patient
         params = {"patient": patient_id}
-        data = await fetch_resources("QuestionnaireResponse", params, token)
-        all_responses = [item["resource"] for item in data.get("entry", [])]
+        grouped = await fetch_and_group_questionnaire_responses(params, token)
 
-        if not all_responses:
+        if not grouped:
             raise HTTPException(
                 status_code=404,
                 detail="No QuestionnaireResponses found for this patient",
             )
 
-        # Group responses by questionnaire
-        from collections import defaultdict
-
-        grouped = defaultdict(list)
-        for resp in all_responses:
-            qid = resp.get("questionnaire", "")
-            # Normalize to just the id
-            if "/" in qid:
-                qid = qid.split("/")[-1]
-            grouped[qid].append(resp)
-
         # Prepare patient info for filenames
         patient = await fetch_resource("Patient", patient_id, token)
         patient_info = parse_patient_info(patient)
         patient_name = patient_info.get("Name", "patient").replace(" ", "_")
         patient_rut = patient_info.get("RUT", "")
 
-        # Concatenate all HTML reports
-        all_html = ""
-        from report.report_generators.questionnaire_report import (
-            questionnaire_progress_report,
-        )
-
-        for qid, responses in grouped.items():
-            questionnaire = await fetch_resource("Questionnaire", qid, token)
-            if not questionnaire:
-                continue
-            html_data = questionnaire_progress_report(
-                questionnaire=questionnaire,
-                questionnaire_responses=responses,
-                include_bar_chart=include_bar_chart,
-                include_line_chart=include_line_chart,
-            )
-            # Add a page break between reports (if your PDF generator supports it)
-            all_html += html_data + '<div style="page-break-after:always"></div>'
-
-        # Generate a single PDF from the concatenated HTML
-        pdf_file = generate_pdf_to_byte_array(all_html)
+        # Generate a single PDF with the reports of every questionnaire
+        questionnaires = await fetch_questionnaires(grouped, token)
+        pdf_file = await run_render_job(
+            render_questionnaire_progress_pdf,
+            questionnaires,
+            include_bar_chart,
+            include_line_chart,
+        )
+        require_pdf(pdf_file)
 
         return StreamingResponse(
-            io.BytesIO(pdf_file),
+            iter_pdf_chunks(pdf_file),
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f"attachment; filename={patient_rut}_{patient_name}_all_questionnaire_progress_report.pdf"
             },
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(
             f"Error generating all questionnaire progress reports for patient {patient_id}: {e}"
@@ -656,14 +849,127 @@ async def generate_all_questionnaire_progress_reports(
 )
 async def get_sensor_data_by_patient_endpoint(
     patient_id: str,
-    db: db_dependency,
+    db: read_db_dependency,
+    request: Request,
+    response: Response,
+    encounter_id: Optional[str] = None,
+    min_time: Optional[datetime] = None,
+    max_time: Optional[datetime] = None,
+    excluded_sensor_types: Optional[List[str]] = Query(None),
+    stream: bool = Query(
+        False,
+        description="Stream raw readings as NDJSON instead of the grouped summary",
+    ),
+    include_series: bool = Query(
+        True,
+        description="Include the values and timestamps arrays; if false only the summary is returned",
+    ),
+    resolution_ms: Optional[int] = Query(
+        None,
+        ge=1,
+        description="Aggregate the series (avg, min, max) into buckets of this many milliseconds",
+    ),
+    max_points: Optional[int] = Query(
+        None,
+        ge=1,
+        le=100000,
+        description="Aggregate each series into at most this many buckets (ignored if resolution_ms is given)",
+    ),
+    since: Optional[str] = Query(
+        None,
+        description=f"Cursor from a previous response (next_cursor or the {CURSOR_HEADER} header); only raw readings stored after it are returned, not those already rolled up by the retention job",
+    ),
+    limit: int = Query(
+        5000, ge=1, le=50000, description="Maximum readings per page when using since"
+    ),
+):
+    # The watermark is read before the data, so a response never carries a tag
+    # newer than its content
+    etag = make_etag(request, get_sensor_watermark(db, patient_id=patient_id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    if since is not None:
+        readings, next_cursor, has_more = await get_sensor_data_since(
+            patient_id,
+            db,
+            decode_cursor(since),
+            encounter_id,
+            min_time,
+            max_time,
+            excluded_sensor_types,
+            limit=limit,
+        )
+        response.headers["ETag"] = etag
+        return {
+            "readings": readings,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        }
+
+    cursor = get_sensor_cursor(db)
+
+    if stream:
+        return StreamingResponse(
+            stream_sensor_data_by_patient(
+                patient_id, encounter_id, min_time, max_time, excluded_sensor_types
+            ),
+            media_type="application/x-ndjson",
+            headers={"ETag": etag, CURSOR_HEADER: cursor},
+        )
+
+    response.headers["ETag"] = etag
+    response.headers[CURSOR_HEADER] = cursor
+
+    sensor_data = await get_sensor_data_by_patient(
+        patient_id,
+        db,
+        encounter_id,
+        min_time,
+        max_time,
+        excluded_sensor_types,
+        include_series=include_series,
+        resolution_ms=resolution_ms,
+        max_points=max_points,
+    )
+    return format_sensor_groups(sensor_data)
+
+
+@router.get(
+    "/export/{patient_id}",
+    summary="Export Sensor Data",
+    description="Stream the sensor readings of a patient, or of one of its encounters, as CSV, Parquet or Arrow IPC.",
+)
+async def export_sensor_data_endpoint(
+    patient_id: str,
+    token: isAuthorizedToken,  # type: ignore
     encounter_id: Optional[str] = None,
     min_time: Optional[datetime] = None,
     max_time: Optional[datetime] = None,
     excluded_sensor_types: Optional[List[str]] = Query(None),
+    format: Literal["csv", "parquet", "arrow"] = Query(
+        "csv", description="File format of the export"
+    ),
 ):
-    return await get_sensor_data_by_patient(
-        patient_id, db, encounter_id, min_time, max_time, excluded_sensor_types
+    if export_requires_pyarrow(format):
+        raise HTTPException(
+            status_code=501,
+            detail=f"The {format} export requires pyarrow, which is not installed",
+        )
+
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"{encounter_id or patient_id}_sensors.{extension}"
+    return StreamingResponse(
+        stream_sensor_export(
+            format,
+            patient_id,
+            encounter_id,
+            min_time,
+            max_time,
+            excluded_sensor_types,
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
 
 
@@ -674,15 +980,16 @@ async def get_sensor_data_by_patient_endpoint(
 )
 async def get_sensor_data_by_patient_and_sensor_endpoint(
     patient_id: str,
-    db: db_dependency,
+    db: read_db_dependency,
     required_sensor_type: str = Query(..., description="The required sensor type."),
 ):
     try:
-        return await get_sensor_data_by_patient_and_sensor(
+        sensor_data = await get_sensor_data_by_patient_and_sensor(
             patient_id=patient_id,
             db=db,
             required_sensor_type=required_sensor_type,
         )
+        return format_sensor_groups(sensor_data)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error fetching sensor data: {str(e)}"
@@ -696,13 +1003,21 @@ async def get_sensor_data_by_patient_and_sensor_endpoint(
 )
 async def get_historical_sensor_summary_by_patient_endpoint(
     patient_id: str,
-    db: db_dependency,
+    db: read_db_dependency,
+    request: Request,
+    response: Response,
     days: Optional[int] = Query(
         7, description="Number of days to look back from today"
     ),
 ):
+    # Window aligned to the minute so repeated requests share a cache entry
+    today = datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=1)
+    etag = make_etag(request, get_sensor_watermark(db, patient_id=patient_id), today)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
     try:
-        today = datetime.now()
         return await get_historical_sensor_summary_by_patient(
             patient_id=patient_id,
             db=db,
@@ -723,12 +1038,19 @@ async def get_historical_sensor_summary_by_patient_endpoint(
 )
 async def get_sensor_progress_over_time_endpoint(
     patient_id: str,
-    db: db_dependency,
+    db: read_db_dependency,
+    request: Request,
+    response: Response,
     time_grouping: Literal["day", "week", "month"] = Query(
         "week",
         description="Time grouping for progress (e.g., 'day', 'week', 'month').",
     ),
 ):
+    etag = make_etag(request, get_sensor_watermark(db, patient_id=patient_id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
     try:
         return await get_sensor_progress_over_time(
             patient_id=patient_id,
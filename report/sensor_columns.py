@@ -0,0 +1,267 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Granularity at which local UTC offsets are looked up when converting timestamps
+OFFSET_SLOT_MS = 15 * 60 * 1000
+
+
+def factorize(labels):
+    """
+    Encodes a sequence of labels as integer codes.
+
+    Args:
+        labels (Sequence[str]): The labels to encode.
+
+    Returns:
+        tuple: (codes as an int32 array, list of categories indexed by code).
+    """
+    lookup = {}
+    codes = np.fromiter(
+        (lookup.setdefault(label, len(lookup)) for label in labels),
+        dtype=np.int32,
+        count=len(labels),
+    )
+    return codes, list(lookup)
+
+
+def load_sensor_columns(rows, extra_columns=()):
+    """
+    Loads raw sensor rows into NumPy columns.
+
+    Args:
+        rows (list): Rows of (encounter_id, sensor_type, value, timestamp_ms, *extra).
+        extra_columns (tuple): Names of the additional float columns after
+            timestamp_ms, if any.
+
+    Returns:
+        dict: Columns "encounter", "sensor_type" (int32 codes), "value" (float64),
+        "timestamp" (int64 epoch milliseconds), the "encounters" and "sensor_types"
+        categories the codes refer to, and the float64 "extra" columns by name.
+    """
+    if rows:
+        encounter_ids, sensor_types, values, timestamps, *extras = zip(*rows)
+    else:
+        encounter_ids, sensor_types, values, timestamps = (), (), (), ()
+        extras = [()] * len(extra_columns)
+
+    encounter_codes, encounters = factorize(encounter_ids)
+    sensor_codes, sensor_type_names = factorize(sensor_types)
+
+    return {
+        "encounter": encounter_codes,
+        "sensor_type": sensor_codes,
+        "value": np.asarray(values, dtype=np.float64),
+        "timestamp": np.asarray(timestamps, dtype=np.int64),
+        "encounters": encounters,
+        "sensor_types": sensor_type_names,
+        "extra": {
+            name: np.asarray(column, dtype=np.float64)
+            for name, column in zip(extra_columns, extras)
+        },
+    }
+
+
+def group_sensor_columns(columns):
+    """
+    Groups sensor columns by encounter and sensor type and computes their statistics.
+
+    Rows are sorted once by (encounter, sensor type, timestamp); each group is then a
+    contiguous segment of the sorted arrays, so the statistics are computed with
+    `reduceat` over the segment boundaries instead of per-row Python loops.
+
+    Args:
+        columns (dict): Columns as returned by `load_sensor_columns`.
+
+    Returns:
+        dict: {encounter_id: {sensor_type: group}} where each group holds the sorted
+        "values" and "timestamps" (epoch milliseconds) arrays and the "min", "max",
+        "avg", "count", "start" and "end" (epoch milliseconds) of the segment.
+    """
+    values = columns["value"]
+    if len(values) == 0:
+        return {}
+
+    n_sensor_types = len(columns["sensor_types"])
+    keys = columns["encounter"].astype(np.int64) * n_sensor_types
+    keys += columns["sensor_type"]
+
+    order = np.lexsort((columns["timestamp"], keys))
+    keys = keys[order]
+    values = values[order]
+    timestamps = columns["timestamp"][order]
+    extras = {name: column[order] for name, column in columns["extra"].items()}
+
+    boundaries = np.flatnonzero(np.diff(keys)) + 1
+    starts = np.concatenate(([0], boundaries))
+    counts = np.diff(np.concatenate((starts, [len(keys)])))
+
+    mins = np.minimum.reduceat(values, starts)
+    maxs = np.maximum.reduceat(values, starts)
+    avgs = np.add.reduceat(values, starts) / counts
+    start_times = timestamps[starts]
+    end_times = timestamps[starts + counts - 1]
+
+    extras = {
+        name: np.split(column, boundaries) for name, column in extras.items()
+    }
+
+    grouped_results = {}
+    for i, (group_values, group_timestamps) in enumerate(
+        zip(np.split(values, boundaries), np.split(timestamps, boundaries))
+    ):
+        encounter_code, sensor_code = divmod(int(keys[starts[i]]), n_sensor_types)
+        encounter_id = columns["encounters"][encounter_code]
+        sensor_type = columns["sensor_types"][sensor_code]
+        group = {
+            "values": group_values,
+            "timestamps": group_timestamps,
+            "min": float(mins[i]),
+            "max": float(maxs[i]),
+            "avg": float(avgs[i]),
+            "count": int(counts[i]),
+            "start": int(start_times[i]),
+            "end": int(end_times[i]),
+        }
+        for name, segments in extras.items():
+            group[name] = segments[i]
+        grouped_results.setdefault(encounter_id, {})[sensor_type] = group
+    return grouped_results
+
+
+def downsample_min_max(timestamps, values, max_points):
+    """
+    Reduces a series to its min/max envelope for plotting.
+
+    The series is split into equal runs of consecutive points and only the lowest
+    and highest point of each run are kept, in their original order, along with the
+    first and last points. Unlike averaging, every peak and dip of the series stays
+    visible in the chart.
+
+    Args:
+        timestamps (np.ndarray): Timestamps of the series.
+        values (np.ndarray): Values of the series.
+        max_points (int): Maximum number of points to keep; values below 4 are
+            raised to 4.
+
+    Returns:
+        tuple: (timestamps, values) of at most `max_points` points; the arrays are
+        returned unchanged if they already fit.
+    """
+    max_points = max(max_points, 4)
+    n_points = len(values)
+    if n_points <= max_points:
+        return timestamps, values
+
+    n_buckets = (max_points - 2) // 2
+    bucket_size = -(-n_points // n_buckets)
+    n_full = n_points // bucket_size
+
+    full = values[: n_full * bucket_size].reshape(n_full, bucket_size)
+    offsets = np.arange(n_full) * bucket_size
+    indices = [
+        [0, n_points - 1],
+        offsets + full.argmin(axis=1),
+        offsets + full.argmax(axis=1),
+    ]
+    tail = values[n_full * bucket_size :]
+    if len(tail):
+        indices.append([n_full * bucket_size + tail.argmin()])
+        indices.append([n_full * bucket_size + tail.argmax()])
+
+    # np.unique also sorts the indices back into time order
+    keep = np.unique(np.concatenate(indices))
+    return timestamps[keep], values[keep]
+
+
+def epoch_ms_to_datetime(timestamp_ms):
+    """Converts epoch milliseconds to a naive local datetime."""
+    return datetime.fromtimestamp(timestamp_ms / 1000.0)
+
+
+def epoch_ms_to_datetime64(timestamps_ms):
+    """
+    Converts an array of epoch milliseconds to naive local datetime64[ms] values.
+
+    The local UTC offset is looked up once per 15-minute slot present in the array
+    (DST changes fall on those boundaries) and applied in a single vectorized step.
+
+    Args:
+        timestamps_ms (np.ndarray): Epoch milliseconds.
+
+    Returns:
+        np.ndarray: The local datetimes as datetime64[ms].
+    """
+    timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+    slots, inverse = np.unique(timestamps_ms // OFFSET_SLOT_MS, return_inverse=True)
+    offsets = np.array(
+        [_local_offset_ms(int(slot) * OFFSET_SLOT_MS) for slot in slots],
+        dtype=np.int64,
+    )
+    return (timestamps_ms + offsets[inverse]).astype("datetime64[ms]")
+
+
+def _local_offset_ms(timestamp_ms):
+    local = datetime.fromtimestamp(timestamp_ms / 1000.0)
+    utc = datetime.fromtimestamp(timestamp_ms / 1000.0, timezone.utc).replace(
+        tzinfo=None
+    )
+    return int((local - utc).total_seconds() * 1000)
+
+
+def format_sensor_summary(group):
+    """
+    Formats the statistics of a sensor group for rendering.
+
+    Args:
+        group (dict): A group as returned by `group_sensor_columns`.
+
+    Returns:
+        dict: min, max, avg, count, start/end datetimes and their string forms,
+        duration, timestamp_epoch (seconds) and day.
+    """
+    start = epoch_ms_to_datetime(group["start"])
+    end = epoch_ms_to_datetime(group["end"])
+    return {
+        "min": group["min"],
+        "max": group["max"],
+        "avg": group["avg"],
+        "count": group["count"],
+        "start": start,
+        "end": end,
+        "duration": str(end - start).split(".")[0],
+        "start_str": start.strftime("%H:%M:%S"),
+        "end_str": end.strftime("%H:%M:%S"),
+        "timestamp_epoch": int(start.timestamp()),
+        "day": start.strftime("%d-%m-%Y"),
+    }
+
+
+def format_sensor_groups(grouped_results):
+    """
+    Formats grouped sensor data into plain Python values for JSON responses.
+
+    Args:
+        grouped_results (dict): Groups as returned by `group_sensor_columns`.
+
+    Returns:
+        dict: {encounter_id: {sensor_type: data}} with the summary fields plus, when
+        the groups carry a series, the "values" list (and "min_values"/"max_values"
+        for bucketed series) and the "timestamps" list of datetimes.
+    """
+    formatted = {}
+    for encounter_id, sensor_data in grouped_results.items():
+        formatted[encounter_id] = {}
+        for sensor_type, group in sensor_data.items():
+            data = {}
+            if "values" in group:
+                data["values"] = group["values"].tolist()
+                if "min_values" in group:
+                    data["min_values"] = group["min_values"].tolist()
+                    data["max_values"] = group["max_values"].tolist()
+                data["timestamps"] = epoch_ms_to_datetime64(
+                    group["timestamps"]
+                ).tolist()
+            data.update(format_sensor_summary(group))
+            formatted[encounter_id][sensor_type] = data
+    return formatted
@@ -0,0 +1,205 @@
+"""
+Streaming export of sensor readings as CSV, Parquet or Arrow IPC.
+
+Rows are read through a server-side cursor in batches of EXPORT_BATCH_SIZE and each
+batch is encoded and sent before the next one is fetched (one Parquet row group or
+Arrow record batch per batch), so memory stays flat regardless of the export size.
+Parquet and Arrow need the optional `pyarrow` package.
+"""
+
+import csv
+import io
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from models import Device, SensorChannel
+from database import open_read_session
+from report.report_utils import (
+    filter_sensor_data_query,
+    sensor_encounter_id,
+    sensor_readings,
+    sensor_timestamp_ms,
+    sensor_type_name,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_BATCH_SIZE = 50000
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+# Aggregated readings (see retention.py) carry the number of readings they
+# represent and their min/max; raw readings have count 1 and min = max = value.
+EXPORT_COLUMNS = [
+    "encounter_id",
+    "device",
+    "sensor_type",
+    "timestamp_ms",
+    "value",
+    "count",
+    "min_value",
+    "max_value",
+]
+
+
+def export_requires_pyarrow(export_format: str) -> bool:
+    return export_format != "csv" and pa is None
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what has been written since the last take."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self) -> bytes:
+        chunk = bytes(self.buffer)
+        self.buffer.clear()
+        return chunk
+
+
+def export_schema():
+    return pa.schema(
+        [
+            ("encounter_id", pa.string()),
+            ("device", pa.string()),
+            ("sensor_type", pa.string()),
+            ("timestamp_ms", pa.int64()),
+            ("value", pa.float64()),
+            ("count", pa.int64()),
+            ("min_value", pa.float64()),
+            ("max_value", pa.float64()),
+        ]
+    )
+
+
+def iter_export_batches(
+    patient_id: str,
+    encounter_id: Optional[str] = None,
+    min_time: Optional[datetime] = None,
+    max_time: Optional[datetime] = None,
+    excluded_sensor_types: Optional[List[str]] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+):
+    """
+    Reads the readings of a patient ordered by encounter, device, sensor type and
+    time, through a server-side cursor.
+
+    Yields:
+        list: Up to `batch_size` rows with the EXPORT_COLUMNS.
+    """
+    db = open_read_session()
+    try:
+        query = db.query(
+            sensor_encounter_id,
+            Device.name.label("device"),
+            sensor_type_name.label("sensor_type"),
+            sensor_timestamp_ms.label("timestamp_ms"),
+            sensor_readings.c.value,
+            sensor_readings.c.count,
+            sensor_readings.c.min_value,
+            sensor_readings.c.max_value,
+        )
+        query = filter_sensor_data_query(
+            query, patient_id, encounter_id, min_time, max_time, excluded_sensor_types
+        )
+        query = query.join(Device, SensorChannel.device_id == Device.id).order_by(
+            sensor_encounter_id, Device.name, sensor_type_name, sensor_timestamp_ms
+        )
+
+        result = db.execute(query.statement.execution_options(yield_per=batch_size))
+        for partition in result.partitions():
+            yield partition
+    finally:
+        db.close()
+
+
+def stream_sensor_export(
+    export_format: str,
+    patient_id: str,
+    encounter_id: Optional[str] = None,
+    min_time: Optional[datetime] = None,
+    max_time: Optional[datetime] = None,
+    excluded_sensor_types: Optional[List[str]] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    Streams the readings of a patient (or one of its encounters) encoded as
+    `export_format` ("csv", "parquet" or "arrow").
+
+    Yields:
+        bytes: The next chunk of the file.
+    """
+    batches = iter_export_batches(
+        patient_id,
+        encounter_id,
+        min_time,
+        max_time,
+        excluded_sensor_types,
+        batch_size,
+    )
+
+    if export_format == "csv":
+        yield from _stream_csv(batches)
+    elif export_format in ("parquet", "arrow"):
+        yield from _stream_arrow(batches, export_format)
+    else:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+
+def _stream_csv(batches):
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield text.getvalue().encode()
+        text.seek(0)
+        text.truncate()
+    if text.tell():
+        yield text.getvalue().encode()
+
+
+def _stream_arrow(batches, export_format):
+    schema = export_schema()
+    sink = ChunkSink()
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    try:
+        for rows in batches:
+            columns = dict(zip(EXPORT_COLUMNS, zip(*rows)))
+            batch = pa.RecordBatch.from_pydict(columns, schema=schema)
+            if export_format == "parquet":
+                # One row group per batch
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            yield sink.take()
+    finally:
+        writer.close()
+    # Footer (Parquet) or end-of-stream marker (Arrow)
+    yield sink.take()
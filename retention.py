@@ -0,0 +1,290 @@
+"""
+Retention and progressive downsampling of sensor readings.
+
+Each sensor type goes through three tiers:
+    1. raw readings (sm_sensor_data), kept for `raw_days`;
+    2. 1-second aggregates (sm_sensor_aggregates), kept for `second_months`;
+    3. 1-minute aggregates, kept forever.
+
+Expired rows are moved to the next tier: every batch deletes at most
+RETENTION_BATCH_SIZE rows and inserts (or merges into) their buckets in a single
+short statement, so no lock is held for long and a reading is never counted twice.
+The statement also bumps the updated_ms watermark of the channels it touched.
+Report queries read the union of the tiers (see report_utils.sensor_readings).
+
+The policy of each sensor type is read from SENSOR_RETENTION_POLICIES, a JSON object
+keyed by sensor type name, e.g.
+    {"Inercial": {"raw_days": 2, "second_months": 1}, "Temperatura": {"raw_days": 30}}
+Sensor types without an entry (or missing keys) use SENSOR_RAW_RETENTION_DAYS and
+SENSOR_SECOND_RETENTION_MONTHS.
+
+The job is off by default, since it deletes raw readings: set RETENTION_INTERVAL_SECONDS
+to run it inside the server every that many seconds once the tiers above are
+configured, or run it from cron with:
+    python -m retention
+
+Only report queries see the aggregated tiers. GET /sensor2/data/{encounter_id} and
+the `since` cursor of GET /report/data/{patient_id} only serve raw readings, so
+they return nothing older than the raw tier once the job has run.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from database import engine
+from report.report_cache import invalidate_all
+
+load_dotenv()
+
+SECOND_MS = 1000
+MINUTE_MS = 60 * SECOND_MS
+DAY_MS = 24 * 60 * MINUTE_MS
+MONTH_DAYS = 30
+
+SENSOR_RAW_RETENTION_DAYS = float(os.getenv("SENSOR_RAW_RETENTION_DAYS", "7"))
+SENSOR_SECOND_RETENTION_MONTHS = float(
+    os.getenv("SENSOR_SECOND_RETENTION_MONTHS", "3")
+)
+SENSOR_RETENTION_POLICIES = json.loads(os.getenv("SENSOR_RETENTION_POLICIES", "{}"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "10000"))
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", "0.1"))
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "0"))
+
+# Serializes runs across workers and servers sharing the database
+RETENTION_LOCK_ID = 734001
+
+TRY_LOCK = text("SELECT pg_try_advisory_lock(:lock_id)")
+UNLOCK = text("SELECT pg_advisory_unlock(:lock_id)")
+
+SENSOR_TYPES = text("SELECT id, name FROM sm_sensor_types")
+
+ROLL_UP_READINGS = text(
+    """
+    WITH expired AS (
+        DELETE FROM sm_sensor_data
+        WHERE id IN (
+            SELECT s.id
+            FROM sm_sensor_data s
+            JOIN sm_sensor_channels c ON c.id = s.channel_id
+            WHERE c.sensor_type_id = :sensor_type_id AND s.timestamp_ms < :cutoff_ms
+            LIMIT :batch_size
+            FOR UPDATE OF s SKIP LOCKED
+        )
+        RETURNING channel_id, timestamp_ms, value
+    ),
+    touched AS (
+        UPDATE sm_sensor_channels
+        SET updated_ms = GREATEST(COALESCE(updated_ms, 0) + 1, :now_ms)
+        WHERE id IN (SELECT DISTINCT channel_id FROM expired)
+    )
+    INSERT INTO sm_sensor_aggregates (
+        channel_id, resolution_ms, bucket_ms, count, value_sum, min_value, max_value
+    )
+    SELECT
+        channel_id,
+        :resolution_ms,
+        timestamp_ms / :resolution_ms * :resolution_ms,
+        count(*),
+        sum(value),
+        min(value),
+        max(value)
+    FROM expired
+    GROUP BY 1, 3
+    ON CONFLICT (channel_id, resolution_ms, bucket_ms) DO UPDATE SET
+        count = sm_sensor_aggregates.count + EXCLUDED.count,
+        value_sum = sm_sensor_aggregates.value_sum + EXCLUDED.value_sum,
+        min_value = LEAST(sm_sensor_aggregates.min_value, EXCLUDED.min_value),
+        max_value = GREATEST(sm_sensor_aggregates.max_value, EXCLUDED.max_value)
+    """
+)
+
+ROLL_UP_AGGREGATES = text(
+    """
+    WITH expired AS (
+        DELETE FROM sm_sensor_aggregates
+        WHERE (channel_id, resolution_ms, bucket_ms) IN (
+            SELECT a.channel_id, a.resolution_ms, a.bucket_ms
+            FROM sm_sensor_aggregates a
+            JOIN sm_sensor_channels c ON c.id = a.channel_id
+            WHERE c.sensor_type_id = :sensor_type_id
+                AND a.resolution_ms = :from_resolution_ms
+                AND a.bucket_ms < :cutoff_ms
+            LIMIT :batch_size
+            FOR UPDATE OF a SKIP LOCKED
+        )
+        RETURNING channel_id, bucket_ms, count, value_sum, min_value, max_value
+    ),
+    touched AS (
+        UPDATE sm_sensor_channels
+        SET updated_ms = GREATEST(COALESCE(updated_ms, 0) + 1, :now_ms)
+        WHERE id IN (SELECT DISTINCT channel_id FROM expired)
+    )
+    INSERT INTO sm_sensor_aggregates (
+        channel_id, resolution_ms, bucket_ms, count, value_sum, min_value, max_value
+    )
+    SELECT
+        channel_id,
+        :resolution_ms,
+        bucket_ms / :resolution_ms * :resolution_ms,
+        sum(count),
+        sum(value_sum),
+        min(min_value),
+        max(max_value)
+    FROM expired
+    GROUP BY 1, 3
+    ON CONFLICT (channel_id, resolution_ms, bucket_ms) DO UPDATE SET
+        count = sm_sensor_aggregates.count + EXCLUDED.count,
+        value_sum = sm_sensor_aggregates.value_sum + EXCLUDED.value_sum,
+        min_value = LEAST(sm_sensor_aggregates.min_value, EXCLUDED.min_value),
+        max_value = GREATEST(sm_sensor_aggregates.max_value, EXCLUDED.max_value)
+    """
+)
+
+
+class RetentionPolicy(NamedTuple):
+    raw_days: float
+    second_months: float
+
+
+def get_retention_policy(sensor_type: str) -> RetentionPolicy:
+    """
+    Returns the retention policy configured for a sensor type.
+
+    Args:
+        sensor_type (str): The name of the sensor type.
+
+    Returns:
+        RetentionPolicy: How long raw readings and 1-second aggregates are kept.
+    """
+    config = SENSOR_RETENTION_POLICIES.get(sensor_type, {})
+    return RetentionPolicy(
+        raw_days=float(config.get("raw_days", SENSOR_RAW_RETENTION_DAYS)),
+        second_months=float(
+            config.get("second_months", SENSOR_SECOND_RETENTION_MONTHS)
+        ),
+    )
+
+
+def retention_cutoffs(policy: RetentionPolicy, now_ms: int):
+    """
+    Computes the epoch milliseconds before which raw readings and 1-second
+    aggregates are expired. Both are aligned to the minute, so a bucket is never
+    split between tiers.
+
+    Returns:
+        tuple: (raw cutoff, 1-second aggregates cutoff).
+    """
+    raw_cutoff = now_ms - int(policy.raw_days * DAY_MS)
+    second_cutoff = raw_cutoff - int(policy.second_months * MONTH_DAYS * DAY_MS)
+    return (
+        raw_cutoff // MINUTE_MS * MINUTE_MS,
+        second_cutoff // MINUTE_MS * MINUTE_MS,
+    )
+
+
+def run_in_batches(statement, params, batch_size, pause):
+    """
+    Executes a roll-up statement one batch per transaction until it moves no rows.
+
+    Returns:
+        int: The number of batches executed.
+    """
+    batches = 0
+    while True:
+        with engine.begin() as connection:
+            result = connection.execute(
+                statement, {**params, "batch_size": batch_size}
+            )
+        if result.rowcount == 0:
+            return batches
+        batches += 1
+        if pause:
+            time.sleep(pause)
+
+
+def enforce_retention(
+    batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_BATCH_PAUSE
+):
+    """
+    Moves expired raw readings to 1-second aggregates and expired 1-second
+    aggregates to 1-minute aggregates, for every sensor type.
+
+    Only one run at a time holds the advisory lock; concurrent calls return
+    immediately.
+
+    Returns:
+        bool: False if another run was already in progress.
+    """
+    with engine.connect() as lock_connection:
+        if not lock_connection.execute(
+            TRY_LOCK, {"lock_id": RETENTION_LOCK_ID}
+        ).scalar():
+            return False
+        try:
+            sensor_types = lock_connection.execute(SENSOR_TYPES).all()
+            lock_connection.commit()
+
+            now_ms = int(time.time() * 1000)
+            for sensor_type_id, sensor_type in sensor_types:
+                policy = get_retention_policy(sensor_type)
+                raw_cutoff, second_cutoff = retention_cutoffs(policy, now_ms)
+
+                raw_batches = run_in_batches(
+                    ROLL_UP_READINGS,
+                    {
+                        "sensor_type_id": sensor_type_id,
+                        "now_ms": now_ms,
+                        "cutoff_ms": raw_cutoff,
+                        "resolution_ms": SECOND_MS,
+                    },
+                    batch_size,
+                    pause,
+                )
+                second_batches = run_in_batches(
+                    ROLL_UP_AGGREGATES,
+                    {
+                        "sensor_type_id": sensor_type_id,
+                        "now_ms": now_ms,
+                        "cutoff_ms": second_cutoff,
+                        "from_resolution_ms": SECOND_MS,
+                        "resolution_ms": MINUTE_MS,
+                    },
+                    batch_size,
+                    pause,
+                )
+                if raw_batches or second_batches:
+                    # Medians and deviations are now computed over bucket averages
+                    invalidate_all()
+                    print(
+                        f"Retention {sensor_type}: {raw_batches} raw and "
+                        f"{second_batches} 1-second batches rolled up"
+                    )
+        finally:
+            lock_connection.execute(UNLOCK, {"lock_id": RETENTION_LOCK_ID})
+            lock_connection.commit()
+    return True
+
+
+async def run_retention_scheduler(interval: float = RETENTION_INTERVAL_SECONDS):
+    """
+    Runs `enforce_retention` every `interval` seconds in a worker thread until
+    cancelled.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(enforce_retention)
+        except Exception as e:
+            print(f"Error enforcing sensor data retention: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    engine.echo = False
+    if not enforce_retention():
+        print("Another retention run is in progress")
@@ -1,11 +1,14 @@
 import asyncio
 from datetime import datetime, timezone
 import time
-from typing import Annotated, Dict, List
+from typing import Annotated, Dict, List, Optional
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Query,
+    Request,
+    Response,
     WebSocket,
     WebSocketDisconnect,
     WebSocketException,
@@ -24,6 +27,20 @@ from sqlmodel import Session
 
 from auth import decode_token
 from models import SensorData
+from sensor_channels import (
+    get_sensor_watermark,
+    intern_channel_async,
+    mark_channels_updated,
+)
+from http_cache import etag_matches, make_etag, not_modified
+from sensor_cursor import (
+    CURSOR_HEADER,
+    decode_cursor,
+    get_commit_horizon,
+    get_sensor_cursor,
+    page_after_cursor,
+)
+from report.report_cache import invalidate_patient
 from collections import defaultdict
 from pydantic import BaseModel, ValidationError
 
@@ -162,6 +179,10 @@ async def arduino_websocket(
 
     print(f"Arduino connected: {websocket.client.host}")
     last_sent_time = time.time()
+    ingested_patients = set()
+    ingested_channels = set()
+    # Channel ids of this connection, interned on their first reading
+    channel_ids = {}
 
     async def send_keep_alive():
         while True:
@@ -184,6 +205,9 @@ async def arduino_websocket(
 
             try:
                 sensor_data = SensorData.model_validate_json(data)
+                await intern_channel_async(sensor_data, channel_ids)
+                ingested_patients.add(sensor_data.patient_id)
+                ingested_channels.add(sensor_data.channel_id)
                 # sensor_data.encounter_id = encounter_id
                 print(f"Received JSON data from Arduino: {sensor_data}")
                 # Add SensorData to the list for its device and sensor type
@@ -215,6 +239,10 @@ async def arduino_websocket(
     finally:
         keep_alive_task.cancel()
         db.commit()
+        await asyncio.to_thread(mark_channels_updated, ingested_channels)
+        # Cached reports of these patients no longer include every reading
+        for ingested_patient_id in ingested_patients:
+            await asyncio.to_thread(invalidate_patient, ingested_patient_id)
         arduino_clients.remove(websocket)
         patients_to_monitor.remove(patient_id)
         print(f"Arduino disconnected: {websocket.client.host}")
@@ -350,7 +378,48 @@ async def share_sensor(payload: isAuthorized_dependency):
 
 
 @router.get("/data/{encounter_id}")
-async def get_sensor_data(encounter_id: str, db: db_dependency):
+async def get_sensor_data(
+    encounter_id: str,
+    db: db_dependency,
+    request: Request,
+    response: Response,
+    since: Optional[str] = Query(
+        None,
+        description=f"Cursor from a previous response (next_cursor or the {CURSOR_HEADER} header); only readings stored after it are returned",
+    ),
+    limit: int = Query(
+        5000, ge=1, le=50000, description="Maximum readings per page when using since"
+    ),
+):
+    """
+    Raw readings of an encounter, all at once or paged from a `since` cursor.
+
+    Only raw readings are served here. Once the retention job (see retention.py)
+    has rolled readings older than the raw tier up into aggregates, they are left
+    out; GET /report/data/{patient_id} reads every tier.
+    """
+    etag = make_etag(request, get_sensor_watermark(db, encounter_id=encounter_id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
+    if since is not None:
+        after = decode_cursor(since)
+        horizon = get_commit_horizon(db)
+        # Range scan on the (xact_id, id) index from the cursor
+        sensor_data, next_cursor, has_more = page_after_cursor(
+            db.query(SensorData).filter(SensorData.encounter_id == encounter_id),
+            after,
+            horizon,
+            limit,
+        )
+        return {
+            "readings": sensor_data,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        }
+
+    response.headers[CURSOR_HEADER] = get_sensor_cursor(db)
     sensor_data = (
         db.query(SensorData).filter(SensorData.encounter_id == encounter_id).all()
     )
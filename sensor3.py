@@ -22,6 +22,8 @@ from sqlmodel import Session
 
 from auth import decode_token
 from models import SensorData
+from sensor_channels import intern_channel_async, mark_channels_updated
+from report.report_cache import invalidate_patient
 from collections import defaultdict
 from pydantic import ValidationError
 from database import get_session
@@ -98,6 +100,10 @@ async def arduino_websocket(websocket: WebSocket, token: str, db: db_dependency)
     arduino_clients.add(websocket)
     print(f"Arduino connected: {websocket.client.host}")
     last_sent_time = time.time()
+    ingested_patients = set()
+    ingested_channels = set()
+    # Channel ids of this connection, interned on their first reading
+    channel_ids = {}
 
     try:
         while True:
@@ -105,6 +111,9 @@ async def arduino_websocket(websocket: WebSocket, token: str, db: db_dependency)
 
             try:
                 sensor_data = SensorData.model_validate_json(data)
+                await intern_channel_async(sensor_data, channel_ids)
+                ingested_patients.add(sensor_data.patient_id)
+                ingested_channels.add(sensor_data.channel_id)
                 print(f"Received JSON data from Arduino: {sensor_data}")
                 # Add SensorData to the list for its device and sensor type
                 data_buffer[(sensor_data.device, sensor_data.sensor_type)].append(
@@ -135,6 +144,10 @@ async def arduino_websocket(websocket: WebSocket, token: str, db: db_dependency)
         pass
     finally:
         db.commit()
+        await asyncio.to_thread(mark_channels_updated, ingested_channels)
+        # Cached reports of these patients no longer include every reading
+        for ingested_patient_id in ingested_patients:
+            await asyncio.to_thread(invalidate_patient, ingested_patient_id)
         arduino_clients.remove(websocket)
         print(f"Arduino disconnected: {websocket.client.host}")
 
@@ -0,0 +1,141 @@
+import asyncio
+import time
+from functools import lru_cache
+
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from database import engine
+from models import Device, SensorChannel, SensorData, SensorTypeEntry
+
+# Interned ids are immutable once created, so they are cached for the lifetime of
+# the worker. Lookups run in their own short transaction: the ingest session is
+# only committed when the device disconnects, and a lookup row held uncommitted
+# there would block every other connection interning the same name.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def get_or_create_id(model, **values) -> int:
+    """
+    Returns the id of the `model` row matching `values`, inserting it if needed.
+
+    A concurrent insert of the same row makes ours fail on the unique constraint,
+    in which case the row created by the other worker is read back.
+    """
+    with SessionLocal() as session:
+        query = session.query(model.id).filter_by(**values)
+        row_id = query.scalar()
+        if row_id is not None:
+            return row_id
+
+        row = model(**values)
+        session.add(row)
+        try:
+            session.commit()
+            return row.id
+        except IntegrityError:
+            session.rollback()
+            row_id = query.scalar()
+            if row_id is None:
+                raise
+            return row_id
+
+
+@lru_cache(maxsize=256)
+def intern_device(name: str) -> int:
+    return get_or_create_id(Device, name=name)
+
+
+@lru_cache(maxsize=256)
+def intern_sensor_type(name: str) -> int:
+    return get_or_create_id(SensorTypeEntry, name=name)
+
+
+@lru_cache(maxsize=8192)
+def intern_channel_key(
+    device: str, sensor_type: str, patient_id: str, encounter_id: str
+) -> int:
+    return get_or_create_id(
+        SensorChannel,
+        device_id=intern_device(device),
+        sensor_type_id=intern_sensor_type(sensor_type),
+        patient_id=patient_id,
+        encounter_id=encounter_id,
+    )
+
+
+def intern_channel(sensor_data: SensorData) -> int:
+    """
+    Sets and returns the channel_id of a reading from its device, sensor type,
+    patient and encounter. Only the first reading of a channel hits the database.
+    """
+    sensor_data.channel_id = intern_channel_key(
+        sensor_data.device,
+        sensor_data.sensor_type,
+        sensor_data.patient_id,
+        sensor_data.encounter_id,
+    )
+    return sensor_data.channel_id
+
+
+async def intern_channel_async(sensor_data: SensorData, channel_ids: dict) -> int:
+    """
+    `intern_channel` for async handlers. `channel_ids` caches the channels already
+    seen by the caller (e.g. one device connection); the first reading of each
+    other channel is interned in a worker thread, so its lookup transaction never
+    blocks the event loop.
+    """
+    key = (
+        sensor_data.device,
+        sensor_data.sensor_type,
+        sensor_data.patient_id,
+        sensor_data.encounter_id,
+    )
+    channel_id = channel_ids.get(key)
+    if channel_id is None:
+        channel_id = await asyncio.to_thread(intern_channel_key, *key)
+        channel_ids[key] = channel_id
+    sensor_data.channel_id = channel_id
+    return channel_id
+
+
+def mark_channels_updated(channel_ids):
+    """
+    Records that readings of the given channels were written, changing the
+    watermark returned by `get_sensor_watermark`. Call it after the readings are
+    committed.
+    """
+    if not channel_ids:
+        return
+    now_ms = int(time.time() * 1000)
+    # Strictly increasing, so a watermark never goes back to a value already served
+    updated_ms = case(
+        (SensorChannel.updated_ms >= now_ms, SensorChannel.updated_ms + 1),
+        else_=now_ms,
+    )
+    try:
+        with SessionLocal() as session:
+            session.query(SensorChannel).filter(
+                SensorChannel.id.in_(channel_ids)
+            ).update({SensorChannel.updated_ms: updated_ms}, synchronize_session=False)
+            session.commit()
+    except Exception as e:
+        print(f"Error updating sensor channel watermarks: {e}")
+
+
+def get_sensor_watermark(db, patient_id=None, encounter_id=None):
+    """
+    Returns a value that changes whenever readings of a patient (or encounter) are
+    ingested or downsampled. Only the channel rows of the patient are read, through
+    the patient_id/encounter_id indexes, so it is much cheaper than the data query.
+
+    Returns:
+        tuple: (number of channels, last update in epoch milliseconds).
+    """
+    query = db.query(func.count(SensorChannel.id), func.max(SensorChannel.updated_ms))
+    if patient_id:
+        query = query.filter(SensorChannel.patient_id == patient_id)
+    if encounter_id:
+        query = query.filter(SensorChannel.encounter_id == encounter_id)
+    return tuple(query.one())
@@ -0,0 +1,99 @@
+import base64
+
+from fastapi import HTTPException
+from sqlalchemy import text, tuple_
+
+from models import SensorData
+
+# Header carrying the cursor of a full response, to start polling from it
+CURSOR_HEADER = "X-Sensor-Cursor"
+
+CURSOR_VERSION = "v2"
+
+# Oldest transaction still in progress: every transaction below it has committed
+# or rolled back, so no reading with a lower xact_id can still appear
+COMMIT_HORIZON = text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+
+
+def encode_cursor(xact_id: int, last_id: int) -> str:
+    """
+    Encodes the position of the last reading a client has seen as an opaque cursor.
+
+    Readings are ordered by (xact_id, id) rather than by id or timestamp: ingest
+    commits a whole device session at once and ids are handed out at flush time,
+    so a session can commit readings with lower ids than readings already served.
+    Only readings of transactions older than the commit horizon are served, so
+    nothing can become visible behind a cursor.
+    """
+    token = f"{CURSOR_VERSION}:{xact_id}:{last_id}".encode()
+    return base64.urlsafe_b64encode(token).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Decodes a cursor produced by `encode_cursor`.
+
+    Returns:
+        tuple: (xact_id, id) of the last reading seen.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed or from an older version.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        version, xact_id, last_id = base64.urlsafe_b64decode(padded).decode().split(":")
+        if version != CURSOR_VERSION:
+            raise ValueError(version)
+        return int(xact_id), int(last_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def get_commit_horizon(db) -> int:
+    return db.execute(COMMIT_HORIZON).scalar()
+
+
+def get_sensor_cursor(db) -> str:
+    """
+    Returns the cursor of a full response, at the commit horizon. Read it before
+    querying the data: readings committed in between may then be served again by
+    the next poll (clients drop them by id), but none is skipped.
+    """
+    return encode_cursor(get_commit_horizon(db), 0)
+
+
+def page_after_cursor(query, after: tuple, horizon: int, limit: int):
+    """
+    Reads the next page of readings after a cursor.
+
+    Args:
+        query: A query selecting SensorData.id and SensorData.xact_id, already
+            filtered by patient, encounter, etc.
+        after (tuple): (xact_id, id) decoded from the client's cursor.
+        horizon (int): Commit horizon from `get_commit_horizon`, read before the
+            query.
+        limit (int): Maximum number of readings returned.
+
+    Returns:
+        tuple: (records, cursor to poll from next, whether more readings remain).
+    """
+    records = (
+        query.filter(
+            SensorData.xact_id < horizon,
+            tuple_(SensorData.xact_id, SensorData.id) > after,
+        )
+        .order_by(SensorData.xact_id, SensorData.id)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(records) > limit
+    records = records[:limit]
+    if has_more:
+        cursor = encode_cursor(records[-1].xact_id, records[-1].id)
+    elif horizon > after[0]:
+        # Every reading below the horizon was served: skip ahead to it
+        cursor = encode_cursor(horizon, 0)
+    else:
+        # The horizon of a lagging replica can be behind the cursor
+        cursor = encode_cursor(*after)
+    return records, cursor, has_more
@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
@@ -14,6 +16,11 @@ from auth import router as auth_router, isAuthorized
 from file_manager import router as file_router
 from report.routes import router as reporte_router
 from gameData import router as gameData_router
+from report.render_pool import shutdown_render_pool
+from report.report_jobs import cancel_jobs
+from report.report_utils import load_templates
+from retention import RETENTION_INTERVAL_SECONDS, run_retention_scheduler
+from utils import close_fhir_client, open_fhir_client
 
 import os
 from dotenv import load_dotenv
@@ -24,7 +31,24 @@ load_dotenv()
 # Get allowed origins from .env and split them into a list
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "").split(",")
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load_templates()
+    open_fhir_client()
+    # Background job that downsamples expired sensor readings (see retention.py)
+    retention_task = None
+    if RETENTION_INTERVAL_SECONDS > 0:
+        retention_task = asyncio.create_task(run_retention_scheduler())
+    yield
+    if retention_task:
+        retention_task.cancel()
+    cancel_jobs()
+    shutdown_render_pool()
+    await close_fhir_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -32,8 +56,17 @@ app.add_middleware(
     allow_origins=["*"],  # Dynamically load allowed origins
     allow_credentials=True,  # Only if credentials are required
     allow_methods=["GET", "POST", "PUT", "DELETE"],  # Restrict to necessary methods
-    allow_headers=["Authorization", "Content-Type"],  # Restrict to necessary headers
-    expose_headers=["Content-Disposition"],  # Keep if needed for file downloads
+    allow_headers=[
+        "Authorization",
+        "Content-Type",
+        "If-None-Match",
+    ],  # Restrict to necessary headers
+    expose_headers=[
+        "Content-Disposition",  # Keep if needed for file downloads
+        "ETag",
+        "X-Sensor-Cursor",
+        "X-Report-Missing-Sections",
+    ],
 )
 
 app.include_router(auth_router)
@@ -1,5 +1,11 @@
+import asyncio
 import os
-from typing import Annotated
+import random
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Annotated, AsyncIterator
+from urllib.parse import urlsplit
 import httpx
 from fastapi import Depends, HTTPException
 from sqlalchemy import func
@@ -10,9 +16,156 @@ from models import User
 
 
 HAPI_FHIR_URL = os.getenv("HAPI_FHIR_URL")
+# Maximum number of reads packed into one batch Bundle
+FHIR_BATCH_SIZE = int(os.getenv("FHIR_BATCH_SIZE", "50"))
+
+# Connection pool of the client shared by every FHIR call (see get_fhir_client)
+FHIR_MAX_CONNECTIONS = int(os.getenv("FHIR_MAX_CONNECTIONS", "50"))
+FHIR_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("FHIR_MAX_KEEPALIVE_CONNECTIONS", "20"))
+FHIR_KEEPALIVE_EXPIRY = float(os.getenv("FHIR_KEEPALIVE_EXPIRY", "30"))
+FHIR_HTTP2 = os.getenv("FHIR_HTTP2", "true").lower() == "true"
+
+# Reads are retried on connection errors and 502/503/504, with jittered
+# exponential backoff; writes are never retried
+FHIR_READ_RETRIES = int(os.getenv("FHIR_READ_RETRIES", "2"))
+FHIR_RETRY_BACKOFF = float(os.getenv("FHIR_RETRY_BACKOFF", "0.2"))
+RETRY_STATUS_CODES = {502, 503, 504}
+
+FHIR_CONNECT_TIMEOUT = 5.0
+FHIR_TIMEOUTS = {
+    "read": httpx.Timeout(10.0, connect=FHIR_CONNECT_TIMEOUT),
+    "search": httpx.Timeout(30.0, connect=FHIR_CONNECT_TIMEOUT),
+    "batch": httpx.Timeout(30.0, connect=FHIR_CONNECT_TIMEOUT),
+    "write": httpx.Timeout(20.0, connect=FHIR_CONNECT_TIMEOUT),
+}
+
+# Definitional resources change almost never, so they are kept in an LRU cache of
+# FHIR_DEFINITION_CACHE_SIZE entries. Every use still revalidates the entry with
+# the server (If-None-Match / If-Modified-Since) using the caller's token, so the
+# server keeps enforcing authorization; a 304 only saves the transfer and parsing.
+# Patient-scoped resources are never cached.
+DEFINITION_RESOURCE_TYPES = {"Questionnaire", "ValueSet", "CodeSystem"}
+FHIR_DEFINITION_CACHE_SIZE = int(os.getenv("FHIR_DEFINITION_CACHE_SIZE", "256"))
 
 db_dependency = Annotated[Session, Depends(get_session)]
 
+_fhir_client = None
+_definition_cache = OrderedDict()
+
+
+def _create_fhir_client() -> httpx.AsyncClient:
+    http2 = FHIR_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("FHIR_HTTP2 is enabled but the 'h2' package is not installed")
+            http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=FHIR_TIMEOUTS["read"],
+        limits=httpx.Limits(
+            max_connections=FHIR_MAX_CONNECTIONS,
+            max_keepalive_connections=FHIR_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=FHIR_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_fhir_client() -> httpx.AsyncClient:
+    """
+    Returns the HTTP client shared by every FHIR call, so connections (and their
+    TLS sessions) are kept alive and reused between requests. It is opened by the
+    application lifespan, or on first use outside of it.
+    """
+    global _fhir_client
+    if _fhir_client is None or _fhir_client.is_closed:
+        _fhir_client = _create_fhir_client()
+    return _fhir_client
+
+
+def open_fhir_client():
+    get_fhir_client()
+
+
+async def close_fhir_client():
+    global _fhir_client
+    client, _fhir_client = _fhir_client, None
+    if client is not None:
+        await client.aclose()
+
+
+def _get_cached_definition(resource_type: str, resource_id: str):
+    """
+    Returns the cached entry of a definitional resource, a dict with the
+    `resource`, its `etag` and `last_updated`, or None. Cached resources are
+    shared between callers and must not be mutated.
+    """
+    if resource_type not in DEFINITION_RESOURCE_TYPES:
+        return None
+    key = (resource_type, resource_id)
+    entry = _definition_cache.get(key)
+    if entry is not None:
+        _definition_cache.move_to_end(key)
+    return entry
+
+
+def _store_definition(resource_type: str, resource_id: str, resource: dict, etag):
+    if resource_type not in DEFINITION_RESOURCE_TYPES:
+        return
+    last_updated = resource.get("meta", {}).get("lastUpdated")
+    if not etag and not last_updated:
+        # Nothing to revalidate with
+        return
+    key = (resource_type, resource_id)
+    _definition_cache[key] = {
+        "resource": resource,
+        "etag": etag,
+        "last_updated": last_updated,
+    }
+    _definition_cache.move_to_end(key)
+    while len(_definition_cache) > FHIR_DEFINITION_CACHE_SIZE:
+        _definition_cache.popitem(last=False)
+
+
+def _revalidation_headers(entry: dict) -> dict:
+    if entry["etag"]:
+        return {"If-None-Match": entry["etag"]}
+    last_updated = datetime.fromisoformat(entry["last_updated"].replace("Z", "+00:00"))
+    return {
+        "If-Modified-Since": format_datetime(
+            last_updated.astimezone(timezone.utc), usegmt=True
+        )
+    }
+
+
+async def _send_read(method: str, url: str, operation: str = "read", **kwargs):
+    """
+    Sends an idempotent FHIR request through the shared client, retrying
+    connection errors and 502/503/504 responses up to FHIR_READ_RETRIES times.
+    """
+    client = get_fhir_client()
+    for attempt in range(FHIR_READ_RETRIES + 1):
+        try:
+            response = await client.request(
+                method, url, timeout=FHIR_TIMEOUTS[operation], **kwargs
+            )
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            if attempt == FHIR_READ_RETRIES:
+                return response
+            reason = f"status {response.status_code}"
+        except httpx.TransportError as e:
+            if attempt == FHIR_READ_RETRIES:
+                raise
+            reason = repr(e)
+
+        # Full jitter, so concurrent report fetches do not retry in lockstep
+        delay = random.uniform(0, FHIR_RETRY_BACKOFF * 2**attempt)
+        print(f"Retrying {method} {url} in {delay:.2f}s ({reason})")
+        await asyncio.sleep(delay)
+
 
 async def fetch_resource(resource_type: str, resource_id: str, token: str) -> dict:
     """
@@ -35,10 +188,16 @@ async def fetch_resource(resource_type: str, resource_id: str, token: str) -> di
     url = f"{HAPI_FHIR_URL}/{resource_type}/{resource_id}"
     headers = {"Authorization": f"Bearer {token}"}
 
+    cached = _get_cached_definition(resource_type, resource_id)
+    if cached:
+        headers.update(_revalidation_headers(cached))
+
     print(f"Fetching {url}")
 
-    async with httpx.AsyncClient(timeout=50.0) as client:
-        response = await client.get(url, headers=headers)
+    response = await _send_read("GET", url, headers=headers)
+
+    if cached and response.status_code == 304:
+        return cached["resource"]
 
     if response.status_code != 200:
         response_data = response.json()
@@ -48,27 +207,31 @@ async def fetch_resource(resource_type: str, resource_id: str, token: str) -> di
         )
         raise HTTPException(status_code=response.status_code, detail=diagnostic_message)
 
-    return response.json()
+    resource = response.json()
+    _store_definition(resource_type, resource_id, resource, response.headers.get("ETag"))
+    return resource
 
 
-async def fetch_resources(
+async def iter_resources(
     resource_type: str,
     params: dict,
     token: str,
-) -> dict:
+) -> AsyncIterator[dict]:
     """
-    Fetch a resource from the HAPI FHIR server.
+    Iterate over every resource matching a search on the HAPI FHIR server,
+    following the `next` links of the result Bundles. The next page is requested
+    while the resources of the current one are being consumed.
 
     Args:
-        resource_type (str): The type of the resource (e.g., "Patient").
-        resource_id (str): The ID of the resource.
+        resource_type (str): The type of the resources (e.g., "Condition").
+        params (dict): Search parameters.
         token (str): Authorization token.
 
-    Returns:
-        dict: The fetched resource.
+    Yields:
+        dict: The next resource.
 
     Raises:
-        HTTPException: If the resource cannot be fetched.
+        HTTPException: If a page cannot be fetched.
     """
     if not HAPI_FHIR_URL:
         raise HTTPException(status_code=500, detail="HAPI_FHIR_URL is not configured")
@@ -76,10 +239,60 @@ async def fetch_resources(
     url = f"{HAPI_FHIR_URL}/{resource_type}"
     headers = {"Authorization": f"Bearer {token}"}
 
-    print(f"Fetching {url} with params: {params}")
+    print(f"Searching {url} with params: {params}")
+
+    next_page = asyncio.create_task(_fetch_search_page(url, headers, params))
+    try:
+        while next_page is not None:
+            bundle = await next_page
+            next_url = next(
+                (
+                    link.get("url")
+                    for link in bundle.get("link", [])
+                    if link.get("relation") == "next"
+                ),
+                None,
+            )
+            next_page = (
+                asyncio.create_task(
+                    _fetch_search_page(_local_page_url(next_url), headers)
+                )
+                if next_url
+                else None
+            )
+            for entry in bundle.get("entry", []):
+                yield entry["resource"]
+    finally:
+        # The consumer stopped early or a page failed: drop the prefetch
+        if next_page is not None:
+            next_page.cancel()
+            try:
+                await next_page
+            except asyncio.CancelledError:
+                # Only re-raise when this task itself is being cancelled
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception:
+                pass
+
+
+def _local_page_url(next_url: str) -> str:
+    """
+    Returns the URL to request the page of a `next` link on HAPI_FHIR_URL. Behind a
+    proxy, or with a different advertised base, the server builds its links on
+    another host; the token must not be sent there, so only the query string of
+    such a link (HAPI's `_getpages` paging parameters) is kept.
+    """
+    base = HAPI_FHIR_URL.rstrip("/")
+    if next_url == base or next_url.startswith((base + "/", base + "?")):
+        return next_url
+    query = urlsplit(next_url).query
+    print(f"Next link {next_url} is not on {base}, requesting the page from {base}")
+    return f"{base}?{query}"
+
 
-    async with httpx.AsyncClient(timeout=50.0, params=params) as client:
-        response = await client.get(url, headers=headers)
+async def _fetch_search_page(url: str, headers: dict, params=None) -> dict:
+    response = await _send_read("GET", url, "search", headers=headers, params=params)
 
     if response.status_code != 200:
         response_data = response.json()
@@ -92,6 +305,132 @@ async def fetch_resources(
     return response.json()
 
 
+async def fetch_all_resources(resource_type: str, params: dict, token: str) -> list:
+    """
+    Fetch every resource matching a search, across all the pages of the result.
+
+    Returns:
+        list: The matching resources.
+    """
+    return [
+        resource async for resource in iter_resources(resource_type, params, token)
+    ]
+
+
+async def fetch_resources_batch(references: list, token: str) -> dict:
+    """
+    Fetch many resources from the HAPI FHIR server with `batch` Bundles, packing up
+    to FHIR_BATCH_SIZE reads in each POST instead of sending one GET per resource.
+
+    Args:
+        references (list): (resource_type, resource_id) pairs to read.
+        token (str): Authorization token.
+
+    Returns:
+        dict: {(resource_type, resource_id): (status, resource)}, with the HTTP
+            status of each read and None as the resource of the reads that failed
+            (see `batch_resource`).
+
+    Raises:
+        HTTPException: If the batch itself cannot be processed.
+    """
+    if not HAPI_FHIR_URL:
+        raise HTTPException(status_code=500, detail="HAPI_FHIR_URL is not configured")
+
+    references = list(dict.fromkeys(references))
+    chunks = [
+        references[i : i + FHIR_BATCH_SIZE]
+        for i in range(0, len(references), FHIR_BATCH_SIZE)
+    ]
+    results = await asyncio.gather(*(_fetch_batch(chunk, token) for chunk in chunks))
+
+    resources = {}
+    for result in results:
+        resources.update(result)
+    return resources
+
+
+async def _fetch_batch(references: list, token: str) -> dict:
+    cached = {}
+    bundle_entries = []
+    for resource_type, resource_id in references:
+        request = {"method": "GET", "url": f"{resource_type}/{resource_id}"}
+        entry = _get_cached_definition(resource_type, resource_id)
+        if entry:
+            cached[(resource_type, resource_id)] = entry
+            if entry["etag"]:
+                request["ifNoneMatch"] = entry["etag"]
+            else:
+                request["ifModifiedSince"] = entry["last_updated"]
+        bundle_entries.append({"request": request})
+
+    bundle = {"resourceType": "Bundle", "type": "batch", "entry": bundle_entries}
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/fhir+json",
+    }
+
+    print(f"Fetching {len(references)} resources in a batch from {HAPI_FHIR_URL}")
+
+    try:
+        # A batch of reads is idempotent, so it is retried like a read
+        response = await _send_read(
+            "POST", HAPI_FHIR_URL, "batch", headers=headers, json=bundle
+        )
+    except httpx.RequestError as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error communicating with FHIR server: {str(e)}"
+        )
+
+    if response.status_code != 200:
+        response_data = response.json()
+        diagnostic_message = "Failed to process batch\n"
+        diagnostic_message += response_data.get("issue", [{}])[0].get(
+            "diagnostics", "Unknown error"
+        )
+        raise HTTPException(status_code=response.status_code, detail=diagnostic_message)
+
+    # The entries of a batch-response are in the same order as the request
+    entries = response.json().get("entry", [])
+    resources = {}
+    for reference, entry in zip(references, entries):
+        status = entry.get("response", {}).get("status", "")
+        if status.startswith("304") and reference in cached:
+            resources[reference] = (200, cached[reference]["resource"])
+        elif status.startswith("200"):
+            resource = entry.get("resource")
+            resources[reference] = (200, resource) if resource else (502, None)
+            if resource:
+                _store_definition(*reference, resource, entry["response"].get("etag"))
+        else:
+            print(f"Failed to fetch {reference[0]}/{reference[1]} in batch: {status}")
+            code = status.split(" ", 1)[0]
+            resources[reference] = (int(code) if code.isdigit() else 502, None)
+    for reference in references[len(entries) :]:
+        # The server answered fewer entries than were requested
+        resources[reference] = (502, None)
+    return resources
+
+
+def batch_resource(resources: dict, resource_type: str, resource_id: str) -> dict:
+    """
+    Returns a resource read by `fetch_resources_batch`.
+
+    Raises:
+        HTTPException: With the status of the read if it failed, e.g. 404 if the
+            resource does not exist or 403 if the token may not read it.
+    """
+    status, resource = resources[(resource_type, resource_id)]
+    if resource is None:
+        if status in (404, 410):
+            raise HTTPException(status_code=status, detail=f"{resource_type} not found")
+        raise HTTPException(
+            status_code=status,
+            detail=f"Failed to fetch {resource_type}/{resource_id}",
+        )
+    return resource
+
+
 async def create_resource(resource_type: str, resource_data: dict, token: str) -> dict:
     """
     Create a new resource on the HAPI FHIR server.
@@ -119,8 +458,9 @@ async def create_resource(resource_type: str, resource_data: dict, token: str) -
     print(f"Creating {resource_type} at {url}")
 
     try:
-        async with httpx.AsyncClient(timeout=50.0) as client:
-            response = await client.post(url, headers=headers, json=resource_data)
+        response = await get_fhir_client().post(
+            url, headers=headers, json=resource_data, timeout=FHIR_TIMEOUTS["write"]
+        )
 
         if response.status_code not in [200, 201]:
             response_data = response.json()
@@ -169,8 +509,9 @@ async def update_resource(
     print(f"Updating {resource_type}/{resource_id} at {url}")
 
     try:
-        async with httpx.AsyncClient(timeout=50.0) as client:
-            response = await client.put(url, headers=headers, json=resource_data)
+        response = await get_fhir_client().put(
+            url, headers=headers, json=resource_data, timeout=FHIR_TIMEOUTS["write"]
+        )
 
         if response.status_code not in [200, 201]:
             response_data = response.json()
@@ -213,8 +554,9 @@ async def delete_resource(resource_type: str, resource_id: str, token: str) -> d
     print(f"Deleting {resource_type}/{resource_id}")
 
     try:
-        async with httpx.AsyncClient(timeout=50.0) as client:
-            response = await client.delete(url, headers=headers)
+        response = await get_fhir_client().delete(
+            url, headers=headers, timeout=FHIR_TIMEOUTS["write"]
+        )
 
         if response.status_code not in [200, 204]:
             response_data = response.json()